@@ -0,0 +1,231 @@
+#!/usr/bin/env python
+
+"""
+Benchmarks for RO SRS client performance, using a local stand-in server
+
+Usage:
+    python Benchmarks.py [name ...]
+
+With no names, all benchmarks are run.
+"""
+
+import sys
+import re
+import time
+import json
+import urllib
+import urlparse
+import httplib
+import logging
+import multiprocessing
+import rdflib, rdflib.graph
+
+from ro_namespaces import DCTERMS
+from ROSRS_Session import ROSRS_Session, splitValues, parseLinks, parseLinkHeaders
+from SparqlHttpClient import SparqlHttpClient
+from StandInServer import StandInServer, StandInSparqlHandler
+
+# Logging object
+log = logging.getLogger(__name__)
+
+def timeCall(func, *args, **kwargs):
+    """
+    Call function with supplied arguments, and return (elapsed time, result)
+    """
+    start  = time.time()
+    result = func(*args, **kwargs)
+    return (time.time()-start, result)
+
+def runServer(conn, kwargs):
+    server = StandInServer(**kwargs)
+    conn.send(server.start())
+    conn.recv()                 # Wait for stop
+    server.stop()
+    return
+
+class ServerProcess(object):
+    """
+    Run a stand-in server in a separate process, so that server processing
+    does not compete with the client for the Python interpreter lock.
+    """
+
+    def __init__(self, **kwargs):
+        (self._conn, childconn) = multiprocessing.Pipe()
+        self._process = multiprocessing.Process(target=runServer, args=(childconn, kwargs))
+        return
+
+    def start(self):
+        self._process.start()
+        return self._conn.recv()
+
+    def stop(self):
+        self._conn.send("stop")
+        self._process.join()
+        return
+
+def benchmarkAggregateResources(itemcount=200, latency=0.02):
+    """
+    Aggregate resources into an RO using varying numbers of concurrent requests,
+    with a simulated network latency for each request.
+    """
+    print "aggregateResources: %d items, %.1fms simulated latency"%(itemcount, latency*1000)
+    server = ServerProcess(latency=latency)
+    srsuri = server.start()
+    try:
+        basetime = None
+        for concurrency in [1, 2, 4, 8, 16]:
+            rosrs = ROSRS_Session(srsuri, accesskey="benchmark", maxconnections=concurrency)
+            (status, reason, rouri, manifest) = rosrs.createRO("BenchRO%d"%concurrency,
+                "Benchmark RO", "Benchmarks.py", "2012-09-06")
+            items = [ ("data/%04d.txt"%i, "text/plain", "Resource %d\n"%i)
+                      for i in range(itemcount) ]
+            (elapsed, results) = timeCall(rosrs.aggregateResources, rouri, items,
+                concurrency=concurrency)
+            assert all([ r["status"] == 201 for r in results ])
+            basetime = basetime or elapsed
+            print "  concurrency %2d: %6.2fs, %7.1f items/s, speedup %5.2f"%(
+                concurrency, elapsed, itemcount/elapsed, basetime/elapsed)
+            rosrs.close()
+    finally:
+        server.stop()
+    return
+
+def benchmarkAnnotationGraph(bodycount=100, triplecount=200, latency=0.02):
+    """
+    Build an annotation graph from many annotation bodies, comparing sequential
+    fetch and in-thread parsing with concurrent fetch and a parser process pool.
+    """
+    print "getROAnnotationGraph: %d bodies of %d triples, %.1fms simulated latency"%(
+        bodycount, triplecount, latency*1000)
+    # Parser pool is created before any threads are started, and reused
+    parsepool = multiprocessing.Pool(multiprocessing.cpu_count())
+    server = ServerProcess(latency=latency)
+    srsuri = server.start()
+    try:
+        rosrs = ROSRS_Session(srsuri, accesskey="benchmark", maxconnections=8)
+        (status, reason, rouri, manifest) = rosrs.createRO("BenchAnnRO",
+            "Benchmark RO", "Benchmarks.py", "2012-09-06")
+        resuri = rdflib.URIRef(str(rouri)+"data.txt")
+        items  = []
+        for i in range(bodycount):
+            anngr = rdflib.graph.Graph()
+            for j in range(triplecount):
+                anngr.add( (rdflib.URIRef("%s#s%d"%(resuri, j)), DCTERMS.title,
+                    rdflib.Literal("Title %d.%d"%(i, j))) )
+            items.append( ("ann/body%04d.rdf"%i, "application/rdf+xml", anngr.serialize(format="xml")) )
+        for r in rosrs.aggregateResources(rouri, items, concurrency=8):
+            rosrs.createROAnnotationExt(rouri, resuri, r["resuri"])
+        basetime = None
+        for (concurrency, parseprocesses) in [ (1, 0), (8, 0), (8, multiprocessing.cpu_count()) ]:
+            (elapsed, agraph) = timeCall(rosrs.getROAnnotationGraph, rouri, resuri,
+                concurrency=concurrency, parsepool=parsepool if parseprocesses else None)
+            assert len(agraph) == bodycount*triplecount
+            basetime = basetime or elapsed
+            print "  concurrency %2d, parse processes %2d: %6.2fs, speedup %5.2f"%(
+                concurrency, parseprocesses, elapsed, basetime/elapsed)
+        rosrs.close()
+    finally:
+        server.stop()
+        parsepool.close()
+        parsepool.join()
+    return
+
+def parseLinksSplitValues(headerlist):
+    """
+    Link header parser using splitValues, as used by parseLinks before
+    parseLinkHeaders was introduced;  retained for comparison.
+    """
+    links = {}
+    for linkheader in [ v for (h,v) in headerlist if h.lower() == "link" ]:
+        for linkval in splitValues(linkheader, ","):
+            linkparts = splitValues(linkval, ";")
+            linkmatch = re.match(r'''\s*<([^>]*)>\s*''', linkparts[0])
+            if linkmatch:
+                for linkparam in linkparts[1:]:
+                    parammatch = re.match(r'''\s*rel\s*=\s*"?(.*?)"?\s*$''', linkparam)
+                    if parammatch:
+                        links[parammatch.group(1)] = linkmatch.group(1)
+    return links
+
+def benchmarkParseLinks(linkcount=500, repeat=20):
+    """
+    Parse a large Link header with the splitValues-based parser and with
+    the single-pass tokenizer used by parseLinkHeaders and parseLinks.
+    """
+    linkheader = ", ".join(
+        [ '<http://example.org/ROs/test/resource/%04d.txt>; rel="http://purl.org/ao/item%d"; '
+          'type="text/plain"; title="Resource %d, with; separators"'%(i, i%10, i)
+          for i in range(linkcount) ])
+    headerlist = [ ("link", linkheader) ]
+    print "parseLinks: %d links, %d bytes, %d repeats"%(linkcount, len(linkheader), repeat)
+    basetime = None
+    for (name, parser) in [ ("splitValues",      parseLinksSplitValues)
+                          , ("parseLinkHeaders", parseLinkHeaders)
+                          , ("parseLinks",       parseLinks)
+                          ]:
+        (elapsed, result) = timeCall(lambda: [ parser(headerlist) for i in range(repeat) ])
+        basetime = basetime or elapsed
+        print "  %-16s: %6.3fs, %8.1f links/ms, speedup %5.2f"%(
+            name, elapsed, linkcount*repeat/(elapsed*1000), basetime/elapsed)
+    return
+
+def queryNewConnection(endpoint, query):
+    """
+    Issue SPARQL query on a new connection, closed after the response is
+    read, as SparqlHttpClient did before using a connection pool;  retained
+    for comparison.
+    """
+    up = urlparse.urlsplit(endpoint)
+    hc = httplib.HTTPConnection(up.netloc)
+    hc.request("GET", up.path+"?"+urllib.urlencode({"query": query}), None,
+        { "Accept": "application/sparql-results+json" })
+    response = hc.getresponse()
+    result   = json.loads(response.read())
+    hc.close()
+    return result
+
+def benchmarkSparqlQueries(querycount=1000):
+    """
+    Issue many small SPARQL queries to a Fuseki-like stand-in endpoint,
+    with a new connection for each query and with pooled connections.
+    """
+    print "SPARQL queries: %d small SELECT queries"%(querycount)
+    server   = ServerProcess(handler=StandInSparqlHandler)
+    endpoint = server.start()
+    try:
+        query  = "SELECT * WHERE { <http://example.org/s> ?p ?o }"
+        sparql = SparqlHttpClient(endpointuri=endpoint)
+        def pooledQuery(endpoint, query):
+            return sparql.doQueryGET(query, accept="application/sparql-results+json")[1]
+        basetime = None
+        for (name, doquery) in [ ("new connection", queryNewConnection)
+                               , ("pooled",         pooledQuery)
+                               ]:
+            (elapsed, results) = timeCall(lambda: [ doquery(endpoint, query) for i in range(querycount) ])
+            assert all([ len(r["results"]["bindings"]) == 3 for r in results ])
+            basetime = basetime or elapsed
+            print "  %-14s: %6.2fs, %7.1f queries/s, speedup %5.2f"%(
+                name, elapsed, querycount/elapsed, basetime/elapsed)
+        sparql.close()
+    finally:
+        server.stop()
+    return
+
+BENCHMARKS = (
+    [ ("aggregateResources", benchmarkAggregateResources)
+    , ("annotationGraph",    benchmarkAnnotationGraph)
+    , ("parseLinks",         benchmarkParseLinks)
+    , ("sparqlQueries",      benchmarkSparqlQueries)
+    ])
+
+def runBenchmarks(names):
+    for (name, benchmark) in BENCHMARKS:
+        if not names or name in names:
+            benchmark()
+    return
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    runBenchmarks(sys.argv[1:])
+
+# End.
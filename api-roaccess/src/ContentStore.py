@@ -0,0 +1,245 @@
+"""
+Persistent, content-addressed store of cached data in a local directory,
+used by HttpCache and SparqlCache
+"""
+
+import os, os.path
+import json
+import hashlib
+import tempfile
+import threading
+import collections
+import logging
+
+# Logging object
+log = logging.getLogger(__name__)
+
+# Suffix of temporary files, which are discarded when a store is loaded
+
+TEMP_SUFFIX = ".tmp"
+
+def contentDigest(data):
+    """
+    Return the digest by which content is stored
+    """
+    return hashlib.sha1(data).hexdigest()
+
+class ContentStore(object):
+    """
+    Store for cached data in a local directory, which persists between
+    processes.
+
+    Each item is described by an entry, which is held in subdirectory
+    "entries" as a JSON file named by a digest of the entry's key.  Content
+    is held in subdirectory "objects", once for each distinct content (named
+    by its SHA-1 digest), so that entries with identical content share
+    storage.  An entry is any object with attributes `key`, `digest` (of
+    its content) and `size`, and a method `toJson`;  `fromJson` creates an
+    entry from the value returned by `toJson`.
+
+    The total size of stored content is limited to `maxsize` bytes:  when
+    this is exceeded, least recently used entries are discarded.  The order
+    of use is recorded by the modification times of entry files, so that it
+    is kept when the store is reloaded.  Subclasses may extend addEntry
+    and removeEntry (which are called with the store locked) to maintain
+    additional indexes of stored entries.
+    """
+
+    def __init__(self, directory, fromJson, maxsize=100*1024*1024):
+        self._dir       = directory
+        self._objdir    = os.path.join(directory, "objects")
+        self._entrydir  = os.path.join(directory, "entries")
+        self._fromJson  = fromJson
+        self._maxsize   = maxsize
+        self._lock      = threading.RLock()
+        self._entries   = collections.OrderedDict() # key -> entry, most recent last
+        self._objects   = {}                        # digest -> [size, refcount]
+        self._size      = 0
+        self._evictions = 0
+        for d in [self._objdir, self._entrydir]:
+            if not os.path.isdir(d):
+                os.makedirs(d)
+        self.load()
+        return
+
+    # Storage
+
+    def entryPath(self, key):
+        if isinstance(key, unicode):
+            key = key.encode("utf-8")
+        return os.path.join(self._entrydir, hashlib.sha1(key).hexdigest()+".json")
+
+    def objectPath(self, digest):
+        return os.path.join(self._objdir, digest)
+
+    def writeFile(self, path, data):
+        # Write to temporary file and rename, so that readers never see partial content
+        (fd, tmppath) = tempfile.mkstemp(dir=self._dir, suffix=TEMP_SUFFIX)
+        try:
+            with os.fdopen(fd, "wb") as tmpfile:
+                tmpfile.write(data)
+            os.rename(tmppath, path)
+        except:
+            os.remove(tmppath)
+            raise
+        return
+
+    def removeFile(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        return
+
+    def load(self):
+        """
+        Load index of stored entries from the directory, discarding entries
+        whose content is missing or incomplete, content not used by any
+        entry, and temporary files left by interrupted writes
+        """
+        for name in os.listdir(self._dir):
+            if name.endswith(TEMP_SUFFIX):
+                self.removeFile(os.path.join(self._dir, name))
+        entries = []
+        for name in os.listdir(self._entrydir):
+            path = os.path.join(self._entrydir, name)
+            try:
+                with open(path, "rb") as f:
+                    entry = self._fromJson(json.load(f))
+                if os.path.getsize(self.objectPath(entry.digest)) != entry.size:
+                    raise IOError("Incomplete content %s"%entry.digest)
+                entries.append( (os.path.getmtime(path), entry) )
+            except (IOError, OSError, ValueError, KeyError), e:
+                log.warn("ContentStore.load: discard %s: %s"%(path, e))
+                self.removeFile(path)
+        for (mtime, entry) in sorted(entries, key=lambda e: e[0]):
+            self.addEntry(entry)
+        for name in os.listdir(self._objdir):
+            if name not in self._objects:
+                self.removeFile(self.objectPath(name))
+        self.evict()
+        return
+
+    def addEntry(self, entry):
+        self._entries[entry.key] = entry
+        obj = self._objects.get(entry.digest)
+        if obj is None:
+            self._objects[entry.digest] = [entry.size, 1]
+            self._size += entry.size
+        else:
+            obj[1] += 1
+        return
+
+    def removeEntry(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return None
+        self.removeFile(self.entryPath(key))
+        obj = self._objects[entry.digest]
+        obj[1] -= 1
+        if obj[1] == 0:
+            del self._objects[entry.digest]
+            self._size -= obj[0]
+            self.removeFile(self.objectPath(entry.digest))
+        return entry
+
+    def evict(self):
+        while self._entries and self._size > self._maxsize:
+            (key, entry) = self._entries.popitem(last=False)
+            self._entries[key] = entry          # removeEntry expects entry to be present
+            self.removeEntry(key)
+            self._evictions += 1
+            log.debug("ContentStore.evict: %s", key)
+        return
+
+    # Store access
+
+    def get(self, key):
+        """
+        Return entry for key, or None, and record its use
+        """
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._entries[key] = entry
+            return entry
+
+    def read(self, entry):
+        """
+        Return the content of an entry, or None if it is no longer
+        available, in which case the entry is removed
+        """
+        try:
+            with open(self.objectPath(entry.digest), "rb") as f:
+                data = f.read()
+        except IOError, e:
+            log.warn("ContentStore.read: %s: %s"%(entry.key, e))
+            with self._lock:
+                if self._entries.get(entry.key) is entry:
+                    self.removeEntry(entry.key)
+            return None
+        try:
+            os.utime(self.entryPath(entry.key), None)   # Record use for LRU order on reload
+        except OSError:
+            pass
+        return data
+
+    def put(self, entry, data):
+        """
+        Store an entry with its content, replacing any entry with the same
+        key.  Content larger than the store's maximum size is not stored.
+        Returns True if the entry was stored.
+        """
+        with self._lock:
+            if entry.size > self._maxsize:
+                self.removeEntry(entry.key)
+                return False
+            old = self._entries.get(entry.key)
+            if old is not None and old.digest == entry.digest:
+                # Content unchanged: replace entry only
+                del self._entries[entry.key]
+                self._entries[entry.key] = entry
+            else:
+                self.removeEntry(entry.key)
+                if entry.digest not in self._objects:
+                    self.writeFile(self.objectPath(entry.digest), data)
+                self.addEntry(entry)
+            self.writeFile(self.entryPath(entry.key), json.dumps(entry.toJson()))
+            self.evict()
+        return True
+
+    def replace(self, old, new):
+        """
+        Replace an entry with a new entry for the same content, if the old
+        entry is still stored.  Returns True if it was replaced.
+        """
+        with self._lock:
+            if self._entries.get(old.key) is not old:
+                return False
+            self.writeFile(self.entryPath(new.key), json.dumps(new.toJson()))
+            self._entries[new.key] = new
+        return True
+
+    def remove(self, key):
+        """
+        Remove entry for key, and its content if not used by another entry.
+        Returns the entry removed, or None.
+        """
+        with self._lock:
+            return self.removeEntry(key)
+
+    def entries(self):
+        with self._lock:
+            return self._entries.values()
+
+    def clear(self):
+        with self._lock:
+            for key in self._entries.keys():
+                self.removeEntry(key)
+        return
+
+    def stats(self):
+        with self._lock:
+            return { "entries": len(self._entries), "size": self._size, "evictions": self._evictions }
+
+# End.
@@ -0,0 +1,349 @@
+"""
+Persistent, content-addressed HTTP response cache (RFC 7234), for use by ROSRS_Session
+"""
+
+import time
+import hashlib
+import threading
+import email.utils
+import logging
+
+from ContentStore import ContentStore, contentDigest
+
+# Logging object
+log = logging.getLogger(__name__)
+
+# Response status codes that are cached
+
+CACHEABLE_STATUSES = frozenset([200, 203])
+
+# Response headers that are not updated from a 304 (Not Modified) response
+
+NOT_UPDATED_HEADERS = frozenset(["content-length", "content-encoding", "transfer-encoding"])
+
+def parseCacheControl(value):
+    """
+    Parse Cache-Control header value, returning a dictionary of directives
+    keyed by lowercase directive name, with value None for directives
+    without an argument
+    """
+    directives = {}
+    for part in (value or "").split(","):
+        (name, sep, arg) = part.partition("=")
+        name = name.strip().lower()
+        if name:
+            directives[name] = arg.strip().strip('"') if sep else None
+    return directives
+
+def parseSeconds(value):
+    """
+    Parse delta-seconds value, returning None if the value is not valid
+    """
+    try:
+        return max(0, int(value))
+    except (TypeError, ValueError):
+        return None
+
+def parseHttpDate(value):
+    """
+    Parse HTTP date, returning time in seconds since epoch, or None
+    """
+    parsed = value and email.utils.parsedate_tz(value)
+    return parsed and email.utils.mktime_tz(parsed)
+
+def credentialDigest(reqheaders):
+    """
+    Return digest of the Authorization header of a request, or None:  the
+    credential itself is not stored in the cache
+    """
+    authorization = reqheaders.get("authorization")
+    return authorization and hashlib.sha1(authorization).hexdigest()
+
+def entryKey(uri, credential):
+    """
+    Return key of cache entry for a URI and credential digest:  responses
+    to requests with different credentials are cached separately
+    """
+    return uri if credential is None else uri+"\n"+credential
+
+class CacheEntry(object):
+    """
+    Cached response:  status, reason, header list and body digest, with the
+    request header values selected by Vary, the digest of the request
+    credential and the times at which the request was sent and the
+    response received
+    """
+
+    def __init__(self, uri, status, reason, headerlist, digest, size, vary,
+            requesttime, responsetime, credential=None):
+        self.uri          = uri
+        self.credential   = credential
+        self.key          = entryKey(uri, credential)
+        self.status       = status
+        self.reason       = reason
+        self.headerlist   = headerlist
+        self.digest       = digest
+        self.size         = size
+        self.vary         = vary
+        self.requesttime  = requesttime
+        self.responsetime = responsetime
+        self.headers      = dict(headerlist)
+        self.cachecontrol = parseCacheControl(self.headers.get("cache-control"))
+        return
+
+    def toJson(self):
+        return (
+            { "uri":          self.uri
+            , "status":       self.status
+            , "reason":       self.reason
+            , "headerlist":   self.headerlist
+            , "digest":       self.digest
+            , "size":         self.size
+            , "vary":         self.vary
+            , "requesttime":  self.requesttime
+            , "responsetime": self.responsetime
+            , "credential":   self.credential
+            })
+
+    @staticmethod
+    def fromJson(data):
+        return CacheEntry(data["uri"], data["status"], data["reason"],
+            [ tuple(h) for h in data["headerlist"] ], data["digest"], data["size"],
+            data["vary"], data["requesttime"], data["responsetime"], data.get("credential"))
+
+    def freshnessLifetime(self, heuristic, maxheuristic):
+        """
+        Return freshness lifetime in seconds (RFC 7234, section 4.2.1)
+        """
+        maxage = parseSeconds(self.cachecontrol.get("max-age"))
+        if maxage is not None:
+            return maxage
+        date = parseHttpDate(self.headers.get("date")) or self.responsetime
+        if "expires" in self.headers:
+            expires = parseHttpDate(self.headers["expires"])
+            return max(0, expires - date) if expires else 0
+        lastmodified = parseHttpDate(self.headers.get("last-modified"))
+        if lastmodified:
+            # Heuristic freshness (section 4.2.2)
+            return min(max(0, date - lastmodified)*heuristic, maxheuristic)
+        return 0
+
+    def currentAge(self, now):
+        """
+        Return current age of response in seconds (RFC 7234, section 4.2.3)
+        """
+        date          = parseHttpDate(self.headers.get("date")) or self.responsetime
+        apparentage   = max(0, self.responsetime - date)
+        correctedage  = (parseSeconds(self.headers.get("age")) or 0) + (self.responsetime - self.requesttime)
+        return max(apparentage, correctedage) + (now - self.responsetime)
+
+    def validators(self):
+        """
+        Return dictionary of conditional request headers to revalidate entry
+        """
+        condheaders = {}
+        if "etag" in self.headers:
+            condheaders["if-none-match"] = self.headers["etag"]
+        if "last-modified" in self.headers:
+            condheaders["if-modified-since"] = self.headers["last-modified"]
+        return condheaders
+
+class ResponseStore(ContentStore):
+    """
+    Store for cached responses, with an index of the entries for each URI
+    """
+
+    def __init__(self, directory, maxsize):
+        self._keys = {}         # uri -> set of keys
+        super(ResponseStore, self).__init__(directory, CacheEntry.fromJson, maxsize)
+        return
+
+    def addEntry(self, entry):
+        super(ResponseStore, self).addEntry(entry)
+        self._keys.setdefault(entry.uri, set()).add(entry.key)
+        return
+
+    def removeEntry(self, key):
+        entry = super(ResponseStore, self).removeEntry(key)
+        if entry is not None:
+            keys = self._keys[entry.uri]
+            keys.discard(key)
+            if not keys:
+                del self._keys[entry.uri]
+        return entry
+
+    def removeUri(self, uri):
+        """
+        Remove all entries for a URI
+        """
+        with self._lock:
+            for key in list(self._keys.get(uri, ())):
+                self.removeEntry(key)
+        return
+
+class HttpCache(object):
+    """
+    Private HTTP cache for GET responses, stored in a local directory.
+
+    Response bodies are stored once for each distinct content (named by
+    SHA-1 digest), so that identical resources at different URIs share
+    storage.  Response metadata is stored in a separate file for each URI.
+
+    The cache may be shared by sessions with different credentials:
+    responses are cached separately for each Authorization header value
+    (of which only a digest is stored), so that one user's responses are
+    never returned for another user's requests.
+    The total size of stored bodies is limited to `maxsize` bytes:  when
+    this is exceeded, least recently used entries are discarded.
+
+    Freshness and validation follow RFC 7234:  a response is served from
+    the cache while fresh according to its Cache-Control max-age or Expires
+    headers (or heuristically, as `heuristic` times the time since it was
+    last modified, up to `maxheuristic` seconds), unless the request
+    includes Cache-Control no-cache or max-age.  A stale response with a
+    validator is revalidated with a conditional request (see ROSRS_Session).
+    Responses with Cache-Control no-store or Vary: * are not stored.
+
+    Usage counters are available from `stats`.
+    """
+
+    def __init__(self, directory, maxsize=100*1024*1024, heuristic=0.1, maxheuristic=3600,
+            clock=time.time):
+        self._store        = ResponseStore(directory, maxsize)
+        self._heuristic    = heuristic
+        self._maxheuristic = maxheuristic
+        self._clock        = clock
+        self._lock         = threading.Lock()
+        self._stats        = { "hits": 0, "misses": 0, "revalidated": 0, "stored": 0 }
+        return
+
+    # Cache access
+
+    def now(self):
+        """
+        Return current time, as used for cache entry ages
+        """
+        return self._clock()
+
+    def stats(self):
+        """
+        Return a copy of the cache usage counters
+        """
+        with self._lock:
+            stats = dict(self._stats)
+        stats.update(self._store.stats())
+        return stats
+
+    def count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+        return
+
+    def lookup(self, uri, reqheaders):
+        """
+        Return cache entry for a GET request, or None.  The entry may be
+        stale:  use `isFresh` to determine whether it needs revalidation.
+        """
+        entry = self._store.get(entryKey(uri, credentialDigest(reqheaders)))
+        if entry is None:
+            return None
+        for (h, v) in entry.vary.items():
+            if reqheaders.get(h) != v:
+                return None
+        return entry
+
+    def isFresh(self, entry, reqheaders):
+        """
+        Test if cached entry may be used without revalidation for a request
+        """
+        reqcc = parseCacheControl(reqheaders.get("cache-control"))
+        if "no-cache" in reqcc or "no-cache" in entry.cachecontrol:
+            return False
+        if "no-cache" in (reqheaders.get("pragma") or "") and "cache-control" not in reqheaders:
+            return False
+        lifetime = entry.freshnessLifetime(self._heuristic, self._maxheuristic)
+        age      = entry.currentAge(self._clock())
+        maxage   = parseSeconds(reqcc.get("max-age"))
+        if maxage is not None:
+            lifetime = min(lifetime, maxage)
+        minfresh = parseSeconds(reqcc.get("min-fresh")) or 0
+        return lifetime > age + minfresh
+
+    def response(self, entry):
+        """
+        Return (status, reason, headers, data) for a cache entry, or None if
+        the content is no longer available
+        """
+        data = self._store.read(entry)
+        if data is None:
+            return None
+        headerlist = ( [ (h, v) for (h, v) in entry.headerlist if h != "age" ] +
+                       [ ("age", str(int(entry.currentAge(self._clock())))) ] )
+        headers = dict(headerlist)
+        headers["_headerlist"] = headerlist
+        return (entry.status, entry.reason, headers, data)
+
+    def isStorable(self, status, reqheaders, headers):
+        """
+        Test if a response to a GET request may be stored
+        """
+        if status not in CACHEABLE_STATUSES:
+            return False
+        reqcc = parseCacheControl(reqheaders.get("cache-control"))
+        respcc = parseCacheControl(headers.get("cache-control"))
+        if "no-store" in reqcc or "no-store" in respcc:
+            return False
+        if headers.get("vary", "").strip() == "*":
+            return False
+        return ( "max-age" in respcc or "expires" in headers or
+                 "etag" in headers or "last-modified" in headers )
+
+    def store(self, uri, reqheaders, status, reason, headers, data, requesttime, responsetime):
+        """
+        Store response to a GET request, if permitted, and return the new
+        cache entry (or None)
+        """
+        if not self.isStorable(status, reqheaders, headers):
+            self._store.remove(entryKey(uri, credentialDigest(reqheaders)))
+            return None
+        vary = {}
+        for h in headers.get("vary", "").split(","):
+            h = h.strip().lower()
+            if h: vary[h] = reqheaders.get(h)
+        entry = CacheEntry(uri, status, reason, headers["_headerlist"], contentDigest(data),
+            len(data), vary, requesttime, responsetime, credentialDigest(reqheaders))
+        if not self._store.put(entry, data):
+            return None
+        self.count("stored")
+        return entry
+
+    def update(self, entry, headers, requesttime, responsetime):
+        """
+        Update cache entry with headers from a 304 (Not Modified) response,
+        and return the updated entry
+        """
+        newheaders = dict([ (h, v) for (h, v) in headers["_headerlist"]
+                            if h not in NOT_UPDATED_HEADERS ])
+        headerlist = ( [ (h, v) for (h, v) in entry.headerlist if h not in newheaders ] +
+                       [ (h, v) for (h, v) in headers["_headerlist"] if h in newheaders ] )
+        newentry = CacheEntry(entry.uri, entry.status, entry.reason, headerlist,
+            entry.digest, entry.size, entry.vary, requesttime, responsetime, entry.credential)
+        self._store.replace(entry, newentry)
+        self.count("revalidated")
+        return newentry
+
+    def invalidate(self, uri):
+        """
+        Discard any cached responses for a URI, for all credentials
+        """
+        self._store.removeUri(uri)
+        return
+
+    def clear(self):
+        """
+        Discard all cached responses
+        """
+        self._store.clear()
+        return
+
+# End.
@@ -0,0 +1,542 @@
+"""
+Thread-safe pool of persistent HTTP connections to a single host
+"""
+
+import time
+import socket
+import select
+import ssl
+import threading
+import httplib
+import logging
+
+# Logging object
+log = logging.getLogger(__name__)
+
+# Methods that may be safely repeated if a pooled connection turns out to be stale
+
+IDEMPOTENT_METHODS = frozenset(["GET", "HEAD", "PUT", "DELETE", "OPTIONS", "TRACE"])
+
+# Default size of blocks read from a streamed response body
+
+CHUNK_SIZE = 65536
+
+# Class for connection pool errors
+
+class HttpPoolError(Exception):
+
+    def __init__(self, msg="HttpPoolError", value=None, host=None):
+        self._msg   = msg
+        self._value = value
+        self._host  = host
+        return
+
+    def __str__(self):
+        txt = self._msg
+        if self._host:  txt += " for "+str(self._host)
+        if self._value: txt += ": "+repr(self._value)
+        return txt
+
+    def __repr__(self):
+        return ( "HttpPoolError(%s, value=%s, host=%s)"%
+                 (repr(self._msg), repr(self._value), repr(self._host)))
+
+# TLS support
+#
+# Creating an SSL context loads the trusted CA certificates, so a single
+# context is shared by all connections that do not supply their own.  Where
+# the ssl module supports it, the TLS session negotiated by one connection
+# is offered when opening the next connection to the same host, so that a
+# reconnection can use an abbreviated handshake.
+
+_sslcontext     = None
+_sslcontextlock = threading.Lock()
+
+def defaultSSLContext():
+    """
+    Return the shared default SSL context for HTTPS connections
+    """
+    global _sslcontext
+    with _sslcontextlock:
+        if _sslcontext is None:
+            _sslcontext = ssl.create_default_context()
+    return _sslcontext
+
+TLS_SESSION_SUPPORTED = hasattr(ssl.SSLSocket, "session")
+
+class TLSSessionCache(object):
+    """
+    Thread-safe record of the most recent TLS session for each host,
+    and counters of full and resumed TLS handshakes.
+    """
+
+    def __init__(self):
+        self._lock     = threading.Lock()
+        self._sessions = {}
+        self._stats    = { "handshakes": 0, "resumed": 0 }
+        return
+
+    def get(self, host):
+        with self._lock:
+            return self._sessions.get(host)
+
+    def put(self, host, session, resumed=False):
+        with self._lock:
+            self._stats["handshakes"] += 1
+            if resumed: self._stats["resumed"] += 1
+            if session is not None:
+                self._sessions[host] = session
+        return
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+class HTTPSResumeConnection(httplib.HTTPSConnection):
+    """
+    HTTPS connection using a supplied SSL context, which offers a
+    previously negotiated TLS session when connecting, if available.
+    """
+
+    def __init__(self, host, context=None, tlssessions=None, **kwargs):
+        httplib.HTTPSConnection.__init__(self, host,
+            context=context or defaultSSLContext(), **kwargs)
+        self._sslcontext  = context or defaultSSLContext()
+        self._tlssessions = tlssessions or TLSSessionCache()
+        return
+
+    def connect(self):
+        sock = socket.create_connection((self.host, self.port),
+            self.timeout, self.source_address)
+        if self._tunnel_host:
+            self.sock = sock
+            self._tunnel()
+        hostname = self._tunnel_host or self.host
+        wrapargs = { "server_hostname": hostname }
+        session  = None
+        if TLS_SESSION_SUPPORTED:
+            session = self._tlssessions.get(hostname)
+            if session is not None: wrapargs["session"] = session
+        self.sock = self._sslcontext.wrap_socket(sock, **wrapargs)
+        if TLS_SESSION_SUPPORTED:
+            self._tlssessions.put(hostname, self.sock.session, self.sock.session_reused)
+        else:
+            self._tlssessions.put(hostname, None)
+        return
+
+# Request bodies
+#
+# A request body may be a string, a file-like object with a `read` method
+# (including an mmap object), or an iterator or generator of strings.  Bodies
+# other than strings are sent in blocks as they are read.  Where the length of
+# the body can be determined (strings and seekable files) it is sent with a
+# Content-Length header, otherwise using chunked transfer encoding.
+
+def requestBodyLength(body):
+    """
+    Return the number of bytes remaining to be sent from a request body,
+    or None if this cannot be determined without reading it.
+    """
+    if body is None:
+        return 0
+    if isinstance(body, basestring):
+        return len(body)
+    if hasattr(body, "seek") and hasattr(body, "tell"):
+        try:
+            pos = body.tell()
+            body.seek(0, 2)
+            end = body.tell()
+            body.seek(pos)
+            return end - pos
+        except (IOError, OSError, ValueError):
+            pass
+    return None
+
+def iterRequestBody(body, blocksize=CHUNK_SIZE):
+    """
+    Iterate over a request body in blocks of about blocksize bytes
+    """
+    if body is None:
+        return
+    if isinstance(body, basestring):
+        for pos in range(0, len(body), blocksize):
+            yield body[pos:pos+blocksize]
+    elif hasattr(body, "read"):
+        while True:
+            data = body.read(blocksize)
+            if not data: break
+            yield data
+    else:
+        # Coalesce small strings from an iterator into blocks
+        (buf, buflen) = ([], 0)
+        for data in body:
+            buf.append(data)
+            buflen += len(data)
+            if buflen >= blocksize:
+                yield "".join(buf)
+                (buf, buflen) = ([], 0)
+        if buflen:
+            yield "".join(buf)
+    return
+
+def sendRequest(conn, method, path, body=None, headers={}, progress=None, blocksize=CHUNK_SIZE):
+    """
+    Send an HTTP request on the supplied connection, reading the body in blocks.
+
+    progress, if supplied, is called as progress(sent, total) after each block
+    of the body is sent, where total is None if the body length is not known.
+
+    Returns the number of bytes of the body sent.
+    """
+    hdrnames = set([ h.lower() for h in headers ])
+    conn.putrequest(method, path,
+        skip_host="host" in hdrnames,
+        skip_accept_encoding="accept-encoding" in hdrnames)
+    length  = requestBodyLength(body)
+    chunked = False
+    if "content-length" not in hdrnames and "transfer-encoding" not in hdrnames:
+        if length is None:
+            conn.putheader("Transfer-Encoding", "chunked")
+            chunked = True
+        elif body is not None or method in ["POST", "PUT"]:
+            conn.putheader("Content-Length", str(length))
+    for (h, v) in headers.items():
+        conn.putheader(h, v)
+    # First block is sent with the headers, to avoid an extra round trip
+    # due to interaction between Nagle's algorithm and delayed ACKs.
+    sent   = 0
+    blocks = iterRequestBody(body, blocksize)
+    for data in blocks:
+        sent += len(data)
+        if chunked:
+            data = "%x\r\n%s\r\n"%(len(data), data)
+        conn.endheaders(data)
+        if progress: progress(sent, length)
+        break
+    else:
+        conn.endheaders("0\r\n\r\n" if chunked else None)
+        return sent
+    for data in blocks:
+        sent += len(data)
+        if chunked:
+            data = "%x\r\n%s\r\n"%(len(data), data)
+        conn.send(data)
+        if progress: progress(sent, length)
+    if chunked:
+        conn.send("0\r\n\r\n")
+    return sent
+
+def isStaleConnection(conn):
+    """
+    Test if an idle connection has been closed (or otherwise disturbed) by the server.
+
+    An idle keep-alive connection should have nothing to read:  if its socket
+    polls as readable, the server has either closed it or sent something
+    unexpected, and in either case it cannot be used for a new request.
+    A connection whose socket has not been opened is not stale.
+    """
+    if conn.sock is None:
+        return False
+    try:
+        (readable, writable, errors) = select.select([conn.sock], [], [], 0)
+    except (select.error, socket.error, ValueError):
+        return True
+    return bool(readable)
+
+class HttpConnectionPool(object):
+    """
+    Bounded pool of persistent HTTP connections to a single host.
+
+    Connections are handed out by `acquire` and returned by `release`;  at most
+    `maxsize` connections are in use at any time, and further callers block
+    until one is released.  Idle connections are discarded when they have been
+    unused for longer than `idletimeout` seconds, or when the server has closed
+    them.  The `request` method wraps this to issue a single request, retrying
+    idempotent requests on a fresh connection if a reused connection fails.
+
+    The caller must read the whole of a response before releasing the
+    connection for reuse.
+
+    For scheme "https", connections use sslcontext if supplied, otherwise
+    the shared default SSL context.
+    """
+
+    def __init__(self, host, scheme="http", maxsize=4, idletimeout=30.0, timeout=None,
+            sslcontext=None):
+        log.debug("HttpConnectionPool.__init__: %s://%s, maxsize %d"%(scheme, host, maxsize))
+        self._host        = host
+        self._scheme      = scheme
+        self._maxsize     = maxsize
+        self._idletimeout = idletimeout
+        self._timeout     = timeout
+        self._sslcontext  = sslcontext
+        self._tlssessions = TLSSessionCache()
+        self._lock        = threading.Condition()
+        self._idle        = []      # (connection, time last used), most recent last
+        self._inuse       = 0
+        self._closed      = False
+        self._stats       = { "created": 0, "reused": 0, "stale": 0, "retried": 0 }
+        return
+
+    def host(self):
+        return self._host
+
+    def stats(self):
+        """
+        Return a copy of the pool usage counters
+        """
+        with self._lock:
+            stats = dict(self._stats)
+        if self._scheme == "https":
+            tlsstats = self._tlssessions.stats()
+            stats["tlshandshakes"] = tlsstats["handshakes"]
+            stats["tlsresumed"]    = tlsstats["resumed"]
+        return stats
+
+    def newConnection(self):
+        """
+        Create a new (unopened) connection to the pool host
+        """
+        kwargs = {}
+        if self._timeout is not None:
+            kwargs["timeout"] = self._timeout
+        if self._scheme == "http":
+            return httplib.HTTPConnection(self._host, **kwargs)
+        if self._scheme == "https":
+            return HTTPSResumeConnection(self._host,
+                context=self._sslcontext, tlssessions=self._tlssessions, **kwargs)
+        raise HttpPoolError("Unsupported URI scheme", value=self._scheme, host=self._host)
+
+    def acquire(self):
+        """
+        Obtain a connection from the pool, waiting if all connections are in use.
+
+        Returns (connection, reused), where reused is True if the connection
+        is an open connection that has been used for a previous request.
+        """
+        with self._lock:
+            while True:
+                if self._closed:
+                    raise HttpPoolError("Connection pool closed", host=self._host)
+                now = time.time()
+                while self._idle:
+                    (conn, lastused) = self._idle.pop()
+                    if (now - lastused) > self._idletimeout or isStaleConnection(conn):
+                        log.debug("HttpConnectionPool.acquire: discard stale connection")
+                        self._stats["stale"] += 1
+                        conn.close()
+                        continue
+                    self._inuse += 1
+                    reused = conn.sock is not None
+                    if reused: self._stats["reused"] += 1
+                    return (conn, reused)
+                if self._inuse < self._maxsize:
+                    self._inuse += 1
+                    self._stats["created"] += 1
+                    break
+                self._lock.wait()
+        return (self.newConnection(), False)
+
+    def release(self, conn, reuse=True):
+        """
+        Return a connection to the pool.
+
+        reuse is False if the connection is not in a fit state for a further
+        request (e.g. an error occurred, or the response was not fully read),
+        in which case it is closed.
+        """
+        with self._lock:
+            self._inuse -= 1
+            if reuse and not self._closed:
+                self._idle.append((conn, time.time()))
+            else:
+                conn.close()
+            self._lock.notify()
+        return
+
+    def request(self, method, path, body=None, headers={}, progress=None, timings=None):
+        """
+        Issue an HTTP request using a pooled connection.
+
+        Returns (connection, response);  the caller must read the response
+        and then pass the connection to `release`.
+
+        The request body and progress callback are as for `sendRequest`.
+
+        If a reused connection fails before a response is received, the
+        connection is discarded and an idempotent request is repeated on
+        another connection, provided that the body can be re-read.
+        Other failures are passed to the caller.
+
+        If timings is supplied, it is a dictionary that is updated with
+        details of the (final) attempt to issue the request:  "reused" (True
+        if an open connection was reused), "connect" (time in seconds to open
+        a new connection, if one was opened), "send" (time to send the
+        request), "wait" (time from sending the request to receiving the
+        response headers) and "sent" (number of body bytes sent).
+        """
+        bodypos = None
+        if hasattr(body, "seek") and hasattr(body, "tell"):
+            bodypos = body.tell()
+        while True:
+            (conn, reused) = self.acquire()
+            try:
+                if timings is None:
+                    sendRequest(conn, method, path, body, headers, progress=progress)
+                    response = conn.getresponse()
+                    return (conn, response)
+                timings.clear()
+                timings["reused"] = reused
+                starttime = time.time()
+                if conn.sock is None:
+                    conn.connect()
+                    timings["connect"] = time.time()-starttime
+                    starttime = time.time()
+                timings["sent"] = sendRequest(conn, method, path, body, headers, progress=progress)
+                senttime = time.time()
+                response = conn.getresponse()
+                timings["send"] = senttime-starttime
+                timings["wait"] = time.time()-senttime
+                return (conn, response)
+            except (socket.error, httplib.HTTPException), e:
+                self.release(conn, reuse=False)
+                retry = ( reused and method in IDEMPOTENT_METHODS and
+                          (isinstance(body, basestring) or body is None or bodypos is not None) )
+                if not retry:
+                    raise
+                log.debug("HttpConnectionPool.request: retry %s %s after %s"%(method, path, repr(e)))
+                with self._lock:
+                    self._stats["retried"] += 1
+                if bodypos is not None:
+                    body.seek(bodypos)
+            except:
+                self.release(conn, reuse=False)
+                raise
+
+    def close(self):
+        """
+        Close all idle connections, and prevent further use of the pool.
+        Connections currently in use are closed when they are released.
+        """
+        with self._lock:
+            self._closed = True
+            for (conn, lastused) in self._idle:
+                conn.close()
+            self._idle = []
+            self._lock.notifyAll()
+        return
+
+# Streamed response bodies
+
+class ResponseStream(object):
+    """
+    File-like access to the body of a response received over a pooled connection.
+
+    The body is read from the connection as it is consumed, so memory use
+    does not depend on the size of the response.  The connection is returned
+    to its pool when the body has been read to the end (for reuse), or when
+    the stream is closed before then (in which case the connection is
+    discarded).  Until then, it counts against the pool size, so a stream
+    should be closed promptly, e.g. by using it as a context manager:
+
+        with stream:
+            for chunk in stream:
+                ...
+    """
+
+    def __init__(self, pool, conn, response, chunksize=CHUNK_SIZE):
+        self._pool      = pool
+        self._conn      = conn
+        self._response  = response
+        self._chunksize = chunksize
+        return
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exctype, excval, exctraceback):
+        self.close()
+        return False
+
+    def __iter__(self):
+        return self.iterChunks()
+
+    def length(self):
+        """
+        Return response body length from content-length header, or None
+        """
+        length = self._response.getheader("content-length")
+        return length and int(length)
+
+    def closed(self):
+        return self._conn is None
+
+    def _release(self):
+        if self._conn is not None:
+            self._pool.release(self._conn, reuse=self._response.isclosed())
+            self._conn = None
+        return
+
+    def read(self, amt=None):
+        """
+        Read and return up to amt bytes of the response body, or the
+        remainder of the body if amt is None.  Returns an empty string
+        at the end of the body.
+
+        Raises httplib.IncompleteRead if the connection is closed before
+        the end of a body with a known length.
+        """
+        if self._conn is None:
+            return ""
+        try:
+            if amt is None:
+                data = self._response.read()
+            else:
+                data = self._response.read(amt)
+        except:
+            self._pool.release(self._conn, reuse=False)
+            self._conn = None
+            raise
+        if not data and amt and self._response.length:
+            # httplib returns an empty string when the connection is closed early
+            self._pool.release(self._conn, reuse=False)
+            self._conn = None
+            raise httplib.IncompleteRead("", self._response.length)
+        if not data or self._response.isclosed():
+            self._release()
+        return data
+
+    def iterChunks(self, chunksize=None):
+        """
+        Iterate over the response body in blocks of at most chunksize bytes
+        """
+        chunksize = chunksize or self._chunksize
+        while True:
+            data = self.read(chunksize)
+            if not data: break
+            yield data
+        return
+
+    def downloadTo(self, path, chunksize=None):
+        """
+        Write the remainder of the response body to the named file,
+        and close the stream.  Returns the number of bytes written.
+        """
+        count = 0
+        try:
+            with open(path, "wb") as outfile:
+                for data in self.iterChunks(chunksize):
+                    outfile.write(data)
+                    count += len(data)
+        finally:
+            self.close()
+        return count
+
+    def close(self):
+        """
+        Close the stream, releasing its connection
+        """
+        self._release()
+        return
+
+# End.
@@ -0,0 +1,181 @@
+"""
+HTTP range requests:  partial content parsing, and seekable remote file access
+"""
+
+import re
+import logging
+
+from HttpConnectionPool import ResponseStream
+
+# Logging object
+log = logging.getLogger(__name__)
+
+# Default size of block fetched by each range request
+
+DEFAULT_BLOCKSIZE = 64*1024
+
+CONTENT_RANGE_RE = re.compile(r"^\s*bytes\s+(\d+)-(\d+)/(\d+|\*)\s*$", re.IGNORECASE)
+
+def parseContentRange(value):
+    """
+    Parse Content-Range header value for a byte range, and return
+    (first, last, length), where length is None if not known, or None
+    if the value is not recognized
+    """
+    match = value and CONTENT_RANGE_RE.match(value)
+    if not match:
+        return None
+    (first, last, length) = match.groups()
+    return (int(first), int(last), None if length == "*" else int(length))
+
+def rangeValidator(headers):
+    """
+    Return a validator for use with If-Range from response headers:  a
+    strong entity tag if available, otherwise the last-modified date, or
+    None if the response has neither
+    """
+    etag = headers.get("etag")
+    if etag and not etag.startswith("W/"):
+        return etag
+    return headers.get("last-modified")
+
+class RangeReader(object):
+    """
+    Read-only, seekable file-like access to a remote resource, using a
+    range request for each block read.
+
+    The resource length and validator are obtained by an initial request
+    for the last `blocksize` bytes, which for a ZIP file usually includes
+    the central directory.  Subsequent requests use If-Range, so that if
+    the resource changes an error is raised rather than mixing content
+    from different versions.  The most recently fetched `maxblocks` blocks
+    are retained for re-reading.
+
+    session is a ROSRS_Session, which is used for all requests.  Usage
+    counters are available from `stats`.  If the server does not report
+    the resource length, `size` returns None until the end of the resource
+    has been read, and seeking relative to the end is not supported.
+
+    E.g. zipfile.ZipFile(RangeReader(session, uri)) reads entries from a
+    remote ZIP file without retrieving the whole file.
+    """
+
+    def __init__(self, session, uri, accept=None, blocksize=DEFAULT_BLOCKSIZE, maxblocks=4):
+        self._session   = session
+        self._uri       = uri
+        self._accept    = accept
+        self._blocksize = blocksize
+        self._maxblocks = maxblocks
+        self._blocks    = []        # (offset, data), most recently used last
+        self._pos       = 0
+        self._size      = None
+        self._validator = None
+        self._stats     = { "requests": 0, "bytes": 0 }
+        fetched = self.fetch("-%d"%blocksize)
+        if fetched is None:
+            self._size = 0          # Empty resource has no last bytes
+        else:
+            (headers, contentrange) = fetched
+            self._size      = contentrange[2]
+            self._validator = rangeValidator(headers)
+        return
+
+    def fetch(self, byterange):
+        """
+        Fetch and retain a block of the resource, given a range specifier.
+        Returns (headers, (first, last, length)) for the block received, or
+        None if the range starts beyond the end of a resource whose size
+        is not known.
+        """
+        reqheaders = { "range": "bytes="+byterange }
+        if self._validator:
+            reqheaders["if-range"] = self._validator
+        (status, reason, headers, uri, data) = self._session.doRequestFollowRedirect(
+            self._uri, method="GET", accept=self._accept, reqheaders=reqheaders, stream=True)
+        self._stats["requests"] += 1
+        if status == 416 and self._size is None:
+            return None
+        if status != 206:
+            if isinstance(data, ResponseStream): data.close()
+            if status == 200:
+                reason = "Resource changed, or range requests not supported"
+            raise self._session.error("Error reading range of %s"%self._uri,
+                "%03d %s"%(status, reason))
+        with data:
+            content = data.read()
+        contentrange = parseContentRange(headers.get("content-range"))
+        if contentrange is None or contentrange[1]+1-contentrange[0] != len(content):
+            raise self._session.error("Invalid partial content response",
+                "%s (%d bytes)"%(headers.get("content-range"), len(content)))
+        self._stats["bytes"] += len(content)
+        self._blocks.append( (contentrange[0], content) )
+        del self._blocks[:-self._maxblocks]
+        return (headers, contentrange)
+
+    def stats(self):
+        """
+        Return a copy of the usage counters:  "requests" and "bytes" received
+        """
+        return dict(self._stats)
+
+    def size(self):
+        return self._size
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=0):
+        if whence == 1:
+            offset += self._pos
+        elif whence == 2:
+            if self._size is None:
+                raise IOError("Resource size not known")
+            offset += self._size
+        if offset < 0:
+            raise IOError("Invalid seek offset %d"%offset)
+        self._pos = offset
+        return
+
+    def read(self, amt=None):
+        """
+        Read and return up to amt bytes from the current position, or
+        the remainder of the resource if amt is None.  If the server does
+        not report the size of the resource, blocks are read until one is
+        shorter than requested, or a range beyond the end is rejected.
+        """
+        stop  = None if amt is None or amt < 0 else self._pos+amt
+        parts = []
+        while True:
+            end = stop
+            if self._size is not None:
+                end = self._size if stop is None else min(self._size, stop)
+            if end is not None and self._pos >= end:
+                break
+            for (i, (offset, content)) in enumerate(self._blocks):
+                if offset <= self._pos < offset+len(content):
+                    data = content[self._pos-offset:None if end is None else end-offset]
+                    self._blocks.append(self._blocks.pop(i))
+                    break
+            else:
+                last = self._pos+max((end or 0)-self._pos, self._blocksize) - 1
+                if self._size is not None:
+                    last = min(self._size-1, last)
+                fetched = self.fetch("%d-%d"%(self._pos, last))
+                if fetched is None:
+                    break           # End of resource of unknown size
+                (first, received, length) = fetched[1]
+                if not (first <= self._pos <= received):
+                    raise self._session.error("Partial content response omits requested range",
+                        "%d-%d for %d-%d"%(first, received, self._pos, last))
+                if self._size is None and received < last:
+                    self._size = received+1     # Short block ends the resource
+                continue
+            parts.append(data)
+            self._pos += len(data)
+        return "".join(parts)
+
+    def close(self):
+        self._blocks = []
+        return
+
+# End.
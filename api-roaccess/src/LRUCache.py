@@ -0,0 +1,127 @@
+"""
+Thread-safe, size-bounded cache with least-recently-used eviction
+"""
+
+import threading
+import collections
+import logging
+
+# Logging object
+log = logging.getLogger(__name__)
+
+class LRUCache(object):
+    """
+    Dictionary-like cache holding at most `maxsize` units of content.
+
+    By default each entry counts as one unit;  if `sizeof` is supplied, it is
+    called with each value to determine the number of units that value
+    occupies.  When an entry is added that would exceed the cache size, the
+    least recently used entries are evicted to make room.
+
+    Usage counters (hits, misses, evictions) are available from `stats`.
+    """
+
+    def __init__(self, maxsize=100, sizeof=None):
+        self._maxsize = maxsize
+        self._sizeof  = sizeof or (lambda value: 1)
+        self._size    = 0
+        self._entries = collections.OrderedDict()   # key -> (value, size), most recent last
+        self._lock    = threading.Lock()
+        self._stats   = { "hits": 0, "misses": 0, "evictions": 0 }
+        return
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def keys(self):
+        """
+        Return list of keys in cache, least recently used first
+        """
+        with self._lock:
+            return self._entries.keys()
+
+    def values(self):
+        """
+        Return list of values in cache, least recently used first, without
+        affecting their order of use
+        """
+        with self._lock:
+            return [ value for (value, size) in self._entries.values() ]
+
+    def size(self):
+        """
+        Return total size of cached values
+        """
+        with self._lock:
+            return self._size
+
+    def stats(self):
+        """
+        Return a copy of the cache usage counters
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+            stats["size"]    = self._size
+        return stats
+
+    def get(self, key, default=None):
+        """
+        Return cached value for key, or default if not present
+        """
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                self._stats["misses"] += 1
+                return default
+            self._entries[key] = entry
+            self._stats["hits"] += 1
+            return entry[0]
+
+    def put(self, key, value):
+        """
+        Add or replace cache entry for key.  A value larger than the
+        entire cache is not stored.
+        """
+        size = self._sizeof(value)
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._size -= entry[1]
+            if size > self._maxsize:
+                return
+            while self._entries and self._size+size > self._maxsize:
+                (oldkey, (oldvalue, oldsize)) = self._entries.popitem(last=False)
+                self._size -= oldsize
+                self._stats["evictions"] += 1
+                log.debug("LRUCache.put: evict %s"%(repr(oldkey)))
+            self._entries[key] = (value, size)
+            self._size += size
+        return
+
+    def remove(self, key):
+        """
+        Remove entry for key, if present, and return its value (or None)
+        """
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return None
+            self._size -= entry[1]
+            return entry[0]
+
+    def clear(self):
+        """
+        Remove all entries from the cache
+        """
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+        return
+
+# End.
@@ -0,0 +1,106 @@
+"""
+Indexed in-memory model of an RO manifest
+"""
+
+import rdflib, rdflib.graph
+import logging
+
+from ro_namespaces import RDF, ORE, RO, AO
+
+# Logging object
+log = logging.getLogger(__name__)
+
+# Predicates that link an annotation to the resource(s) it annotates
+# @@TODO: in due course, remove RO.annotatesAggregatedResource?
+
+ANNOTATES_PREDICATES = [AO.annotatesResource, RO.annotatesAggregatedResource]
+
+class ROManifest(object):
+    """
+    RO manifest graph with precomputed indexes for the lookups used by
+    ROSRS_Session:  resource to proxy, proxy to resource, resource to
+    annotations and annotation to body.  The indexes are built once when
+    the manifest is created, so each lookup is a dictionary access rather
+    than a scan of the graph.
+
+    The manifest graph is available as `graph` for other queries.  The
+    indexes are not updated if the graph is changed.
+    """
+
+    def __init__(self, graph, rouri=None, manifesturi=None):
+        self.graph       = graph
+        self.rouri       = rouri and rdflib.URIRef(str(rouri))
+        self.manifesturi = manifesturi and rdflib.URIRef(str(manifesturi))
+        self._resourceproxies     = {}  # resource -> [proxy]
+        self._proxyresource       = {}  # proxy -> resource
+        self._resourceannotations = {}  # resource -> [annotation]
+        self._annotations         = []  # all annotations, in order found
+        self._annotationbody      = {}  # annotation -> body
+        for (p, r) in graph.subject_objects(predicate=ORE.proxyFor):
+            self._proxyresource[p] = r
+            self._resourceproxies.setdefault(r, []).append(p)
+        seen = set()
+        for pred in ANNOTATES_PREDICATES:
+            for (a, r) in graph.subject_objects(predicate=pred):
+                if (a, r) not in seen:
+                    seen.add( (a, r) )
+                    self._resourceannotations.setdefault(r, []).append(a)
+                if a not in seen:
+                    seen.add(a)
+                    self._annotations.append(a)
+        for (a, b) in graph.subject_objects(predicate=AO.body):
+            self._annotationbody[a] = b
+        log.debug("ROManifest: %d proxies, %d annotations"%
+            (len(self._proxyresource), len(self._annotations)))
+        return
+
+    def __contains__(self, triple):
+        return triple in self.graph
+
+    def __len__(self):
+        return len(self.graph)
+
+    def getProxy(self, resuri):
+        """
+        Return URI of the proxy for a resource, or None if there is not
+        exactly one such proxy.
+        """
+        proxies = self._resourceproxies.get(rdflib.URIRef(str(resuri)), [])
+        if len(proxies) == 1:
+            return proxies[0]
+        return None
+
+    def getProxies(self):
+        """
+        Return list of all proxy URIs
+        """
+        return self._proxyresource.keys()
+
+    def getProxyResource(self, proxyuri):
+        """
+        Return URI of the resource for which a proxy stands, or None
+        """
+        return self._proxyresource.get(rdflib.URIRef(str(proxyuri)))
+
+    def getAggregatedResources(self):
+        """
+        Return list of URIs of resources that have proxies in the RO
+        """
+        return self._resourceproxies.keys()
+
+    def getAnnotations(self, resuri=None):
+        """
+        Return list of URIs of annotations of a resource, or of all
+        annotations in the RO if resuri is None
+        """
+        if resuri is None:
+            return list(self._annotations)
+        return list(self._resourceannotations.get(rdflib.URIRef(str(resuri)), []))
+
+    def getAnnotationBody(self, annuri):
+        """
+        Return URI of annotation body, or None if not given in the manifest
+        """
+        return self._annotationbody.get(rdflib.URIRef(str(annuri)))
+
+# End.
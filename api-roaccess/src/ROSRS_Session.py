@@ -4,12 +4,26 @@ RO SRS session client implementation
 
 import json # Used for service/resource info parsing
 import re   # Used for link header parsing
+import os
+import sys
+import socket
 import httplib
+import urllib
 import urlparse
 import rdflib, rdflib.graph
+import time
 import logging
+import threading
+import zipfile
+import multiprocessing, multiprocessing.pool
 
 from ro_namespaces import RDF, ORE, RO, AO, DCTERMS
+from HttpConnectionPool import HttpConnectionPool, ResponseStream
+from HttpRange import RangeReader, parseContentRange, rangeValidator, DEFAULT_BLOCKSIZE
+from LRUCache import LRUCache
+from RequestTrace import LogTrace
+from RequestMetrics import instrumented, currentOperation, inCurrentOperation
+from ROManifest import ROManifest
 
 # Logging object
 log = logging.getLogger(__name__)
@@ -40,6 +54,32 @@ ANNOTATION_TEMPLATE = ("""<?xml version="1.0" encoding="UTF-8"?>
     </rdf:RDF>
     """)
 
+# Annotation body parsing, in a worker process used by getROAnnotationGraph
+
+def parseAnnotationBody(bodyuri, data, bodyformat):
+    """
+    Parse annotation body, and return (triples, error), where triples is
+    a list of the RDF triples in the body, or None if it cannot be parsed,
+    in which case error is a description of the failure.
+    """
+    try:
+        graph = rdflib.graph.Graph()
+        graph.parse(data=data, format=bodyformat, publicID=bodyuri)
+        return (list(graph), None)
+    except Exception, e:
+        return (None, str(e))
+
+# Redirect status codes followed by ROSRS_Session.followRedirects, and those
+# whose targets are remembered for later requests
+
+REDIRECT_STATUSES        = frozenset([301, 302, 303, 307, 308])
+CACHED_REDIRECT_STATUSES = frozenset([301, 303, 308])
+
+# Request headers for which the session HTTP cache is not used
+
+CONDITIONAL_HEADERS = frozenset(
+    ["if-none-match", "if-modified-since", "if-match", "if-unmodified-since", "if-range", "range"])
+
 # Class for ROSRS errors
 
 class ROSRS_Error(Exception):
@@ -104,28 +144,125 @@ def testSplitValues():
     assert splitValues('a;<b;c>;d', ";") == ['a','<b;c>','d']
     assert splitValues('"a;b";(c;d);e', ";", lq='"(', rq='")') == ['"a;b"','(c;d)','e']
 
+# Link header parsing (RFC 5988)
+#
+# Each match of LINK_TOKEN_RE consumes optional whitespace and one token of a
+# Link header value: a bracketed target URI, a parameter (with optional token
+# or quoted-string value), a comma separating link values, or the end of the
+# header.  A header is parsed in a single left-to-right pass.
+
+LINK_TOKEN_RE = re.compile(r'''\s*(?:
+      <(?P<uri>[^>]*)>
+    | ;\s*(?P<name>[^\s=;,]+)\s*(?:=\s*(?:"(?P<quoted>(?:[^"\\]|\\.)*)"|(?P<token>[^\s;,]*)))?
+    | (?P<comma>,)
+    | (?P<end>$)
+    )''', re.VERBOSE)
+
+LINK_SKIP_RE  = re.compile(r'''(?:[^,"<]|"(?:[^"\\]|\\.)*"?|<[^>]*>?)*''')
+QUOTED_PAIR_RE = re.compile(r'''\\(.)''')
+
+def decodeExtValue(value):
+    """
+    Decode RFC 5987 extended parameter value (charset'language'pct-encoded),
+    returning a unicode string, or the value unchanged if it cannot be decoded
+    """
+    try:
+        (charset, language, encoded) = value.split("'", 2)
+        return urllib.unquote(encoded).decode(charset or "utf-8")
+    except (ValueError, LookupError, UnicodeError):
+        return value
+
+def parseLinkHeader(linkheader, links=None):
+    """
+    Helper function to parse a single 'link:' header value, returning a list
+    of (uri, params) pairs, where params is a dictionary of link parameters
+    (e.g. "rel", "anchor", "type", "title", "title*") keyed by lowercase
+    parameter name.  Only the first occurrence of a parameter is used.
+    Values of extended parameters (name ending "*") are decoded.
+
+    If links is supplied, parsed links are appended to it.
+
+    A malformed link value is skipped, and parsing resumes at the next link.
+    """
+    if links is None: links = []
+    match  = LINK_TOKEN_RE.match
+    pos    = 0
+    uri    = None
+    params = None
+    while True:
+        m = match(linkheader, pos)
+        if m is None:
+            # Skip malformed link value, resuming after next separating comma
+            log.debug("parseLinkHeader: skip malformed link at %d in %r", pos, linkheader)
+            uri = None
+            pos = LINK_SKIP_RE.match(linkheader, pos).end()
+            if pos >= len(linkheader): break
+            pos += 1
+            continue
+        pos = m.end()
+        if m.lastgroup == "uri":
+            if uri is not None:
+                links.append( (uri, params) )
+            uri    = m.group("uri")
+            params = {}
+        elif m.lastgroup in ("comma", "end"):
+            if uri is not None:
+                links.append( (uri, params) )
+            uri = None
+            if m.lastgroup == "end": break
+        elif uri is None:
+            continue            # parameter without link target: ignore
+        else:
+            name  = m.group("name").lower()
+            value = m.group("quoted")
+            if value is None:
+                value = m.group("token") or ""
+            elif "\\" in value:
+                value = QUOTED_PAIR_RE.sub(r"\1", value)
+            if name.endswith("*"):
+                value = decodeExtValue(value)
+            if name not in params:
+                params[name] = value
+    return links
+
+def parseLinkHeaders(headerlist):
+    """
+    Helper function to parse all 'link:' headers in a list of header
+    (name,value) pairs, returning a list of (uri, params) pairs as described
+    for parseLinkHeader, in the order they appear.
+    """
+    links = []
+    for (h,v) in headerlist:
+        if h.lower() == "link":
+            parseLinkHeader(v, links)
+    return links
+
+def linkRelations(links):
+    """
+    Return dictionary keyed by link relation type of lists of target URIs,
+    for a list of links returned by parseLinkHeaders.  A link whose rel
+    parameter contains several space-separated relation types is listed for
+    each of them.
+    """
+    rels = {}
+    for (uri, params) in links:
+        for rel in params.get("rel", "").split():
+            rels.setdefault(rel, []).append(rdflib.URIRef(uri))
+    return rels
+
 def parseLinks(headerlist):
     """
     Helper function to parse 'link:' headers,
     returning a dictionary of links keyed by link relation type
+
+    Where there are several links with the same relation type, the last is
+    used;  see parseLinkHeaders and linkRelations for access to all links.
     
     headerlist is a list of header (name,value) pairs
     """
-    linkheaders = [ v for (h,v) in headerlist if h.lower() == "link" ]
-    log.debug("parseLinks linkheaders %s"%(repr(linkheaders)))
-    links = {}
-    for linkheader in linkheaders:
-        for linkval in splitValues(linkheader, ","):
-            linkparts = splitValues(linkval, ";")
-            linkmatch = re.match(r'''\s*<([^>]*)>\s*''', linkparts[0])
-            if linkmatch:
-                linkuri   = linkmatch.group(1)
-                for linkparam in linkparts[1:]:
-                    linkmatch = re.match(r'''\s*rel\s*=\s*"?(.*?)"?\s*$''', linkparam)  # .*? is non-greedy
-                    if linkmatch:
-                        linkrel = linkmatch.group(1)
-                        log.debug("parseLinks links[%s] = %s"%(linkrel, linkuri))
-                        links[linkrel] = rdflib.URIRef(linkuri)
+    links = dict([ (rel, uris[-1])
+                   for (rel, uris) in linkRelations(parseLinkHeaders(headerlist)).items() ])
+    log.debug("parseLinks links %r", links)
     return links
 
 def testParseLinks():
@@ -144,6 +281,27 @@ def testParseLinks():
     assert str(parseLinks(links)['http://example.org/rel/fum']) == 'http://example.org/fum'
     assert str(parseLinks(links)['http://example.org/rel/fas']) == 'http://example.org/fas;far'
 
+def testParseLinkHeaders():
+    links = parseLinkHeaders((
+        ('Link', '<http://example.org/a>; rel="item"; type="text/plain", '
+                 '<http://example.org/b>; rel="item alternate"; anchor="#x"; title="B, \\"quoted\\""'),
+        ('Link', "<http://example.org/c>; rel=item; title*=UTF-8'en'%e2%82%ac%20rates"),
+        ('Link', '<http://example.org/d>; rel="x"; junk "bad", <http://example.org/e>; rel=next'),
+        ('Link', ' <http://example.org/f;g> ; REL = "last" ; rel = "ignored" '),
+        ))
+    assert [ u for (u, p) in links ] == (
+        [ 'http://example.org/a', 'http://example.org/b', 'http://example.org/c'
+        , 'http://example.org/e', 'http://example.org/f;g' ])
+    assert links[0][1] == { 'rel': 'item', 'type': 'text/plain' }
+    assert links[1][1] == { 'rel': 'item alternate', 'anchor': '#x', 'title': 'B, "quoted"' }
+    assert links[2][1]['title*'] == u'\u20ac rates'
+    assert links[4][1] == { 'rel': 'last' }
+    rels = linkRelations(links)
+    assert [ str(u) for u in rels['item'] ] == (
+        [ 'http://example.org/a', 'http://example.org/b', 'http://example.org/c' ])
+    assert [ str(u) for u in rels['alternate'] ] == [ 'http://example.org/b' ]
+    assert [ str(u) for u in rels['next'] ] == [ 'http://example.org/e' ]
+
 # Class for handling ROSRS access
 
 class ROSRS_Session(object):
@@ -158,9 +316,43 @@ class ROSRS_Session(object):
     
     Related:
     * http://www.wf4ever-project.org/wiki/display/docs/User+Management+2
+
+    A session may be shared by several threads:  requests are issued over a
+    bounded pool of persistent connections to the ROSRS host (see
+    HttpConnectionPool), where maxconnections limits the number of
+    concurrent requests and idletimeout is the time in seconds after which
+    an unused connection is discarded.  For an https: ROSRS URI, sslcontext
+    may be supplied to control certificate validation;  otherwise a shared
+    default SSL context is used.
+
+    RO manifests are cached (see getROManifest), where manifestcachesize is
+    the maximum number of manifests held.  Annotation body URIs obtained from
+    annotation redirects are remembered for the session, up to
+    annbodycachesize entries (see getROAnnotationBodyUri).  Redirects are
+    followed up to `maxredirects` hops, and permanent and 303 redirects are
+    remembered, up to redirectcachesize entries (see followRedirects).
+
+    If `httpcache` is supplied, it is an HttpCache object that is used to
+    cache responses to GET requests (other than streamed and conditional
+    requests), and which may be shared with other sessions:  responses are
+    cached separately for each access key.
+
+    Requests are reported to `trace`, a RequestTrace object;  by default,
+    a LogTrace that writes to this module's logger at DEBUG level.
+
+    If `retrypolicy` is supplied, failed requests are retried and failing
+    hosts are avoided as determined by that RetryPolicy object.
+
+    If `metrics` is supplied, it is a RequestMetrics.MetricsSink to which
+    request timings, byte counts and connection reuse are reported, labelled
+    with the HTTP method and the session operation (e.g. "createRO") in
+    progress.  For a streamed response, body transfer is not recorded.
     """
 
-    def __init__(self, srsuri, accesskey):
+    def __init__(self, srsuri, accesskey, maxconnections=4, idletimeout=30.0, sslcontext=None,
+            manifestcachesize=32, annbodycachesize=1000, trace=None,
+            retrypolicy=None, metrics=None, maxredirects=5, redirectcachesize=1000,
+            httpcache=None):
         log.debug("ROSRS_Session.__init__: srsuri "+srsuri)
         self._srsuri    = srsuri
         self._key       = accesskey
@@ -168,12 +360,21 @@ class ROSRS_Session(object):
         self._srsscheme = parseduri.scheme
         self._srshost   = parseduri.netloc
         self._srspath   = parseduri.path
-        self._httpcon   = httplib.HTTPConnection(self._srshost)
+        self._httppool  = HttpConnectionPool(self._srshost, scheme=self._srsscheme,
+            maxsize=maxconnections, idletimeout=idletimeout, sslcontext=sslcontext)
+        self._manifestcache = LRUCache(maxsize=manifestcachesize)
+        self._annbodycache  = LRUCache(maxsize=annbodycachesize)
+        self._redirectcache = LRUCache(maxsize=redirectcachesize)
+        self._maxredirects  = maxredirects
+        self._trace         = trace or LogTrace(log)
+        self._retrypolicy   = retrypolicy
+        self._metrics       = metrics
+        self._httpcache     = httpcache
         return
 
     def close(self):
         self._key = None
-        self._httpcon.close()
+        self._httppool.close()
         return
 
     def baseuri(self):
@@ -182,16 +383,36 @@ class ROSRS_Session(object):
     def error(self, msg, value=None):
         return ROSRS_Error(msg=msg, value=value, srsuri=self._srsuri)
 
+    def absoluteUri(self, uriref):
+        """
+        Return absolute URI string for a URI reference relative to the ROSRS URI
+        """
+        return urlparse.urljoin(self._srsuri, str(uriref))
+
     def parseLinks(self, headers):
         """
         Parse link header(s), return dictionary of links keyed by link relation type
         """
         return parseLinks(headers["_headerlist"])
 
-    def doRequest(self, uripath, method="GET", body=None, ctype=None, accept=None, reqheaders=None):
+    def parseLinkHeaders(self, headers):
+        """
+        Parse link header(s), return list of (uri, params) for all links
+        """
+        return parseLinkHeaders(headers["_headerlist"])
+
+    def doRequest(self, uripath, method="GET", body=None, ctype=None, accept=None, reqheaders=None,
+            stream=False, progress=None):
         """
         Perform HTTP request to ROSRS
         Return status, reason(text), response headers, response body
+
+        The request body may be a string, an open file (or mmap) object, or an
+        iterator over strings;  see HttpConnectionPool.sendRequest.  progress,
+        if supplied, is called as progress(sent, total) as the body is sent.
+
+        If stream is True, the body of a 2xx response is returned as a
+        ResponseStream, which must be read to the end or closed by the caller.
         """
         # Sort out path to use in HTTP request: request may be path or full URI or rdflib.URIRef
         uripath = str(uripath)        # get URI string from rdflib.URIRef
@@ -210,54 +431,249 @@ class ROSRS_Session(object):
                     srsuri=self._srsuri)
         path = uriparts.path
         if uriparts.query: path += "?"+uriparts.query
-        # Assemble request headers
-        if not reqheaders:
-            reqheaders = {}
+        # Assemble request headers (copied, as the session may be shared between threads)
+        reqheaders = dict(reqheaders or {})
         reqheaders["authorization"] = "Bearer "+self._key
         if ctype:
             reqheaders["content-type"] = ctype
         if accept:
             reqheaders["accept"] = accept
         # Execute request
-        log.debug("ROSRS_Session.doRequest method:     "+method)
-        log.debug("ROSRS_Session.doRequest path:       "+path)
-        log.debug("ROSRS_Session.doRequest reqheaders: "+repr(reqheaders))
-        log.debug("ROSRS_Session.doRequest body:       "+repr(body))
-        self._httpcon.request(method, path, body, reqheaders)
+        if self._httpcache is None:
+            return self.doRequestUncached(method, path, body, reqheaders, stream, progress)
+        cacheuri = "%s://%s%s"%(self._srsscheme, self._srshost, path)
+        if ( method == "GET" and not stream and
+             not CONDITIONAL_HEADERS.intersection([ h.lower() for h in reqheaders ]) ):
+            return self.doRequestCached(cacheuri, path, reqheaders)
+        (status, reason, headers, data) = self.doRequestUncached(
+            method, path, body, reqheaders, stream, progress)
+        if method not in ["GET", "HEAD"] and status < 400:
+            # Unsafe request invalidates cached responses (RFC 7234, section 4.4)
+            for uri in [cacheuri, headers.get("location"), headers.get("content-location")]:
+                if uri: self._httpcache.invalidate(urlparse.urljoin(cacheuri, uri))
+        return (status, reason, headers, data)
+
+    def doRequestUncached(self, method, path, body, reqheaders, stream, progress):
+        """
+        Issue HTTP request to ROSRS for doRequest, applying any retry policy
+        Return status, reason(text), response headers, response body
+        """
+        if self._retrypolicy:
+            return self._retrypolicy.execute(self._srshost, method, body,
+                lambda: self.doSingleRequest(method, path, body, reqheaders, stream, progress))
+        return self.doSingleRequest(method, path, body, reqheaders, stream, progress)
+
+    def doRequestCached(self, cacheuri, path, reqheaders):
+        """
+        Issue GET request to ROSRS for doRequest, using the session HTTP cache
+        Return status, reason(text), response headers, response body
+
+        A fresh cached response is returned without contacting the server.
+        A stale cached response is revalidated with a conditional request,
+        and returned if the server responds 304 (Not Modified).
+        """
+        cache = self._httpcache
+        entry = cache.lookup(cacheuri, reqheaders)
+        if entry and cache.isFresh(entry, reqheaders):
+            response = cache.response(entry)
+            if response:
+                cache.count("hits")
+                return response
+            entry = None
+        cache.count("misses")
+        condheaders = dict(reqheaders)
+        if entry:
+            condheaders.update(entry.validators())
+        requesttime = cache.now()
+        (status, reason, headers, data) = self.doRequestUncached(
+            "GET", path, None, condheaders, False, None)
+        responsetime = cache.now()
+        if status == 304 and entry:
+            response = cache.response(cache.update(entry, headers, requesttime, responsetime))
+            if response:
+                return response
+            # Cached content has gone: repeat request without validators
+            return self.doRequestUncached("GET", path, None, reqheaders, False, None)
+        if data is not None:
+            cache.store(cacheuri, reqheaders, status, reason, headers, data,
+                requesttime, responsetime)
+        elif status in [404, 410]:
+            cache.invalidate(cacheuri)
+        return (status, reason, headers, data)
+
+    def doSingleRequest(self, method, path, body, reqheaders, stream, progress):
+        """
+        Issue a single HTTP request to ROSRS for doRequest, without retry
+        Return status, reason(text), response headers, response body
+        """
+        tracing = self._trace.isEnabled()
+        metrics = self._metrics
+        timings = None
+        if tracing or metrics:
+            starttime = time.time()
+        if tracing:
+            self._trace.traceRequest(method, path, reqheaders, body)
+        if metrics:
+            timings = {}
+        try:
+            (httpcon, response) = self._httppool.request(method, path, body, reqheaders,
+                progress=progress, timings=timings)
+        except:
+            if metrics:
+                self.recordRequestError(method, starttime)
+            raise
+        if metrics:
+            readtime = time.time()
         # Pick out elements of response
-        response = self._httpcon.getresponse()
         status   = response.status
         reason   = response.reason
         headerlist = [ (h.lower(),v) for (h,v) in response.getheaders() ]
         headers  = dict(headerlist)   # dict(...) keeps last result of multiple keys
         headers["_headerlist"] = headerlist
-        data = response.read()
-        if status < 200 or status >= 300: data = None
-        log.debug("ROSRS_Session.doRequest response: "+str(status)+" "+reason)
-        log.debug("ROSRS_Session.doRequest headers:  "+repr(headers))
-        log.debug("ROSRS_Session.doRequest data:     "+repr(data))
+        if stream and status >= 200 and status < 300:
+            data = ResponseStream(self._httppool, httpcon, response)
+            size = data.length()
+        else:
+            try:
+                data = response.read()
+            except:
+                self._httppool.release(httpcon, reuse=False)
+                if metrics:
+                    self.recordRequestError(method, starttime)
+                raise
+            self._httppool.release(httpcon)
+            size = len(data)
+            if status < 200 or status >= 300: data = None
+        if metrics:
+            self.recordRequestMetrics(method, status, timings, starttime, readtime,
+                None if isinstance(data, ResponseStream) else size)
+        if tracing:
+            self._trace.traceResponse(
+                { "method":     method
+                , "path":       path
+                , "reqheaders": reqheaders
+                , "body":       body
+                , "status":     status
+                , "reason":     reason
+                , "headers":    headers
+                , "data":       data
+                , "bytes":      size
+                , "elapsed":    time.time()-starttime
+                })
         return (status, reason, headers, data)
 
-    def doRequestFollowRedirect(self, uripath, method="GET", body=None, ctype=None, accept=None, reqheaders=None):
+    def recordRequestMetrics(self, method, status, timings, starttime, readtime, size):
+        """
+        Report request timings and sizes to metrics sink.  size is the
+        response body length, or None for a streamed response.
+        """
+        metrics  = self._metrics
+        endtime  = time.time()
+        labels   = { "method": method, "operation": currentOperation() }
+        if "connect" in timings:
+            metrics.observe("connect_seconds", { "operation": labels["operation"] },
+                timings["connect"])
+        metrics.observe("first_byte_seconds", labels, timings["send"]+timings["wait"])
+        if size is not None:
+            metrics.observe("transfer_seconds", labels, endtime-readtime)
+            metrics.observe("request_seconds", labels, endtime-starttime)
+            metrics.increment("bytes_received_total", labels, size)
+        metrics.increment("bytes_sent_total", labels, timings["sent"])
+        metrics.increment("requests_total", dict(labels, status=str(status)))
+        metrics.increment("connections_total",
+            { "reused": "true" if timings["reused"] else "false" })
+        return
+
+    def recordRequestError(self, method, starttime):
+        """
+        Report request that raised an exception before its response was
+        read to metrics sink, counted with status "error"
+        """
+        labels = { "method": method, "operation": currentOperation() }
+        self._metrics.observe("request_seconds", labels, time.time()-starttime)
+        self._metrics.increment("requests_total", dict(labels, status="error"))
+        return
+
+    def doRequestFollowRedirect(self, uripath, method="GET", body=None, ctype=None, accept=None, reqheaders=None,
+            stream=False):
         """
         Perform HTTP request to ROSRS, following any redirect returned
         Return status, reason(text), response headers, final uri, response body
+
+        See followRedirects for details of redirect handling.
         """
-        (status, reason, headers, data) = self.doRequest(uripath,
-            method=method, accept=accept,
-            body=body, ctype=ctype, reqheaders=reqheaders)
-        if status in [302,303,307]:
-            uripath = headers["location"]
-            (status, reason, headers, data) = self.doRequest(uripath,
-                method=method, accept=accept,
-                body=body, ctype=ctype, reqheaders=reqheaders)
-        if status == 302:
-            # Allow second temporary redirect
-            uripath = headers["location"]
-            (status, reason, headers, data) = self.doRequest(uripath,
-                method=method,
-                body=body, ctype=ctype, reqheaders=reqheaders)
-        return (status, reason, headers, rdflib.URIRef(uripath), data)
+        def request(uri, method, body):
+            return self.doRequest(uri, method=method, body=body,
+                ctype=ctype, accept=accept, reqheaders=reqheaders, stream=stream)
+        return self.followRedirects(request, uripath, method, body, accept)
+
+    def followRedirects(self, request, uripath, method, body, accept):
+        """
+        Issue a request using the supplied function, following redirects
+        Return status, reason(text), response headers, final uri, response body
+
+        request(uri, method, body) issues a single request and returns
+        (status, reason, headers, data).  Each redirect is followed with the
+        same method, body and request headers, except that a 303 response to
+        a POST is followed with a GET without a body.  Up to `maxredirects`
+        redirects are followed;  exceeding that limit, or a redirect to a URI
+        already visited, raises ROSRS_Error.
+
+        For GET and HEAD requests, 301, 303 and 308 redirects are remembered
+        by the session (for the accept header used), so that a later request
+        to the same URI goes directly to the redirect target.  If a
+        remembered target is not found, the redirects are discarded and the
+        request is repeated from the original URI.
+        """
+        starturi  = self.absoluteUri(uripath)
+        cacheable = method in ["GET", "HEAD"]
+        # Skip redirects known from previous requests
+        uri     = starturi
+        skipped = []
+        if cacheable:
+            while len(skipped) < self._maxredirects:
+                target = self._redirectcache.get( (uri, accept) )
+                if target is None or target == starturi or target in skipped: break
+                skipped.append(uri)
+                uri = target
+        bodypos = None
+        if hasattr(body, "seek") and hasattr(body, "tell"):
+            bodypos = body.tell()
+        visited = set()
+        while True:
+            visited.add(uri)
+            (status, reason, headers, data) = request(uri, method, body)
+            if status in [404, 410] and skipped:
+                log.debug("followRedirects: discard redirects from %s", starturi)
+                for u in skipped:
+                    self._redirectcache.remove( (u, accept) )
+                if bodypos is not None: body.seek(bodypos)
+                return self.followRedirects(request, starturi, method, body, accept)
+            if status not in REDIRECT_STATUSES or "location" not in headers:
+                return (status, reason, headers, rdflib.URIRef(uri), data)
+            target = urlparse.urljoin(uri, headers["location"])
+            if cacheable and status in CACHED_REDIRECT_STATUSES:
+                self._redirectcache.put( (uri, accept), target )
+            if status == 303 and method == "POST":
+                (method, body, bodypos) = ("GET", None, None)
+            if target in visited:
+                raise self.error("Redirect loop", "%03d %s to %s"%(status, reason, target))
+            if len(visited) > self._maxredirects:
+                raise self.error("Too many redirects", "%03d %s to %s"%(status, reason, target))
+            if bodypos is not None:
+                body.seek(bodypos)
+            uri = target
+
+    def invalidateRedirects(self, uri, subtree=False):
+        """
+        Discard remembered redirects from the given URI, or if subtree is
+        True, from all URIs that start with the given URI
+        """
+        uri = self.absoluteUri(uri)
+        for key in self._redirectcache.keys():
+            if key[0] == uri or (subtree and key[0].startswith(uri)):
+                self._redirectcache.remove(key)
+        return
 
     def doRequestRDF(self, uripath, method="GET", body=None, ctype=None, reqheaders=None):
         """
@@ -274,7 +690,11 @@ class ROSRS_Session(object):
             if headers["content-type"].lower() == "application/rdf+xml":
                 rdfgraph = rdflib.graph.Graph()
                 try:
+                    starttime = time.time()
                     rdfgraph.parse(data=data, format="xml")
+                    if self._metrics:
+                        self._metrics.observe("rdf_parse_seconds",
+                            { "operation": currentOperation() }, time.time()-starttime)
                     data = rdfgraph
                 except Exception, e:
                     status   = 902
@@ -289,16 +709,12 @@ class ROSRS_Session(object):
         Perform HTTP request to ROSRS, following any redirect returned
         Return status, reason(text), response headers, final uri, response body
         """
-        (status, reason, headers, data) = self.doRequestRDF(uripath,
-            method=method,
-            body=body, ctype=ctype, reqheaders=reqheaders)
-        if status in [302,303,307]:
-            uripath = headers["location"]
-            (status, reason, headers, data) = self.doRequestRDF(uripath,
-                method=method,
-                body=body, ctype=ctype, reqheaders=reqheaders)
-        return (status, reason, headers, rdflib.URIRef(uripath), data)
+        def request(uri, method, body):
+            return self.doRequestRDF(uri, method=method, body=body,
+                ctype=ctype, reqheaders=reqheaders)
+        return self.followRedirects(request, uripath, method, body, "application/rdf+xml")
 
+    @instrumented
     def listROs(self):
         """
         List ROs in service
@@ -308,10 +724,11 @@ class ROSRS_Session(object):
         (status, reason, headers, data) = self.doRequest("")
         if status < 200 or status >= 300:
             raise self.error("Error listing ROs", "%03d %s"%(status, reason))
-        log.debug("ROSRS_session.listROs: %s"%(repr(data)))
+        log.debug("ROSRS_session.listROs: %r", data)
         urilist = data.splitlines()
         return [ { "uri" : u } for u in urilist ]
 
+    @instrumented
     def createRO(self, id, title, creator, date):
         """
         Create a new RO, return (status, reason, uri, manifest):
@@ -331,7 +748,7 @@ class ROSRS_Session(object):
         roinfotext = json.dumps(roinfo)
         (status, reason, headers, data) = self.doRequestRDF("",
             method="POST", body=roinfotext, reqheaders=reqheaders)
-        log.debug("ROSRS_session.createRO: %03d %s: %s"%(status, reason, repr(data)))
+        log.debug("ROSRS_session.createRO: %03d %s: %r", status, reason, data)
         if status == 201:
             return (status, reason, rdflib.URIRef(headers["location"]), data)
         if status == 409:
@@ -339,6 +756,7 @@ class ROSRS_Session(object):
         #@@TODO: Create annotations for title, creator, date??
         raise self.error("Error creating RO", "%03d %s"%(status, reason))
 
+    @instrumented
     def deleteRO(self, rouri):
         """
         Delete an RO
@@ -347,24 +765,32 @@ class ROSRS_Session(object):
         (status, reason, headers, data) = self.doRequest(rouri,
             method="DELETE",
             accept="application/rdf+xml")
+        self.invalidateManifest(rouri)
+        self.invalidateRedirects(rouri, subtree=True)
         if status in [204, 404]:
             return (status, reason)
         raise self.error("Error deleting RO", "%03d %s"%(status, reason))
 
-    def getROResource(self, resuriref, rouri=None, accept=None, reqheaders=None):
+    @instrumented
+    def getROResource(self, resuriref, rouri=None, accept=None, reqheaders=None, stream=False):
         """
         Retrieve resource from RO
         Return (status, reason, headers, data), where status is 200 or 404 or redirect code
+
+        If stream is True, data for a 200 response is a ResponseStream
+        from which the resource content can be read incrementally.
         """
         resuri = str(resuriref)
         if rouri:
             resuri = urlparse.urljoin(str(rouri), resuri)
         (status, reason, headers, uri, data) = self.doRequestFollowRedirect(resuri,
-            method="GET", accept=accept, reqheaders=reqheaders)
+            method="GET", accept=accept, reqheaders=reqheaders, stream=stream)
         if status in [200, 404]:
             return (status, reason, headers, uri, data)
+        if isinstance(data, ResponseStream): data.close()
         raise self.error("Error retrieving RO resource", "%03d %s (%s)"%(status, reason, resuriref))
 
+    @instrumented
     def getROResourceRDF(self, resuriref, rouri=None, reqheaders=None):
         """
         Retrieve RDF resource from RO
@@ -379,36 +805,97 @@ class ROSRS_Session(object):
             return (status, reason, headers, uri, data)
         raise self.error("Error retrieving RO RDF resource", "%03d %s (%s)"%(status, reason, resuriref))
 
+    @instrumented
     def getROResourceProxy(self, resuriref, rouri):
         """
         Retrieve proxy description for resource.
         Return (proxyuri, manifest)
         """
-        (status, reason, headers, manifesturi, manifest) = self.getROManifest(rouri)
+        (status, reason, headers, manifesturi, romanifest) = self.getROManifestModel(rouri)
         if status not in [200,404]:
             raise self.error("Error retrieving RO manifest", "%03d %s"%
                              (status, reason))
         proxyuri = None
+        manifest = None
         if status == 200:
-            resuri = rdflib.URIRef(urlparse.urljoin(str(rouri), str(resuriref)))
-            proxyterms = list(manifest.subjects(predicate=ORE.proxyFor, object=resuri))
-            log.debug("getROResourceProxy proxyterms: %s"%(repr(proxyterms)))
-            if len(proxyterms) == 1:
-                proxyuri = proxyterms[0]
+            resuri   = urlparse.urljoin(str(rouri), str(resuriref))
+            proxyuri = romanifest.getProxy(resuri)
+            manifest = romanifest.graph
+            log.debug("getROResourceProxy proxyuri: %s"%(repr(proxyuri)))
         return (status, reason, proxyuri, manifest)
 
+    @instrumented
     def getROManifest(self, rouri):
         """
         Retrieve an RO manifest
         Return (status, reason, headers, uri, data), where status is 200 or 404
+
+        Manifests returned with an ETag or Last-Modified header are cached by
+        the session (see getROManifestModel).  The manifest graph may be
+        shared with other callers, so must not be modified.
+        """
+        (status, reason, headers, uri, data) = self.getROManifestModel(rouri)
+        if isinstance(data, ROManifest):
+            data = data.graph
+        return (status, reason, headers, uri, data)
+
+    @instrumented
+    def getROManifestModel(self, rouri):
         """
+        Retrieve an RO manifest as an indexed ROManifest object
+        Return (status, reason, headers, uri, data), where status is 200 or 404
+
+        Manifests returned with an ETag or Last-Modified header are cached by
+        the session.  A cached manifest is revalidated with a conditional GET
+        to the manifest URI, and is re-used if the server responds 304 (Not
+        Modified).  Cached manifests are discarded when the session modifies
+        the RO.
+        """
+        rokey = self.absoluteUri(rouri)
+        entry = self._manifestcache.get(rokey)
+        if entry:
+            (headers, uri, data) = entry
+            condheaders = {}
+            if "etag" in headers:
+                condheaders["if-none-match"] = headers["etag"]
+            if "last-modified" in headers:
+                condheaders["if-modified-since"] = headers["last-modified"]
+            (status, reason, newheaders, newdata) = self.doRequestRDF(uri,
+                method="GET", reqheaders=condheaders)
+            if status == 304:
+                log.debug("getROManifest: revalidated cached manifest %s"%(uri))
+                return (200, "OK", headers, uri, data)
+            self._manifestcache.remove(rokey)
+            if status == 200:
+                newdata = ROManifest(newdata, rokey, uri)
+                self.cacheManifest(rokey, newheaders, uri, newdata)
+                return (status, reason, newheaders, uri, newdata)
         (status, reason, headers, uri, data) = self.doRequestRDFFollowRedirect(rouri,
             method="GET")
         if status in [200, 404]:
+            if status == 200:
+                data = ROManifest(data, rokey, uri)
+                self.cacheManifest(rokey, headers, uri, data)
             return (status, reason, headers, uri, data)
         raise self.error("Error retrieving RO manifest",
             "%03d %s"%(status, reason))
 
+    def cacheManifest(self, rokey, headers, uri, manifest):
+        """
+        Save manifest in cache, if it has a validator for later revalidation
+        """
+        if "etag" in headers or "last-modified" in headers:
+            self._manifestcache.put(rokey, (headers, uri, manifest))
+        return
+
+    def invalidateManifest(self, rouri):
+        """
+        Discard any cached manifest for an RO
+        """
+        self._manifestcache.remove(self.absoluteUri(rouri))
+        return
+
+    @instrumented
     def getROLandingPage(self, rouri):
         """
         Retrieve an RO landing page
@@ -421,23 +908,142 @@ class ROSRS_Session(object):
         raise self.error("Error retrieving RO landing page",
             "%03d %s"%(status, reason))
 
-    def getROZip(self, rouri):
+    @instrumented
+    def getROZip(self, rouri, stream=False):
         """
         Retrieve an RO as ZIP file
         Return (status, reason, headers, data), where status is 200 or 404
+
+        If stream is True, data for a 200 response is a ResponseStream;
+        e.g. use data.downloadTo(path) to save the ZIP file.
         """
         (status, reason, headers, uri, data) = self.doRequestFollowRedirect(rouri,
-            method="GET", accept="application/zip")
+            method="GET", accept="application/zip", stream=stream)
         if status in [200, 404]:
             return (status, reason, headers, uri, data)
+        if isinstance(data, ResponseStream): data.close()
+        raise self.error("Error retrieving RO as ZIP file",
+            "%03d %s"%(status, reason))
+
+    @instrumented
+    def getROZipTo(self, rouri, path, maxresumes=5, progress=None):
+        """
+        Download an RO as ZIP file to the named local file, resuming an
+        interrupted transfer (see downloadResource)
+        Return (status, reason, headers, uri, size), where status is 200 or 404
+        """
+        (status, reason, headers, uri, size) = self.downloadResource(rouri, path,
+            accept="application/zip", maxresumes=maxresumes, progress=progress)
+        if status in [200, 404]:
+            return (status, reason, headers, uri, size)
         raise self.error("Error retrieving RO as ZIP file",
             "%03d %s"%(status, reason))
 
+    @instrumented
+    def openROZip(self, rouri, blocksize=DEFAULT_BLOCKSIZE):
+        """
+        Open an RO as a remote ZIP file, without retrieving the whole file
+        Return a zipfile.ZipFile object
+
+        The ZIP central directory and the content of each entry read are
+        retrieved using range requests (see HttpRange.RangeReader), so that
+        e.g. openROZip(rouri).read(".ro/manifest.rdf") transfers little more
+        than the manifest, however large the RO.
+        """
+        return zipfile.ZipFile(RangeReader(self, rouri, accept="application/zip",
+            blocksize=blocksize))
+
+    def downloadResource(self, uripath, path, accept=None, maxresumes=5, progress=None):
+        """
+        Download a resource to the named local file
+        Return (status, reason, headers, uri, size), where size is the
+        number of bytes in the downloaded file, or None if not successful
+
+        Content is written to path+".part", which is renamed to path when
+        the download is complete.  If the connection fails before then, the
+        download is resumed with a range request, up to `maxresumes` times;
+        If-Range is used so that the download starts again if the resource
+        has changed.  The validator used is saved in path+".part.json", so
+        that a download interrupted in an earlier call is also resumed.
+
+        progress, if supplied, is called as progress(received, total) as the
+        content is downloaded, where total is None if the length is not known.
+        """
+        partpath  = path+".part"
+        statepath = partpath+".json"
+        validator = None
+        offset    = 0
+        if os.path.exists(partpath) and os.path.exists(statepath):
+            try:
+                with open(statepath) as statefile:
+                    state = json.load(statefile)
+                if state.get("uri") == str(uripath):
+                    validator = state.get("validator")
+                    offset    = os.path.getsize(partpath)
+            except (IOError, ValueError), e:
+                log.warn("downloadResource: ignore %s: %s"%(statepath, e))
+        resumes = 0
+        while True:
+            reqheaders = None
+            if offset and validator:
+                reqheaders = { "range": "bytes=%d-"%offset, "if-range": validator }
+            (status, reason, headers, uri, data) = self.doRequestFollowRedirect(uripath,
+                method="GET", accept=accept, reqheaders=reqheaders, stream=True)
+            contentrange = parseContentRange(headers.get("content-range"))
+            if status == 206 and contentrange and contentrange[0] == offset:
+                total = contentrange[2]
+                mode  = "ab"
+            elif status == 200:
+                total     = data.length()
+                offset    = 0
+                mode      = "wb"
+                validator = rangeValidator(headers)
+                with open(statepath, "w") as statefile:
+                    json.dump({ "uri": str(uripath), "validator": validator }, statefile)
+            elif status == 416 and offset:
+                # Saved partial content is not usable:  start again
+                validator = None
+                offset    = 0
+                continue
+            else:
+                if isinstance(data, ResponseStream): data.close()
+                if status == 206:
+                    raise self.error("Unexpected partial content response",
+                        "%s (%s)"%(headers.get("content-range"), uripath))
+                return (status, reason, headers, uri, None)
+            try:
+                with data:
+                    with open(partpath, mode) as partfile:
+                        for chunk in data:
+                            partfile.write(chunk)
+                            offset += len(chunk)
+                            if progress: progress(offset, total)
+            except (socket.error, httplib.HTTPException), e:
+                resumes += 1
+                if not validator or resumes > maxresumes:
+                    raise self.error("Download of %s interrupted"%uripath, repr(e))
+                log.info("downloadResource: resume %s at %d after %s"%(uripath, offset, repr(e)))
+                continue
+            os.rename(partpath, path)
+            os.remove(statepath)
+            return (200, reason, headers, uri, offset)
+
+    @instrumented
     def aggregateResourceInt(self,
-        rouri, respath=None, ctype="application/octet-stream", body=None):
+        rouri, respath=None, ctype="application/octet-stream", body=None, progress=None):
         """
         Aggegate internal resource
         Return (status, reason, proxyuri, resuri), where status is 200 or 201
+
+        body may be a string, an open file (or mmap) object or an iterator
+        over strings, which is sent as it is read;  progress, if supplied, is
+        called as progress(sent, total) as the content is uploaded, where
+        total is None if the content length is not known in advance.
+
+        If the content cannot be stored, the new proxy is removed before the
+        error is raised, so that the RO does not aggregate a resource without
+        content.  If the proxy cannot be removed, the error value includes
+        its URI.
         """
         # POST (empty) proxy value to RO ...
         reqheaders = respath and { "slug": respath }
@@ -452,25 +1058,88 @@ class ROSRS_Session(object):
         (status, reason, headers, data) = self.doRequest(rouri,
             method="POST", ctype="application/vnd.wf4ever.proxy",
             reqheaders=reqheaders, body=proxydata)
+        self.invalidateManifest(rouri)
         if status != 201:
             raise self.error("Error creating aggregation proxy",
                             "%03d %s (%s)"%(status, reason, respath))
         proxyuri = rdflib.URIRef(headers["location"])
         links    = self.parseLinks(headers)
-        log.debug("- links: "+repr(links))
-        log.debug("- ORE.proxyFor: "+str(ORE.proxyFor))
+        log.debug("- links: %r", links)
         if str(ORE.proxyFor) not in links:
             raise self.error("No ore:proxyFor link in create proxy response",
                             "Proxy URI %s"%str(proxyuri))
         resuri   = rdflib.URIRef(links[str(ORE.proxyFor)])
-        # PUT resource content to indicated URI
-        (status, reason, headers, data) = self.doRequest(resuri,
-            method="PUT", ctype=ctype, body=body)
-        if status not in [200,201]:
-            raise self.error("Error creating aggregated resource content",
-                "%03d %s (%s)"%(status, reason, respath))
+        # PUT resource content to indicated URI, removing the new proxy if this fails
+        try:
+            (status, reason, headers, data) = self.doRequest(resuri,
+                method="PUT", ctype=ctype, body=body, progress=progress)
+            if status not in [200,201]:
+                raise self.error("Error creating aggregated resource content",
+                    "%03d %s (%s)"%(status, reason, respath))
+        except:
+            error = sys.exc_info()
+            try:
+                (status, reason, headers, uri, data) = self.doRequestFollowRedirect(proxyuri,
+                    method="DELETE")
+            except Exception, e:
+                (status, reason) = (None, str(e))
+            self.invalidateManifest(rouri)
+            self.invalidateRedirects(proxyuri)
+            if status not in [200, 204, 404]:
+                log.warn("aggregateResourceInt: proxy %s for %s not removed: %s %s"%
+                    (str(proxyuri), str(resuri), status, reason))
+                raise self.error("Error creating aggregated resource content, and proxy not removed",
+                    "%s (%s)"%(str(proxyuri), error[1]))
+            raise error[0], error[1], error[2]
         return (status, reason, proxyuri, resuri)
 
+    @instrumented
+    def aggregateResources(self, rouri, items, concurrency=4, callback=None):
+        """
+        Aggregate multiple internal resources, using concurrent requests
+
+        items is an iterable of (respath, ctype, body) tuples, each of which
+        is aggregated as by aggregateResourceInt.  Up to `concurrency` items
+        are processed at once, limited also by the maximum number of
+        connections for the session.  A failure to aggregate one item does
+        not prevent the remaining items from being processed.
+
+        callback, if supplied, is called with each result as it is completed
+        (from a worker thread).
+
+        Returns a list of results in the order of the supplied items, each of
+        which is a dictionary with keys "respath", "status", "reason",
+        "proxyuri", "resuri" and "error", where "error" is None or the
+        exception that caused aggregation of that item to fail.
+        """
+        def aggregateItem(item):
+            (respath, ctype, body) = item
+            result = (
+                { "respath":  respath
+                , "status":   None
+                , "reason":   None
+                , "proxyuri": None
+                , "resuri":   None
+                , "error":    None
+                })
+            try:
+                (status, reason, proxyuri, resuri) = self.aggregateResourceInt(
+                    rouri, respath, ctype=ctype, body=body)
+                result.update(status=status, reason=reason, proxyuri=proxyuri, resuri=resuri)
+            except Exception, e:
+                log.warn("aggregateResources: %s: %s"%(respath, e))
+                result["error"] = e
+            if callback: callback(result)
+            return result
+        workers = multiprocessing.pool.ThreadPool(concurrency)
+        try:
+            results = workers.map(inCurrentOperation(aggregateItem), items, chunksize=1)
+        finally:
+            workers.close()
+            workers.join()
+        return results
+
+    @instrumented
     def aggregateResourceExt(self, rouri, resuri):
         """
         Aggegate external resource
@@ -489,6 +1158,7 @@ class ROSRS_Session(object):
         (status, reason, headers, data) = self.doRequest(rouri,
             method="POST", ctype="application/vnd.wf4ever.proxy",
             body=proxydata)
+        self.invalidateManifest(rouri)
         if status != 201:
             raise self.error("Error creating aggregation proxy",
                 "%03d %s (%s)"%(status, reason, str(resuri)))
@@ -496,19 +1166,32 @@ class ROSRS_Session(object):
         links    = self.parseLinks(headers)
         return (status, reason, proxyuri, rdflib.URIRef(resuri))
 
-    def removeResource(self, rouri, resuri):
+    @instrumented
+    def removeResource(self, rouri, resuri, manifest=None):
         """
         Remove resource from aggregation (internal or external)
         return (status, reason), where status is 204 No content or 404 Not found
+
+        If `manifest` is supplied, it is an ROManifest for the RO in which
+        the resource's proxy is found, so that the manifest is not retrieved
+        again (e.g. when removing several resources).
         """
         # Find proxy for resource
-        (status, reason, proxyuri, manifest) = self.getROResourceProxy(resuri, rouri)
-        if status != 200:
-            return (status, reason)
+        if manifest is not None:
+            proxyuri = manifest.getProxy(urlparse.urljoin(str(rouri), str(resuri)))
+            if proxyuri is None:
+                return (404, "Resource not aggregated")
+        else:
+            (status, reason, proxyuri, graph) = self.getROResourceProxy(resuri, rouri)
+            if status != 200:
+                return (status, reason)
         assert isinstance(proxyuri, rdflib.URIRef)
         # Delete proxy
         (status, reason, headers, uri, data) = self.doRequestFollowRedirect(proxyuri,
             method="DELETE")
+        self.invalidateManifest(rouri)
+        self.invalidateRedirects(proxyuri)
+        self.invalidateRedirects(urlparse.urljoin(str(rouri), str(resuri)))
         return (status, reason)
 
     def createROAnnotationBody(self, rouri, anngr):
@@ -548,12 +1231,14 @@ class ROSRS_Session(object):
             method="POST",
             ctype="application/vnd.wf4ever.annotation",
             body=annotation)
+        self.invalidateManifest(rouri)
         if status != 201:
             raise self.error("Error creating annotation",
                 "%03d %s (%s)"%(status, reason, str(resuri)))
         annuri   = rdflib.URIRef(headers["location"])
         return (status, reason, annuri)
 
+    @instrumented
     def createROAnnotationInt(self, rouri, resuri, anngr):
         """
         Create internal annotation
@@ -565,6 +1250,7 @@ class ROSRS_Session(object):
             (status, reason, annuri) = self.createROAnnotation(rouri, resuri, bodyuri)
         return (status, reason, annuri, bodyuri)
 
+    @instrumented
     def createROAnnotationExt(self, rouri, resuri, bodyuri):
         """
         Creeate a resource annotation using an existing (possibly external) annotation body
@@ -574,6 +1260,7 @@ class ROSRS_Session(object):
         (status, reason, annuri) = self.createROAnnotation(rouri, resuri, bodyuri)
         return (status, reason, annuri)
 
+    @instrumented
     def updateROAnnotation(self, rouri, annuri, resuri, bodyuri):
         """
         Update an indicated annotation for supplied resource using indiocated body
@@ -585,6 +1272,9 @@ class ROSRS_Session(object):
             method="PUT",
             ctype="application/vnd.wf4ever.annotation",
             body=annotation)
+        self.invalidateManifest(rouri)
+        self.invalidateRedirects(annuri)
+        self._annbodycache.remove(self.absoluteUri(annuri))
         if status != 200:
             raise self.error("Error updating annotation",
                 "%03d %s (%s)"%(status, reason, str(resuri)))
@@ -618,62 +1308,190 @@ class ROSRS_Session(object):
         
         Returns an iterator over annotation URIs
         """
-        (status, reason, headers, manifesturi, manifest) = self.getROManifest(rouri)
+        (status, reason, headers, manifesturi, romanifest) = self.getROManifestModel(rouri)
         if status != 200:
             raise self.error("No manifest",
                 "%03d %s (%s)"%(status, reason, str(rouri)))
-        for (a,p) in manifest.subject_predicates(object=resuri):
-            # @@TODO: in due course, remove RO.annotatesAggregatedResource?
-            if p in [AO.annotatesResource,RO.annotatesAggregatedResource]:
-                yield a
+        for a in romanifest.getAnnotations(resuri):
+            yield a
         return
 
-    def getROAnnotationBodyUris(self, rouri, resuri=None):
+    def getROAnnotationBodyUris(self, rouri, resuri=None, concurrency=4):
         """
         Enumerate annnotation body URIs associated with a resource
         (or all annotations for an RO) 
-        
-        Returns an iterator over annotation URIs
+
+        Body URIs are taken from the RO manifest where it provides them.  Any
+        remaining annotations are resolved by getROAnnotationBodyUri, using
+        up to `concurrency` requests at once.
+
+        Returns an iterator over annotation body URIs
         """
-        for annuri in self.getROAnnotationUris(rouri, resuri):
-            yield self.getROAnnotationBodyUri(annuri)
+        (status, reason, headers, manifesturi, romanifest) = self.getROManifestModel(rouri)
+        if status != 200:
+            raise self.error("No manifest",
+                "%03d %s (%s)"%(status, reason, str(rouri)))
+        annuris  = romanifest.getAnnotations(resuri)
+        bodyuris = [ romanifest.getAnnotationBody(a) for a in annuris ]
+        missing  = [ a for (a, b) in zip(annuris, bodyuris) if b is None ]
+        if len(missing) > 1 and concurrency > 1:
+            workers = multiprocessing.pool.ThreadPool(min(concurrency, len(missing)))
+            try:
+                resolved = workers.map(inCurrentOperation(self.getROAnnotationBodyUri), missing,
+                    chunksize=1)
+            finally:
+                workers.close()
+                workers.join()
+        else:
+            resolved = [ self.getROAnnotationBodyUri(a) for a in missing ]
+        resolved = iter(resolved)
+        for b in bodyuris:
+            yield b if b is not None else resolved.next()
         return
 
+    @instrumented
     def getROAnnotationBodyUri(self, annuri):
         """
-        # Retrieve annotation for given annotation URI
+        Retrieve annotation body URI for given annotation URI, from the
+        redirect returned by a HEAD request to the annotation.  Results are
+        remembered for the session.
         """
-        #(status, reason, headers, uri, anngr) = self.getROResourceRDF(annuri)
-        #bodyuri = anngr.value(subject=annuri, predicate=AO.body)
-        #return bodyuri
-        (status, reason, headers, anngr) = self.doRequestRDF(annuri)
-        if status != 303:
-            raise self.error("No redirect from annnotation URI",
-                "%03d %s (%s)"%(status, reason, str(rouri)))
-        return rdflib.URIRef(headers['location'])
+        annkey  = self.absoluteUri(annuri)
+        bodyuri = self._annbodycache.get(annkey)
+        if bodyuri is None:
+            (status, reason, headers, data) = self.doRequest(annuri, method="HEAD")
+            if status != 303:
+                raise self.error("No redirect from annnotation URI",
+                    "%03d %s (%s)"%(status, reason, str(annuri)))
+            bodyuri = rdflib.URIRef(urlparse.urljoin(annkey, headers['location']))
+            self._annbodycache.put(annkey, bodyuri)
+        return bodyuri
 
-    def getROAnnotationGraph(self, rouri, resuri=None):
+    @instrumented
+    def getROAnnotationGraph(self, rouri, resuri=None,
+            concurrency=4, parseprocesses=0, maxinflight=16, failures=None, parsepool=None):
         """
         Build RDF graph of annnotations associated with a resource
         (or all annotations for an RO) 
+
+        Annotation bodies are fetched using up to `concurrency` requests at
+        once.  By default, they are parsed in the calling thread.  To parse
+        bodies in parallel, supply `parsepool`, a multiprocessing.Pool owned
+        by the caller, which should be created once, before any threads are
+        started, and may be used for any number of calls.  Alternatively,
+        `parseprocesses` > 1 creates a pool of that many worker processes for
+        this call only:  as this forks the process, it must not be used while
+        other threads are active (e.g. with ROSRS_ThreadPoolSession).  At most
+        `maxinflight` bodies are held in memory awaiting parsing.
+
+        A body that cannot be retrieved or parsed is logged and skipped;  if
+        `failures` is supplied, it is a list to which a dictionary with keys
+        "bodyuri", "status" and "reason" is appended for each such body.
         
         Returns agraph
         """
-        agraph = rdflib.graph.Graph()
-        for auri in self.getROResourceAnnotations(rouri, resuri):
-            (status, reason, headers, uri, bodytext) = self.getROResourceFollowRedirect(auri)
-            if status == 200:
-                content_type, params = headers['content-type'].split(";", 1)
-                content_type = content_type.strip().lower()
-                if content_type in ANNOTATION_CONTENT_TYPES:
-                    bodyformat = ANNOTATION_CONTENT_TYPES[content_type]
-                    agraph.parse(data=bodytext, format=bodyformat)
+        agraph    = rdflib.graph.Graph()
+        bodyuris  = list(set(self.getROAnnotationBodyUris(rouri, resuri, concurrency=concurrency)))
+        inflight  = threading.BoundedSemaphore(maxinflight)
+        mergelock = threading.Lock()
+        accept    = ",".join(ANNOTATION_CONTENT_TYPES.keys())
+        def bodyFailed(bodyuri, status, reason):
+            log.warn("getROAnnotationGraph: %s: %s %s"%(str(bodyuri), status, reason))
+            if failures is not None:
+                failures.append({ "bodyuri": bodyuri, "status": status, "reason": reason })
+            return
+        stopped   = threading.Event()
+        def fetchBody(bodyuri):
+            # Returns (bodyuri, bodyformat, data), or None if body is not usable.
+            # The inflight permit is held until a returned body has been merged.
+            inflight.acquire()
+            fetched = None
+            try:
+                if stopped.is_set():
+                    return None
+                (status, reason, headers, uri, data) = self.doRequestFollowRedirect(bodyuri,
+                    accept=accept)
+                if status != 200:
+                    bodyFailed(bodyuri, status, reason)
                 else:
-                    log.warn("getROResourceAnnotationGraph: %s has unrecognized content-type: %s"%(str(buri),content_type))
-            else:
-                log.warn("getROResourceAnnotationGraph: %s read failure: %03d %s"%(str(buri), status, reason))
+                    ctype = headers.get("content-type", "").split(";", 1)[0].strip().lower()
+                    if ctype in ANNOTATION_CONTENT_TYPES:
+                        fetched = (bodyuri, ANNOTATION_CONTENT_TYPES[ctype], data)
+                        return fetched
+                    bodyFailed(bodyuri, 901, "Unrecognized content-type: %s"%ctype)
+            except Exception, e:
+                bodyFailed(bodyuri, None, str(e))
+            finally:
+                if fetched is None:
+                    inflight.release()
+            return None
+        mergeerrors = []
+        def mergeBody(bodyuri, (triples, error)):
+            try:
+                if triples is None:
+                    bodyFailed(bodyuri, 902, "RDF parse failure: %s"%error)
+                else:
+                    with mergelock:
+                        for t in triples: agraph.add(t)
+            finally:
+                inflight.release()
+            return
+        def mergeParsed(bodyuri, result):
+            # Called in the parse pool's result thread:  an exception raised
+            # here would stop that thread, so it is saved and raised later
+            try:
+                mergeBody(bodyuri, result)
+            except Exception, e:
+                log.error("getROAnnotationGraph: %s: %s"%(str(bodyuri), e))
+                mergeerrors.append(e)
+            return
+        ownpool = None
+        if parsepool is None and min(parseprocesses, len(bodyuris)) > 1:
+            # Start worker processes before fetch threads, so they are not forked
+            # while this method's threads are active
+            parsepool = ownpool = multiprocessing.Pool(min(parseprocesses, len(bodyuris)))
+        parsing   = []
+        fetchpool = multiprocessing.pool.ThreadPool(max(1, min(concurrency, len(bodyuris))))
+        fetching  = fetchpool.imap_unordered(inCurrentOperation(fetchBody), bodyuris)
+        try:
+            try:
+                for fetched in fetching:
+                    if fetched is None: continue
+                    (bodyuri, bodyformat, data) = fetched
+                    if parsepool:
+                        parsing.append(parsepool.apply_async(parseAnnotationBody,
+                            (str(bodyuri), data, bodyformat),
+                            callback=lambda result, bodyuri=bodyuri: mergeParsed(bodyuri, result)))
+                    else:
+                        mergeBody(bodyuri, parseAnnotationBody(str(bodyuri), data, bodyformat))
+            except:
+                # Stop fetching, and release the permits of bodies that will not be
+                # merged, so that fetch workers waiting for a permit can finish
+                error = sys.exc_info()
+                stopped.set()
+                while True:
+                    try:
+                        fetched = fetching.next()
+                    except StopIteration:
+                        break
+                    except Exception:
+                        continue
+                    if fetched is not None:
+                        inflight.release()
+                raise error[0], error[1], error[2]
+        finally:
+            fetchpool.close()
+            fetchpool.join()
+            for result in parsing:
+                result.wait()
+            if ownpool:
+                ownpool.close()
+                ownpool.join()
+        if mergeerrors:
+            raise mergeerrors[0]
         return agraph
 
+    @instrumented
     def getROAnnotation(self, annuri):
         """
         Retrieve annotation for given annotation URI
@@ -683,6 +1501,7 @@ class ROSRS_Session(object):
         (status, reason, headers, uri, anngr) = self.getROResourceRDF(annuri)
         return (status, reason, uri, anngr)
 
+    @instrumented
     def removeROAnnotation(self, rouri, annuri):
         """
         Remove annotation at given annotation URI
@@ -691,6 +1510,9 @@ class ROSRS_Session(object):
         """
         (status, reason, headers, data) = self.doRequest(annuri,
             method="DELETE")
+        self.invalidateManifest(rouri)
+        self.invalidateRedirects(annuri)
+        self._annbodycache.remove(self.absoluteUri(annuri))
         return (status, reason)
 
     # ---------------------------------------------
@@ -0,0 +1,128 @@
+"""
+Thread pool wrapper for ROSRS_Session:  operations are run by worker threads,
+and return immediately with a deferred result
+"""
+
+import logging
+import multiprocessing.pool
+
+from ROSRS_Session import ROSRS_Session
+
+# Logging object
+log = logging.getLogger(__name__)
+
+def pooledMethod(name, listresult=False):
+    """
+    Return method that submits the named ROSRS_Session method to be run
+    by a worker thread.  If listresult is True, the session method
+    returns an iterator, which is evaluated to a list by the worker.
+    """
+    def method(self, *args, **kwargs):
+        callback = kwargs.pop("callback", None)
+        func     = getattr(self._session, name)
+        if listresult:
+            iterfunc = func
+            func     = lambda *args, **kwargs: list(iterfunc(*args, **kwargs))
+        return self.submit(func, args, kwargs, callback=callback)
+    method.__name__ = name
+    method.__doc__  = ("ROSRS_Session.%s, run by a worker thread:  returns an AsyncResult"%name)
+    return method
+
+class ROSRS_ThreadPoolSession(object):
+    """
+    Convenience wrapper that runs ROSRS_Session operations in a pool of
+    worker threads.
+
+    Each operation takes the same arguments as the corresponding
+    ROSRS_Session method, plus an optional `callback` that is called with
+    the result when the operation succeeds, and returns at once with a
+    multiprocessing AsyncResult.  Use its get() method to wait for the
+    operation to complete and obtain the result (or raise the exception
+    raised by the operation), or ready() to test whether it has completed.
+
+    Operations are run by a pool of worker threads (`workers`, default
+    `maxconnections`) sharing a single ROSRS_Session, whose connection pool
+    limits the number of requests in progress at any time to
+    `maxconnections`.  Any number of operations may be submitted:  those
+    that cannot yet be started are queued in the order submitted.  Other
+    keyword arguments are passed to ROSRS_Session.
+
+    This does not provide non-blocking I/O:  requests use blocking
+    sockets, and each operation in progress occupies a worker thread, so
+    the number of concurrent operations is limited to the number of
+    workers.  It is suited to tens of concurrent operations, not thousands.
+    """
+
+    def __init__(self, srsuri, accesskey, maxconnections=16, workers=None, **kwargs):
+        self._session = ROSRS_Session(srsuri, accesskey, maxconnections=maxconnections, **kwargs)
+        self._workers = multiprocessing.pool.ThreadPool(workers or maxconnections)
+        return
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exctype, excval, exctb):
+        self.close()
+        return False
+
+    def session(self):
+        """
+        Return the underlying ROSRS_Session, for synchronous operations
+        """
+        return self._session
+
+    def baseuri(self):
+        return self._session.baseuri()
+
+    def close(self):
+        """
+        Wait for submitted operations to complete, then close the session
+        """
+        self._workers.close()
+        self._workers.join()
+        self._session.close()
+        return
+
+    def submit(self, func, args=(), kwargs={}, callback=None):
+        """
+        Submit func(*args, **kwargs) to run in a worker thread, and return
+        an AsyncResult for its result
+        """
+        return self._workers.apply_async(func, args, kwargs, callback=callback)
+
+    listROs                 = pooledMethod("listROs")
+    createRO                = pooledMethod("createRO")
+    deleteRO                = pooledMethod("deleteRO")
+    getROResource           = pooledMethod("getROResource")
+    getROResourceRDF        = pooledMethod("getROResourceRDF")
+    getROResourceProxy      = pooledMethod("getROResourceProxy")
+    getROManifest           = pooledMethod("getROManifest")
+    getROZip                = pooledMethod("getROZip")
+    aggregateResourceInt    = pooledMethod("aggregateResourceInt")
+    aggregateResourceExt    = pooledMethod("aggregateResourceExt")
+    removeResource          = pooledMethod("removeResource")
+    createROAnnotationInt   = pooledMethod("createROAnnotationInt")
+    createROAnnotationExt   = pooledMethod("createROAnnotationExt")
+    updateROAnnotation      = pooledMethod("updateROAnnotation")
+    getROAnnotationUris     = pooledMethod("getROAnnotationUris", listresult=True)
+    getROAnnotationBodyUris = pooledMethod("getROAnnotationBodyUris", listresult=True)
+    getROAnnotationGraph    = pooledMethod("getROAnnotationGraph")
+    getROAnnotation         = pooledMethod("getROAnnotation")
+    removeROAnnotation      = pooledMethod("removeROAnnotation")
+
+    def getROZipTo(self, rouri, path, callback=None):
+        """
+        Download RO as a ZIP file to the named local file, resuming an
+        interrupted transfer (see ROSRS_Session.downloadResource).
+
+        Returns an AsyncResult for the number of bytes in the file.
+        """
+        def download():
+            (status, reason, headers, uri, size) = self._session.getROZipTo(rouri, path)
+            if status != 200:
+                raise self._session.error("Error retrieving RO as ZIP file",
+                    "%03d %s"%(status, reason))
+            return size
+        return self.submit(download, callback=callback)
+
+# End.
@@ -0,0 +1,372 @@
+"""
+Synchronize an RO with a local directory, using ROSRS_Session
+"""
+
+import os, os.path
+import json
+import urllib
+import hashlib
+import mimetypes
+import tempfile
+import multiprocessing.pool
+import logging
+
+from MiscLib.ScanDirectories import CollectDirectoryContents
+
+from HttpConnectionPool import ResponseStream
+from RequestMetrics import inCurrentOperation
+
+# Logging object
+log = logging.getLogger(__name__)
+
+# Names of state files in synchronized directory
+
+MIRROR_STATE = ".ro-mirror.json"
+PUSH_STATE   = ".ro-push.json"
+
+# Suffix of partially downloaded files in mirror directory
+
+PART_SUFFIX  = ".part"
+
+# Local path of RO manifest in mirror directory
+
+MANIFEST_PATH = ".ro/manifest.rdf"
+
+def readState(path):
+    """
+    Read synchronization state file, returning an empty state if it does
+    not exist or cannot be read
+    """
+    try:
+        with open(path) as statefile:
+            return json.load(statefile)
+    except (IOError, ValueError), e:
+        if os.path.exists(path):
+            log.warn("readState: ignore %s: %s"%(path, e))
+    return {}
+
+def writeState(path, state):
+    """
+    Write synchronization state file, replacing any previous state
+    """
+    (fd, tmppath) = tempfile.mkstemp(dir=os.path.dirname(path))
+    with os.fdopen(fd, "w") as tmpfile:
+        json.dump(state, tmpfile, indent=2, sort_keys=True)
+    os.rename(tmppath, path)
+    return
+
+def localPath(directory, relpath):
+    """
+    Return local file name for a path relative to an RO, or None if the
+    path does not name a file within the directory
+    """
+    parts = relpath.split("/")
+    if not relpath or relpath.startswith("/") or "" in parts[:-1] or ".." in parts or not parts[-1]:
+        return None
+    return os.path.join(directory, *parts)
+
+def removeEmptyDirs(directory, path):
+    """
+    Remove empty parent directories of a removed file, up to directory
+    """
+    parent = os.path.dirname(path)
+    while parent != directory and parent.startswith(directory):
+        try:
+            os.rmdir(parent)
+        except OSError:
+            break
+        parent = os.path.dirname(parent)
+    return
+
+def mirrorRO(session, rouri, directory, concurrency=4, callback=None):
+    """
+    Mirror an RO to a local directory
+
+    The directory is laid out as if the RO were unpacked from its ZIP
+    file into it:  each aggregated resource whose URI is within the RO
+    URI is saved at the corresponding relative path, and the manifest is
+    saved as .ro/manifest.rdf.  Aggregated resources outside the RO URI
+    are not copied.
+
+    The ETag and Last-Modified values of each resource retrieved are
+    recorded in a state file (.ro-mirror.json) in the directory.  When the
+    directory is mirrored again, resources are retrieved with conditional
+    requests, so that only new or changed resources are transferred, and
+    files for resources no longer aggregated by the RO are deleted.
+    Resources are retrieved using up to `concurrency` concurrent requests.
+
+    callback, if supplied, is called with each result as it is completed
+    (from a worker thread).
+
+    Returns a list of results for the resources in the RO and any files
+    deleted, each of which is a dictionary with keys "path", "uri",
+    "action" ("fetched", "unchanged", "deleted" or "failed"), "status"
+    and "error", where "error" is None or the exception that caused
+    retrieval of that resource to fail.
+    """
+    rouri = session.absoluteUri(rouri)
+    (status, reason, headers, manifesturi, manifest) = session.getROManifestModel(rouri)
+    if status != 200:
+        raise session.error("Error retrieving RO manifest for mirror",
+            "%03d %s (%s)"%(status, reason, rouri))
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    statepath = os.path.join(directory, MIRROR_STATE)
+    oldstate  = readState(statepath)
+    if oldstate.get("rouri") != str(rouri):
+        oldstate = {}
+    oldresources = oldstate.get("resources", {})
+    items = []
+    for resuri in sorted(manifest.getAggregatedResources()):
+        resuri = str(resuri)
+        if not resuri.startswith(rouri):
+            continue
+        relpath = urllib.unquote(resuri[len(rouri):])
+        path    = localPath(directory, relpath)
+        if path is None or relpath == MANIFEST_PATH:
+            log.warn("mirrorRO: skip %s"%resuri)
+            continue
+        items.append( (relpath, resuri, path) )
+    def mirrorItem(item):
+        (relpath, resuri, path) = item
+        result = (
+            { "path":   relpath
+            , "uri":    resuri
+            , "action": None
+            , "status": None
+            , "error":  None
+            })
+        state = None
+        old   = oldresources.get(relpath)
+        reqheaders = {}
+        if old and os.path.exists(path) and os.path.getsize(path) == old.get("size"):
+            if old.get("etag"):
+                reqheaders["if-none-match"] = old["etag"]
+            if old.get("last-modified"):
+                reqheaders["if-modified-since"] = old["last-modified"]
+        try:
+            (status, reason, headers, uri, data) = session.doRequestFollowRedirect(resuri,
+                method="GET", reqheaders=reqheaders, stream=True)
+            result["status"] = status
+            if status == 304 and reqheaders:
+                result["action"] = "unchanged"
+                state = old
+            elif status == 200:
+                if not os.path.isdir(os.path.dirname(path)):
+                    try:
+                        os.makedirs(os.path.dirname(path))
+                    except OSError:
+                        pass    # Created by another worker
+                tmppath = path+PART_SUFFIX
+                try:
+                    with data:
+                        size = data.downloadTo(tmppath)
+                    os.rename(tmppath, path)
+                except:
+                    if os.path.exists(tmppath):
+                        os.remove(tmppath)
+                    raise
+                result["action"] = "fetched"
+                state = (
+                    { "etag":          headers.get("etag")
+                    , "last-modified": headers.get("last-modified")
+                    , "size":          size
+                    })
+            else:
+                if isinstance(data, ResponseStream): data.close()
+                raise session.error("Error retrieving RO resource",
+                    "%03d %s (%s)"%(status, reason, resuri))
+        except Exception, e:
+            log.warn("mirrorRO: %s: %s"%(relpath, e))
+            result["action"] = "failed"
+            result["error"]  = e
+            state = old     # Keep previous state, if any
+        if callback: callback(result)
+        return (result, state)
+    resources = {}
+    results   = []
+    if items:
+        workers = multiprocessing.pool.ThreadPool(max(1, min(concurrency, len(items))))
+        try:
+            for (result, state) in workers.map(inCurrentOperation(mirrorItem), items, chunksize=1):
+                results.append(result)
+                if state:
+                    resources[result["path"]] = state
+        finally:
+            workers.close()
+            workers.join()
+    # Save manifest, and delete files for resources that are no longer aggregated
+    manifestpath = localPath(directory, MANIFEST_PATH)
+    if not os.path.isdir(os.path.dirname(manifestpath)):
+        os.makedirs(os.path.dirname(manifestpath))
+    with open(manifestpath, "wb") as manifestfile:
+        manifestfile.write(manifest.graph.serialize(format="xml"))
+    current = set([ relpath for (relpath, resuri, path) in items ])
+    for relpath in sorted(set(oldresources) - current):
+        path = localPath(directory, relpath)
+        if path and os.path.exists(path):
+            os.remove(path)
+            removeEmptyDirs(directory, path)
+        result = (
+            { "path":   relpath
+            , "uri":    oldstate["rouri"]+urllib.quote(relpath)
+            , "action": "deleted"
+            , "status": None
+            , "error":  None
+            })
+        if callback: callback(result)
+        results.append(result)
+    writeState(statepath, { "rouri": str(rouri), "resources": resources })
+    return results
+
+def fileDigest(path, blocksize=65536):
+    """
+    Return SHA-1 digest of file content, as a hex string
+    """
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for data in iter(lambda: f.read(blocksize), ""):
+            digest.update(data)
+    return digest.hexdigest()
+
+def pushRO(session, directory, rouri, concurrency=4, delete=True, callback=None):
+    """
+    Push the files in a local directory to an RO
+
+    Each file in the directory and its subdirectories is aggregated by the
+    RO as an internal resource, at the corresponding path relative to the
+    RO URI (the reverse of mirrorRO).  Files in the .ro subdirectory,
+    synchronization state files and partially downloaded (.part) files
+    are not pushed.
+
+    The SHA-1 digest of each file pushed is recorded in a state file
+    (.ro-push.json) in the directory, with its size and modification time,
+    which are used to avoid recomputing the digest of an unchanged file.
+    When the directory is pushed again, only new or changed files are
+    uploaded, and if `delete` is True, resources for files that have been
+    removed are removed from the RO.  Files are uploaded and resources
+    removed using up to `concurrency` concurrent requests.
+
+    callback, if supplied, is called with each result as it is completed
+    (from a worker thread).
+
+    Returns a list of results for the files in the directory and any
+    resources removed, each of which is a dictionary with keys "path",
+    "uri", "action" ("created", "updated", "unchanged", "deleted" or
+    "failed"), "status" and "error", where "error" is None or the
+    exception that caused the operation for that file to fail.
+    """
+    rouri = session.absoluteUri(rouri)
+    (status, reason, headers, manifesturi, manifest) = session.getROManifestModel(rouri)
+    if status != 200:
+        raise session.error("Error retrieving RO manifest for push",
+            "%03d %s (%s)"%(status, reason, rouri))
+    aggregated = set([ str(r) for r in manifest.getAggregatedResources() ])
+    statepath  = os.path.join(directory, PUSH_STATE)
+    oldstate   = readState(statepath)
+    if oldstate.get("rouri") != str(rouri):
+        oldstate = {}
+    oldfiles = oldstate.get("files", {})
+    relpaths = []
+    for relpath in CollectDirectoryContents(directory, baseDir=directory,
+            listDirs=False, listFiles=True):
+        relpath = relpath.replace(os.path.sep, "/")
+        if (relpath in [MIRROR_STATE, PUSH_STATE] or relpath.startswith(".ro/") or
+                relpath.endswith(PART_SUFFIX)):
+            continue
+        relpaths.append(relpath)
+    def pushItem(relpath):
+        path   = localPath(directory, relpath)
+        resuri = rouri+urllib.quote(relpath)
+        result = (
+            { "path":   relpath
+            , "uri":    resuri
+            , "action": None
+            , "status": None
+            , "error":  None
+            })
+        old = oldfiles.get(relpath)
+        try:
+            stat = os.stat(path)
+            if old and (old["size"], old["mtime"]) == (stat.st_size, stat.st_mtime):
+                digest = old["sha1"]
+            else:
+                digest = fileDigest(path)
+            state = { "sha1": digest, "size": stat.st_size, "mtime": stat.st_mtime }
+            if old and old["sha1"] == digest and resuri in aggregated:
+                result["action"] = "unchanged"
+                if callback: callback(result)
+                return (result, state)
+            ctype = mimetypes.guess_type(relpath)[0] or "application/octet-stream"
+            with open(path, "rb") as body:
+                if resuri in aggregated:
+                    (status, reason, headers, data) = session.doRequest(resuri,
+                        method="PUT", ctype=ctype, body=body)
+                    if status not in [200, 201, 204]:
+                        raise session.error("Error updating aggregated resource content",
+                            "%03d %s (%s)"%(status, reason, relpath))
+                    result["action"] = "updated"
+                else:
+                    (status, reason, proxyuri, resuri) = session.aggregateResourceInt(
+                        rouri, urllib.quote(relpath), ctype=ctype, body=body)
+                    result["uri"]    = str(resuri)
+                    result["action"] = "created"
+            result["status"] = status
+        except Exception, e:
+            log.warn("pushRO: %s: %s"%(relpath, e))
+            result["action"] = "failed"
+            result["error"]  = e
+            state = None
+        if callback: callback(result)
+        return (result, state)
+    def removeItem(relpath):
+        resuri = rouri+urllib.quote(relpath)
+        result = (
+            { "path":   relpath
+            , "uri":    resuri
+            , "action": "deleted"
+            , "status": None
+            , "error":  None
+            })
+        state = None
+        if resuri in aggregated:
+            try:
+                # Proxy is found in the manifest already retrieved
+                (status, reason) = session.removeResource(rouri, resuri, manifest=manifest)
+                result["status"] = status
+                if status not in [200, 204, 404]:
+                    raise session.error("Error removing aggregated resource",
+                        "%03d %s (%s)"%(status, reason, relpath))
+            except Exception, e:
+                log.warn("pushRO: %s: %s"%(relpath, e))
+                result["action"] = "failed"
+                result["error"]  = e
+                state = oldfiles[relpath]
+        if callback: callback(result)
+        return (result, state)
+    files   = {}
+    results = []
+    removed = sorted(set(oldfiles) - set(relpaths))
+    if not delete:
+        # Keep state of files that have been deleted
+        for relpath in removed:
+            files[relpath] = oldfiles[relpath]
+        removed = []
+    def runTask((func, relpath)):
+        return func(relpath)
+    tasks = ( [ (pushItem, relpath) for relpath in relpaths ] +
+              [ (removeItem, relpath) for relpath in removed ] )
+    if tasks:
+        workers = multiprocessing.pool.ThreadPool(max(1, min(concurrency, len(tasks))))
+        try:
+            for (result, state) in workers.map(inCurrentOperation(runTask), tasks, chunksize=1):
+                results.append(result)
+                if state:
+                    files[result["path"]] = state
+        finally:
+            workers.close()
+            workers.join()
+    writeState(statepath, { "rouri": str(rouri), "files": files })
+    return results
+
+# End.
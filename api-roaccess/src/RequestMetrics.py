@@ -0,0 +1,277 @@
+"""
+Request latency and throughput metrics for ROSRS_Session, with pluggable sinks
+"""
+
+import time
+import threading
+import functools
+import logging
+
+# Logging object
+log = logging.getLogger(__name__)
+
+# Default histogram bucket upper bounds, in seconds
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Metrics recorded by ROSRS_Session and RetryPolicy, with descriptions used for Prometheus HELP text
+
+METRIC_HELP = (
+    { "request_seconds":             "Time for HTTP request, from sending request to reading response body"
+    , "connect_seconds":             "Time to open a new connection, including name lookup and TLS handshake"
+    , "first_byte_seconds":          "Time from sending request to receiving response headers"
+    , "transfer_seconds":            "Time to read response body"
+    , "rdf_parse_seconds":           "Time to parse RDF response body"
+    , "operation_seconds":           "Time for ROSRS_Session operation, including all requests"
+    , "requests_total":              "HTTP requests issued"
+    , "bytes_sent_total":            "Request body bytes sent"
+    , "bytes_received_total":        "Response body bytes received"
+    , "connections_total":           "HTTP requests by whether a pooled connection was reused"
+    , "request_retries_total":       "HTTP requests repeated by RetryPolicy after a transient failure"
+    , "circuit_rejections_total":    "HTTP requests refused because the host's circuit breaker was open"
+    , "circuit_state_changes_total": "Circuit breaker state changes, by new state"
+    })
+
+# Label used for requests not made within an instrumented operation
+
+NO_OPERATION = "other"
+
+# Current operation, for each thread
+
+_context = threading.local()
+
+def currentOperation():
+    """
+    Return name of the instrumented operation in progress in this thread
+    """
+    return getattr(_context, "operation", None) or NO_OPERATION
+
+def instrumented(method):
+    """
+    Decorator for ROSRS_Session methods that are recorded as operations:
+    requests made while the method is running are labelled with its name,
+    and its duration is recorded as "operation_seconds".  Where one
+    instrumented method calls another, only the outermost is recorded.
+    """
+    name = method.__name__
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        metrics = self._metrics
+        if metrics is None or getattr(_context, "operation", None):
+            return method(self, *args, **kwargs)
+        _context.operation = name
+        outcome   = "error"
+        starttime = time.time()
+        try:
+            result  = method(self, *args, **kwargs)
+            outcome = "ok"
+            return result
+        finally:
+            _context.operation = None
+            metrics.observe("operation_seconds", { "operation": name, "outcome": outcome },
+                time.time()-starttime)
+    return wrapper
+
+def inCurrentOperation(func):
+    """
+    Return a function that runs func as part of the instrumented operation
+    in progress in this thread (if any), for use in worker threads:  requests
+    made by func are labelled with the operation's name, and instrumented
+    methods that it calls are not recorded as separate operations.
+    """
+    operation = getattr(_context, "operation", None)
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        saved = getattr(_context, "operation", None)
+        _context.operation = operation
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _context.operation = saved
+    return wrapper
+
+class Histogram(object):
+    """
+    Histogram of observed values, with counts for fixed buckets
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts  = [0]*(len(self.buckets)+1)    # Last is for values above all bounds
+        self.count   = 0
+        self.sum     = 0.0
+        return
+
+    def observe(self, value):
+        i = 0
+        for bound in self.buckets:
+            if value <= bound: break
+            i += 1
+        self.counts[i] += 1
+        self.count     += 1
+        self.sum       += value
+        return
+
+    def cumulative(self):
+        """
+        Return list of (upper bound, count of values <= bound), ending with
+        (float("inf"), total count)
+        """
+        result = []
+        total  = 0
+        for (bound, count) in zip(self.buckets+(float("inf"),), self.counts):
+            total += count
+            result.append( (bound, total) )
+        return result
+
+    def copy(self):
+        h = Histogram(self.buckets)
+        h.counts = list(self.counts)
+        h.count  = self.count
+        h.sum    = self.sum
+        return h
+
+class MetricsSink(object):
+    """
+    Base class for metrics sinks, which receive values recorded by
+    ROSRS_Session.  Each value has a metric name and a dictionary of labels
+    (e.g. "method", "operation").  Methods in this class discard values.
+    """
+
+    def observe(self, name, labels, value):
+        """
+        Record observation of a value (e.g. a duration) for a histogram
+        """
+        return
+
+    def increment(self, name, labels, value=1):
+        """
+        Add value to a counter
+        """
+        return
+
+def labelKey(labels):
+    return tuple(sorted(labels.items()))
+
+class MemoryMetrics(MetricsSink):
+    """
+    Metrics sink that accumulates histograms and counters in memory
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self._buckets    = buckets
+        self._lock       = threading.Lock()
+        self._histograms = {}   # (name, labelkey) -> Histogram
+        self._counters   = {}   # (name, labelkey) -> value
+        return
+
+    def observe(self, name, labels, value):
+        key = (name, labelKey(labels))
+        with self._lock:
+            if key not in self._histograms:
+                self._histograms[key] = Histogram(self._buckets)
+            self._histograms[key].observe(value)
+        return
+
+    def increment(self, name, labels, value=1):
+        key = (name, labelKey(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+        return
+
+    def histogram(self, name, **labels):
+        """
+        Return copy of histogram for the given name and labels, or None
+        """
+        with self._lock:
+            h = self._histograms.get( (name, labelKey(labels)) )
+            return h and h.copy()
+
+    def counter(self, name, **labels):
+        """
+        Return value of counter for the given name and labels, summed over
+        any other labels not specified
+        """
+        labels = set(labels.items())
+        with self._lock:
+            return sum([ v for ((n, k), v) in self._counters.items()
+                         if n == name and labels.issubset(k) ])
+
+    def histograms(self):
+        """
+        Return sorted list of (name, labels, histogram) for all histograms
+        """
+        with self._lock:
+            return [ (n, dict(k), h.copy()) for ((n, k), h) in sorted(self._histograms.items()) ]
+
+    def counters(self):
+        """
+        Return sorted list of (name, labels, value) for all counters
+        """
+        with self._lock:
+            return [ (n, dict(k), v) for ((n, k), v) in sorted(self._counters.items()) ]
+
+    def clear(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+        return
+
+def formatLabels(labels, extra=()):
+    """
+    Format labels for Prometheus text exposition format
+    """
+    items = sorted(labels.items())+list(extra)
+    if not items:
+        return ""
+    def escape(v):
+        return str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+    return "{%s}"%(",".join([ '%s="%s"'%(k, escape(v)) for (k, v) in items ]))
+
+def formatValue(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class PrometheusMetrics(MemoryMetrics):
+    """
+    Metrics sink that accumulates values in memory, and renders them in the
+    Prometheus text exposition format, with metric names prefixed by
+    `prefix`.  E.g. serve the result of `exposition` at a /metrics URI.
+    """
+
+    def __init__(self, prefix="rosrs_", buckets=DEFAULT_BUCKETS):
+        super(PrometheusMetrics, self).__init__(buckets)
+        self._prefix = prefix
+        return
+
+    def exposition(self):
+        """
+        Return current metric values in Prometheus text format
+        """
+        lines = []
+        def header(name, kind):
+            if name in METRIC_HELP:
+                lines.append("# HELP %s%s %s"%(self._prefix, name, METRIC_HELP[name]))
+            lines.append("# TYPE %s%s %s"%(self._prefix, name, kind))
+            return
+        prevname = None
+        for (name, labels, h) in self.histograms():
+            if name != prevname:
+                header(name, "histogram")
+                prevname = name
+            metric = self._prefix+name
+            for (bound, count) in h.cumulative():
+                lines.append("%s_bucket%s %d"%(metric,
+                    formatLabels(labels, [("le", formatValue(bound))]), count))
+            lines.append("%s_sum%s %s"%(metric, formatLabels(labels), formatValue(h.sum)))
+            lines.append("%s_count%s %d"%(metric, formatLabels(labels), h.count))
+        prevname = None
+        for (name, labels, value) in self.counters():
+            if name != prevname:
+                header(name, "counter")
+                prevname = name
+            lines.append("%s%s%s %s"%(self._prefix, name, formatLabels(labels), formatValue(value)))
+        return "".join([ l+"\n" for l in lines ])
+
+# End.
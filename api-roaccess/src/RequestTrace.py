@@ -0,0 +1,114 @@
+"""
+Pluggable tracing of HTTP requests made by ROSRS_Session
+"""
+
+import logging
+
+# Logging object
+log = logging.getLogger(__name__)
+
+# Default number of characters of request and response bodies shown in trace logs
+
+MAX_BODY = 256
+
+# Headers whose values are credentials, which are not shown in trace logs
+
+CREDENTIAL_HEADERS = frozenset(["authorization", "proxy-authorization", "cookie", "set-cookie"])
+
+REDACTED = "<redacted>"
+
+def redactHeaders(headers):
+    """
+    Return copy of a header dictionary with the values of credential headers
+    replaced, including those in a "_headerlist" of (name, value) pairs
+    """
+    redacted = {}
+    for (h, v) in headers.items():
+        if h == "_headerlist":
+            v = [ (n, REDACTED if n.lower() in CREDENTIAL_HEADERS else hv) for (n, hv) in v ]
+        elif h.lower() in CREDENTIAL_HEADERS:
+            v = REDACTED
+        redacted[h] = v
+    return redacted
+
+def describeBody(body, maxbody=MAX_BODY):
+    """
+    Return short printable description of a request or response body, with
+    string values truncated to at most maxbody characters.  Values that are
+    not strings (files, iterators, streams) are described by type only, as
+    their content cannot be shown without consuming it.
+    """
+    if body is None:
+        return "None"
+    if isinstance(body, basestring):
+        if len(body) <= maxbody:
+            return repr(body)
+        return "%s... (%d bytes)"%(repr(body[:maxbody]), len(body))
+    return "<%s>"%(type(body).__name__)
+
+class RequestTrace(object):
+    """
+    Base class for request tracing hooks.
+
+    A trace object is supplied to ROSRS_Session, which calls `isEnabled`
+    before each request;  if it returns False, nothing else is done for that
+    request.  Otherwise `traceRequest` is called before the request is sent,
+    and `traceResponse` is called when the response has been received, with
+    a dictionary of structured fields:
+
+        method      HTTP request method
+        path        request path (and query)
+        reqheaders  request headers
+        body        request body, as supplied by the caller
+        status      response status code
+        reason      response reason phrase
+        headers     response headers
+        data        response body, or ResponseStream for a streamed response
+        bytes       number of bytes in the response body, or None if not known
+        elapsed     time in seconds from sending the request to reading the
+                    response (to receiving headers for a streamed response)
+
+    Methods in this class do nothing:  subclasses override those needed.
+    """
+
+    def isEnabled(self):
+        return False
+
+    def traceRequest(self, method, path, reqheaders, body):
+        return
+
+    def traceResponse(self, record):
+        return
+
+class LogTrace(RequestTrace):
+    """
+    Request trace that writes to a logger at a given level (default DEBUG).
+    Nothing is formatted unless the logger is enabled for that level, and
+    request and response bodies are truncated to at most maxbody characters.
+    The values of credential headers (e.g. Authorization) are not logged.
+    """
+
+    def __init__(self, logger=log, level=logging.DEBUG, maxbody=MAX_BODY):
+        self._log     = logger
+        self._level   = level
+        self._maxbody = maxbody
+        return
+
+    def isEnabled(self):
+        return self._log.isEnabledFor(self._level)
+
+    def traceRequest(self, method, path, reqheaders, body):
+        self._log.log(self._level, "%s %s: reqheaders %r, body %s",
+            method, path, redactHeaders(reqheaders), describeBody(body, self._maxbody))
+        return
+
+    def traceResponse(self, record):
+        self._log.log(self._level, "%s %s: %s %s, %s bytes, %.3fs",
+            record["method"], record["path"], record["status"], record["reason"],
+            record["bytes"], record["elapsed"])
+        self._log.log(self._level, "%s %s: headers %r, data %s",
+            record["method"], record["path"], redactHeaders(record["headers"]),
+            describeBody(record["data"], self._maxbody))
+        return
+
+# End.
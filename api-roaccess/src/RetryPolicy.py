@@ -0,0 +1,298 @@
+"""
+Retry with backoff, and per-host circuit breakers, for HTTP requests
+"""
+
+import time
+import random
+import socket
+import ssl
+import threading
+import httplib
+import email.utils
+import logging
+
+from HttpConnectionPool import HttpPoolError, IDEMPOTENT_METHODS
+
+# Logging object
+log = logging.getLogger(__name__)
+
+# Response status codes that indicate a transient failure
+
+RETRY_STATUSES = frozenset([429, 502, 503, 504])
+
+# Exceptions that indicate a transient failure (ssl.SSLError is a subclass
+# of socket.error, but is not retried as it usually indicates a configuration
+# or certificate problem)
+
+RETRY_EXCEPTIONS = (socket.error, httplib.HTTPException)
+
+# Circuit breaker states
+
+CIRCUIT_CLOSED    = "closed"
+CIRCUIT_OPEN      = "open"
+CIRCUIT_HALF_OPEN = "half-open"
+
+class CircuitOpenError(HttpPoolError):
+    """
+    Raised when a request is refused because the circuit breaker for its
+    host is open
+    """
+
+    def __init__(self, msg="Circuit open", value=None, host=None):
+        super(CircuitOpenError, self).__init__(msg=msg, value=value, host=host)
+        return
+
+def parseRetryAfter(value, now=None):
+    """
+    Parse Retry-After header value (delay in seconds or HTTP date), and
+    return delay in seconds, or None if the value is not recognized
+    """
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    parsed = email.utils.parsedate_tz(value)
+    if parsed is None:
+        return None
+    return max(0.0, email.utils.mktime_tz(parsed) - (now or time.time()))
+
+class CircuitBreaker(object):
+    """
+    Circuit breaker for a single host.
+
+    After `threshold` consecutive failures, the circuit opens and requests
+    are refused.  After `resettimeout` seconds, one trial request is allowed
+    (half-open state):  if it succeeds, the circuit closes, otherwise it
+    opens again.  If `onchange` is supplied, it is called with the new
+    state whenever the state changes.
+    """
+
+    def __init__(self, threshold=5, resettimeout=30.0, clock=time.time, onchange=None):
+        self._threshold = threshold
+        self._reset     = resettimeout
+        self._clock     = clock
+        self._onchange  = onchange
+        self._lock      = threading.Lock()
+        self._state     = CIRCUIT_CLOSED
+        self._failures  = 0
+        self._openedat  = None
+        return
+
+    def changed(self, oldstate, newstate):
+        # Called without the lock held, so that onchange may query the breaker
+        if self._onchange and newstate != oldstate:
+            self._onchange(newstate)
+        return
+
+    def state(self):
+        with self._lock:
+            if self._state == CIRCUIT_OPEN and self._clock() >= self._openedat+self._reset:
+                return CIRCUIT_HALF_OPEN
+            return self._state
+
+    def allowRequest(self):
+        """
+        Return True if a request may be issued
+        """
+        with self._lock:
+            if self._state == CIRCUIT_CLOSED:
+                return True
+            if not (self._state == CIRCUIT_OPEN and self._clock() >= self._openedat+self._reset):
+                return False        # Open, or trial request in progress
+            self._state = CIRCUIT_HALF_OPEN
+        self.changed(CIRCUIT_OPEN, CIRCUIT_HALF_OPEN)
+        return True                 # Trial request
+
+    def recordSuccess(self):
+        with self._lock:
+            oldstate       = self._state
+            self._state    = CIRCUIT_CLOSED
+            self._failures = 0
+        self.changed(oldstate, CIRCUIT_CLOSED)
+        return
+
+    def recordFailure(self):
+        with self._lock:
+            oldstate = self._state
+            self._failures += 1
+            if self._state == CIRCUIT_HALF_OPEN or self._failures >= self._threshold:
+                if self._state != CIRCUIT_OPEN:
+                    log.warn("CircuitBreaker: open after %d failures"%(self._failures))
+                self._state    = CIRCUIT_OPEN
+                self._openedat = self._clock()
+            newstate = self._state
+        self.changed(oldstate, newstate)
+        return
+
+class RetryPolicy(object):
+    """
+    Policy for retrying failed HTTP requests, for use with ROSRS_Session.
+
+    A request that fails with a socket or HTTP protocol error, or with a
+    response status in `retrystatuses`, is repeated up to `maxretries`
+    times, provided its method is in `retrymethods` (by default, idempotent
+    methods only) and its body can be sent again.  The delay before each
+    retry is chosen at random up to an exponentially increasing limit
+    (`backoff` seconds, doubling for each retry, up to `maxbackoff`),
+    unless the response includes a Retry-After header, which is honoured
+    up to `maxretryafter` seconds.
+
+    Failures are also counted by a circuit breaker for each host (see
+    CircuitBreaker, with `breakerthreshold` and `breakerreset`);  while a
+    host's circuit is open, requests are refused with CircuitOpenError.
+
+    Usage counters are available from `stats`.  If `metrics` is supplied,
+    it is a RequestMetrics.MetricsSink to which each retry is reported as
+    "request_retries_total" (with labels "host" and "method"), each request
+    refused by an open circuit as "circuit_rejections_total" (with label
+    "host"), and each change of a circuit breaker's state as
+    "circuit_state_changes_total" (with labels "host" and "state", the new
+    state).
+    """
+
+    def __init__(self, maxretries=3, backoff=0.5, maxbackoff=30.0,
+            retrymethods=IDEMPOTENT_METHODS, retrystatuses=RETRY_STATUSES, maxretryafter=120.0,
+            breakerthreshold=5, breakerreset=30.0, metrics=None, sleep=time.sleep, clock=time.time):
+        self._maxretries    = maxretries
+        self._backoff       = backoff
+        self._maxbackoff    = maxbackoff
+        self._retrymethods  = retrymethods
+        self._retrystatuses = retrystatuses
+        self._maxretryafter = maxretryafter
+        self._breakerthreshold = breakerthreshold
+        self._breakerreset  = breakerreset
+        self._metrics       = metrics
+        self._sleep         = sleep
+        self._clock         = clock
+        self._breakers      = {}    # host -> CircuitBreaker
+        self._lock          = threading.Lock()
+        self._stats         = (
+            { "requests":   0       # requests attempted, including retries
+            , "retries":    0       # requests repeated after failure
+            , "retrywait":  0.0     # total time waiting before retries
+            , "failures":   0       # failed attempts
+            , "rejected":   0       # requests refused by open circuit
+            })
+        return
+
+    def stats(self):
+        """
+        Return a copy of the usage counters, including the state of the
+        circuit breaker for each host as "circuits"
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            breakers = self._breakers.items()
+        stats["circuits"] = dict([ (host, b.state()) for (host, b) in breakers ])
+        return stats
+
+    def count(self, name, value=1):
+        with self._lock:
+            self._stats[name] += value
+        return
+
+    def breaker(self, host):
+        """
+        Return circuit breaker for the indicated host
+        """
+        with self._lock:
+            if host not in self._breakers:
+                onchange = None
+                if self._metrics:
+                    onchange = self.reportStateChange(host)
+                self._breakers[host] = CircuitBreaker(
+                    self._breakerthreshold, self._breakerreset, clock=self._clock,
+                    onchange=onchange)
+            return self._breakers[host]
+
+    def reportStateChange(self, host):
+        """
+        Return function that reports state changes of the circuit breaker for
+        the indicated host to the metrics sink
+        """
+        def onchange(state):
+            self._metrics.increment("circuit_state_changes_total", { "host": host, "state": state })
+            return
+        return onchange
+
+    def delay(self, retry, retryafter=None):
+        """
+        Return delay in seconds before retry number `retry` (counting from 0),
+        given the value of any Retry-After response header
+        """
+        wait = parseRetryAfter(retryafter, now=self._clock())
+        if wait is not None:
+            return min(wait, self._maxretryafter)
+        return random.uniform(0, min(self._maxbackoff, self._backoff*(2**retry)))
+
+    def canRetry(self, method, body):
+        """
+        Return True if a request with the given method and body may be retried
+        """
+        return ( method in self._retrymethods and
+                 (body is None or isinstance(body, basestring) or
+                  (hasattr(body, "seek") and hasattr(body, "tell"))) )
+
+    def execute(self, host, method, body, func):
+        """
+        Call func() to perform an HTTP request, retrying as required.
+
+        func returns (status, reason, headers, ...), where headers is a
+        dictionary keyed by lowercase header name.  A seekable body is
+        rewound to its initial position before a retry.
+
+        Returns the result from the final attempt, or raises the exception
+        raised by the final attempt, or CircuitOpenError.  Any exception
+        raised by func() counts as a failure for the host's circuit breaker,
+        so that a failed trial request reopens the circuit.
+        """
+        breaker  = self.breaker(host)
+        retrying = self.canRetry(method, body)
+        bodypos  = None
+        if hasattr(body, "seek") and hasattr(body, "tell"):
+            bodypos = body.tell()
+        retry = 0
+        while True:
+            if not breaker.allowRequest():
+                self.count("rejected")
+                if self._metrics:
+                    self._metrics.increment("circuit_rejections_total", { "host": host })
+                raise CircuitOpenError(value="%s request refused"%method, host=host)
+            self.count("requests")
+            try:
+                result = func()
+            except RETRY_EXCEPTIONS, e:
+                breaker.recordFailure()
+                self.count("failures")
+                if isinstance(e, ssl.SSLError) or not retrying or retry >= self._maxretries:
+                    raise
+                wait   = self.delay(retry)
+                reason = repr(e)
+            except:
+                breaker.recordFailure()
+                self.count("failures")
+                raise
+            else:
+                status = result[0]
+                if status not in self._retrystatuses and status < 500:
+                    breaker.recordSuccess()
+                    return result
+                breaker.recordFailure()
+                self.count("failures")
+                if ( not retrying or retry >= self._maxretries or
+                     status not in self._retrystatuses ):
+                    return result
+                wait   = self.delay(retry, result[2].get("retry-after"))
+                reason = "%03d %s"%(status, result[1])
+            log.info("RetryPolicy: retry %s %s in %.2fs after %s"%(method, host, wait, reason))
+            self.count("retries")
+            self.count("retrywait", wait)
+            if self._metrics:
+                self._metrics.increment("request_retries_total", { "host": host, "method": method })
+            self._sleep(wait)
+            if bodypos is not None:
+                body.seek(bodypos)
+            retry += 1
+
+# End.
@@ -0,0 +1,265 @@
+"""
+Client-side cache of SPARQL query results, for use by SparqlHttpClient
+"""
+
+import re
+import time
+import hashlib
+import threading
+import logging
+
+from LRUCache import LRUCache
+from ContentStore import ContentStore, contentDigest
+
+# Logging object
+log = logging.getLogger(__name__)
+
+# Query tokens:  long and short string literals and IRI references are
+# kept as they are, comments are dropped and whitespace is collapsed
+
+QUERY_TOKEN_RE = re.compile(
+    r'("""(?:[^"\\]|\\.|"(?!""))*"""' r"|'''(?:[^'\\]|\\.|'(?!''))*'''"
+    r'|"(?:[^"\\\n\r]|\\.)*"' r"|'(?:[^'\\\n\r]|\\.)*'"
+    r'|<[^<>"{}|^`\\\x00-\x20]*>)'
+    r"|(#[^\n\r]*)|(\s+)")
+
+def normalizeQuery(query):
+    """
+    Return query text with comments removed and whitespace outside string
+    literals and IRIs collapsed, so that queries differing only in layout
+    share cache entries
+    """
+    parts = []
+    pos   = 0
+    space = True    # Suppress leading space
+    for match in QUERY_TOKEN_RE.finditer(query):
+        if match.start() > pos:
+            parts.append(query[pos:match.start()])
+            space = False
+        if match.group(1):
+            parts.append(match.group(1))
+            space = False
+        elif not space:
+            parts.append(" ")
+            space = True
+        pos = match.end()
+    parts.append(query[pos:])
+    return "".join(parts).rstrip(" ")
+
+def cacheKey(endpoint, accept, query):
+    """
+    Return cache key for a query sent to an endpoint with an Accept header
+    """
+    text = "\n".join([endpoint, accept or "", normalizeQuery(query)])
+    if isinstance(text, unicode):
+        text = text.encode("utf-8")
+    return hashlib.sha1(text).hexdigest()
+
+class SparqlCacheEntry(object):
+    """
+    Cached query result:  the response body, with the endpoint, Accept
+    header and normalized query text it was retrieved for, and the times
+    at which it was stored and expires (or None).  `data` may be None for
+    an entry describing a result held on disk, whose content is named by
+    `digest`.
+    """
+
+    def __init__(self, key, endpoint, accept, query, stored, expires, size, digest=None,
+            data=None):
+        self.key      = key
+        self.endpoint = endpoint
+        self.accept   = accept
+        self.query    = query
+        self.stored   = stored
+        self.expires  = expires
+        self.size     = size
+        self.digest   = digest
+        self.data     = data
+        return
+
+    def toJson(self):
+        return (
+            { "key":      self.key
+            , "endpoint": self.endpoint
+            , "accept":   self.accept
+            , "query":    self.query
+            , "stored":   self.stored
+            , "expires":  self.expires
+            , "size":     self.size
+            , "digest":   self.digest
+            })
+
+    @staticmethod
+    def fromJson(data):
+        return SparqlCacheEntry(data["key"], data["endpoint"], data["accept"], data["query"],
+            data["stored"], data["expires"], data["size"], data["digest"])
+
+class MemoryResultStore(object):
+    """
+    In-memory store for cached query results, holding at most `maxsize`
+    bytes of response bodies, with least recently used entries evicted
+    """
+
+    def __init__(self, maxsize=16*1024*1024):
+        self._cache = LRUCache(maxsize=maxsize, sizeof=lambda entry: entry.size)
+        return
+
+    def get(self, key):
+        return self._cache.get(key)
+
+    def put(self, entry):
+        self._cache.put(entry.key, entry)
+        return
+
+    def remove(self, key):
+        return self._cache.remove(key) is not None
+
+    def entries(self):
+        return self._cache.values()
+
+    def clear(self):
+        self._cache.clear()
+        return
+
+    def stats(self):
+        stats = self._cache.stats()
+        return { "entries": stats["entries"], "size": stats["size"], "evictions": stats["evictions"] }
+
+class DiskResultStore(object):
+    """
+    Store for cached query results in a local directory, which persists
+    between processes (see ContentStore).  The total size of stored results
+    is limited to `maxsize` bytes:  when this is exceeded, least recently
+    used entries are discarded.
+    """
+
+    def __init__(self, directory, maxsize=100*1024*1024):
+        self._store = ContentStore(directory, SparqlCacheEntry.fromJson, maxsize)
+        return
+
+    def get(self, key):
+        entry = self._store.get(key)
+        data  = entry and self._store.read(entry)
+        if data is None:
+            return None
+        return SparqlCacheEntry(entry.key, entry.endpoint, entry.accept, entry.query,
+            entry.stored, entry.expires, entry.size, entry.digest, data)
+
+    def put(self, entry):
+        self._store.put(SparqlCacheEntry(entry.key, entry.endpoint, entry.accept, entry.query,
+            entry.stored, entry.expires, entry.size, contentDigest(entry.data)), entry.data)
+        return
+
+    def remove(self, key):
+        return self._store.remove(key) is not None
+
+    def entries(self):
+        return self._store.entries()
+
+    def clear(self):
+        self._store.clear()
+        return
+
+    def stats(self):
+        return self._store.stats()
+
+class SparqlResultCache(object):
+    """
+    Cache of successful SPARQL query results, keyed by endpoint URI, Accept
+    header and normalized query text (see normalizeQuery).
+
+    Results are held by `store`, which is a MemoryResultStore (the default)
+    or a DiskResultStore, each of which limits the total size of stored
+    results by discarding least recently used entries.  A result is used
+    for up to `ttl` seconds after it was stored (or indefinitely, if ttl is
+    None).  The endpoint cannot tell the client when its data changes, so
+    after updating a dataset, call `invalidate` to discard results that
+    may be out of date.
+
+    Usage counters (hits, misses, stored, expired, invalidated, evictions)
+    are available from `stats`.  If `metrics` is supplied, it is a
+    RequestMetrics.MetricsSink to which each lookup is reported as
+    "sparql_cache_lookups_total", with label "result" ("hit" or "miss").
+    """
+
+    def __init__(self, store=None, ttl=300, metrics=None, clock=time.time):
+        self._store   = store or MemoryResultStore()
+        self._ttl     = ttl
+        self._metrics = metrics
+        self._clock   = clock
+        self._lock    = threading.Lock()
+        self._stats   = { "hits": 0, "misses": 0, "stored": 0, "expired": 0, "invalidated": 0 }
+        return
+
+    def count(self, name, value=1):
+        with self._lock:
+            self._stats[name] += value
+        return
+
+    def stats(self):
+        """
+        Return a copy of the cache usage counters
+        """
+        with self._lock:
+            stats = dict(self._stats)
+        stats.update(self._store.stats())
+        return stats
+
+    def lookup(self, endpoint, accept, query):
+        """
+        Return cached response body for a query, or None
+        """
+        key   = cacheKey(endpoint, accept, query)
+        entry = self._store.get(key)
+        if entry is not None and entry.expires is not None and entry.expires <= self._clock():
+            self._store.remove(key)
+            self.count("expired")
+            entry = None
+        if entry is None:
+            self.count("misses")
+        else:
+            self.count("hits")
+        if self._metrics:
+            self._metrics.increment("sparql_cache_lookups_total",
+                { "result": "miss" if entry is None else "hit" })
+        return entry and entry.data
+
+    def store(self, endpoint, accept, query, data, ttl=None):
+        """
+        Store response body for a successful query.  ttl, if given, overrides
+        the cache's time to live for this result.
+        """
+        ttl     = self._ttl if ttl is None else ttl
+        stored  = self._clock()
+        expires = None if ttl is None else stored+ttl
+        self._store.put(SparqlCacheEntry(cacheKey(endpoint, accept, query), endpoint, accept,
+            normalizeQuery(query), stored, expires, len(data), data=data))
+        self.count("stored")
+        return
+
+    def invalidate(self, endpoint=None, query=None):
+        """
+        Discard cached results for an endpoint (or all endpoints, if None),
+        optionally only those for a given query (with any Accept header).
+        Returns the number of results discarded.
+        """
+        normalized = query and normalizeQuery(query)
+        count = 0
+        for entry in self._store.entries():
+            if endpoint is not None and entry.endpoint != endpoint:
+                continue
+            if normalized is not None and entry.query != normalized:
+                continue
+            if self._store.remove(entry.key):
+                count += 1
+        self.count("invalidated", count)
+        return count
+
+    def clear(self):
+        """
+        Discard all cached results
+        """
+        self.invalidate()
+        return
+
+# End.
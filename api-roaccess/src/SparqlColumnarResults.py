@@ -0,0 +1,288 @@
+"""
+Compact column-oriented container for SPARQL SELECT query results
+"""
+
+import array
+import logging
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    import pandas
+except ImportError:
+    pandas = None
+
+# Logging object
+log = logging.getLogger(__name__)
+
+# Term kinds, as (type, qualifier key):  each term in a column is stored as
+# the index of its kind in this list (or UNBOUND), the index of its value
+# in the string table, and the index of its qualifier (datatype or language)
+# in the string table (or NO_QUALIFIER)
+
+TERM_KINDS = (
+    [ ("uri",           None)
+    , ("literal",       None)
+    , ("literal",       "datatype")
+    , ("literal",       "xml:lang")
+    , ("typed-literal", "datatype")
+    , ("bnode",         None)
+    ])
+
+TERM_KIND_INDEX = dict([ (k, i) for (i, k) in enumerate(TERM_KINDS) ])
+
+UNBOUND      = -1
+NO_QUALIFIER = -1
+
+def termKind(term):
+    """
+    Return (type, qualifier key) for a SPARQL JSON results term
+    """
+    if "xml:lang" in term:
+        return (term["type"], "xml:lang")
+    if "datatype" in term:
+        return (term["type"], "datatype")
+    return (term["type"], None)
+
+class StringTable(object):
+    """
+    Table of distinct strings, each stored once and referenced by index
+    """
+
+    __slots__ = ("strings", "_index")
+
+    def __init__(self):
+        self.strings = []
+        self._index  = {}
+        return
+
+    def __len__(self):
+        return len(self.strings)
+
+    def add(self, value):
+        """
+        Return index of string, adding it to the table if not present
+        """
+        i = self._index.get(value)
+        if i is None:
+            i = len(self.strings)
+            self.strings.append(value)
+            self._index[value] = i
+        return i
+
+class ResultColumn(object):
+    """
+    Terms bound to one variable in all rows of a result set
+    """
+
+    __slots__ = ("kinds", "values", "qualifiers")
+
+    def __init__(self):
+        self.kinds      = array.array("b")
+        self.values     = array.array("i")
+        self.qualifiers = array.array("i")
+        return
+
+class ResultRow(object):
+    """
+    View of one row of a ColumnarResults object, with dictionary-like
+    access to the term bound to each variable, in the SPARQL JSON results
+    form (e.g. { "type": "uri", "value": "http://..." })
+    """
+
+    __slots__ = ("_results", "_index")
+
+    def __init__(self, results, index):
+        self._results = results
+        self._index   = index
+        return
+
+    def __getitem__(self, var):
+        term = self._results.term(self._index, var)
+        if term is None:
+            raise KeyError(var)
+        return term
+
+    def __contains__(self, var):
+        return self._results.kind(self._index, var) != UNBOUND
+
+    def __eq__(self, other):
+        return self.asDict() == (other.asDict() if isinstance(other, ResultRow) else other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return "ResultRow(%r)"%(self.asDict())
+
+    def get(self, var, default=None):
+        term = self._results.term(self._index, var)
+        return default if term is None else term
+
+    def value(self, var, default=None):
+        """
+        Return value string of the term bound to a variable
+        """
+        return self._results.value(self._index, var, default)
+
+    def keys(self):
+        return [ v for v in self._results.vars if v in self ]
+
+    def asDict(self):
+        """
+        Return row as a SPARQL JSON results binding dictionary
+        """
+        return dict([ (v, self[v]) for v in self.keys() ])
+
+class ColumnarResults(object):
+    """
+    SPARQL SELECT query results stored by column.
+
+    Each term is stored as three array elements (kind, value and qualifier),
+    with all value, datatype and language strings held once in a shared
+    string table, so that repeated URIs and literals cost only an index.
+    This uses a fraction of the memory of the SPARQL JSON results structure
+    (a dictionary of term dictionaries for each row), from which it can be
+    built and to which it can be converted.
+
+    Rows are accessed by index or by iteration as ResultRow views, and
+    columns as lists of values (`column`), string table codes (`codes`),
+    or NumPy arrays and pandas DataFrames if those packages are installed.
+    """
+
+    def __init__(self, vars):
+        self.vars     = list(vars)
+        self.strings  = StringTable()
+        self._columns = dict([ (v, ResultColumn()) for v in self.vars ])
+        self._length  = 0
+        return
+
+    @staticmethod
+    def fromJson(results):
+        """
+        Create from SPARQL JSON results structure, as returned by json.loads
+        """
+        columnar = ColumnarResults(results["head"]["vars"])
+        for binding in results["results"]["bindings"]:
+            columnar.addBinding(binding)
+        return columnar
+
+    @staticmethod
+    def fromReader(reader):
+        """
+        Create from SparqlJsonReader, reading the remaining binding rows
+        """
+        columnar = ColumnarResults(reader.vars())
+        for binding in reader:
+            columnar.addBinding(binding)
+        return columnar
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError("Result row index out of range")
+        return ResultRow(self, index)
+
+    def __iter__(self):
+        for i in xrange(self._length):
+            yield ResultRow(self, i)
+
+    def addBinding(self, binding):
+        """
+        Append a row, given as a SPARQL JSON results binding dictionary
+        """
+        strings = self.strings
+        for (var, column) in self._columns.iteritems():
+            term = binding.get(var)
+            if term is None:
+                column.kinds.append(UNBOUND)
+                column.values.append(UNBOUND)
+                column.qualifiers.append(NO_QUALIFIER)
+                continue
+            kind = termKind(term)
+            column.kinds.append(TERM_KIND_INDEX[kind])
+            column.values.append(strings.add(term["value"]))
+            column.qualifiers.append(strings.add(term[kind[1]]) if kind[1] else NO_QUALIFIER)
+        self._length += 1
+        return
+
+    def kind(self, index, var):
+        return self._columns[var].kinds[index]
+
+    def term(self, index, var):
+        """
+        Return term for a row and variable as a dictionary, or None if unbound
+        """
+        column = self._columns[var]
+        kind   = column.kinds[index]
+        if kind == UNBOUND:
+            return None
+        (termtype, qualifier) = TERM_KINDS[kind]
+        term = { "type": termtype, "value": self.strings.strings[column.values[index]] }
+        if qualifier:
+            term[qualifier] = self.strings.strings[column.qualifiers[index]]
+        return term
+
+    def value(self, index, var, default=None):
+        """
+        Return value string for a row and variable, or default if unbound
+        """
+        i = self._columns[var].values[index]
+        return default if i == UNBOUND else self.strings.strings[i]
+
+    def column(self, var):
+        """
+        Return list of value strings for a variable, with None where unbound
+        """
+        strings = self.strings.strings
+        return [ None if i == UNBOUND else strings[i] for i in self._columns[var].values ]
+
+    def codes(self, var):
+        """
+        Return array of string table indexes of the values for a variable,
+        with -1 where unbound.  With `strings.strings` as categories, these
+        are the codes of a categorical column (e.g. for pandas).
+        """
+        return self._columns[var].values
+
+    def toJson(self):
+        """
+        Return results as a SPARQL JSON results structure
+        """
+        return (
+            { "head":    { "vars": list(self.vars) }
+            , "results": { "bindings": [ row.asDict() for row in self ] }
+            })
+
+    def toNumpy(self):
+        """
+        Return dictionary of NumPy object arrays of value strings for each
+        variable, with None where unbound.  Requires NumPy.
+        """
+        if numpy is None:
+            raise ImportError("NumPy is required for ColumnarResults.toNumpy")
+        strings = numpy.array(self.strings.strings+[None], dtype=object)
+        return dict([ (v, strings[numpy.frombuffer(self.codes(v), dtype=numpy.intc)])
+                      for v in self.vars ])
+
+    def toDataFrame(self):
+        """
+        Return pandas DataFrame with a categorical column of values for each
+        variable, with missing values where unbound.  Requires pandas.
+        """
+        if pandas is None:
+            raise ImportError("pandas is required for ColumnarResults.toDataFrame")
+        categories = pandas.Index(self.strings.strings, dtype=object)
+        return pandas.DataFrame(
+            dict([ (v, pandas.Categorical.from_codes(list(self.codes(v)), categories))
+                   for v in self.vars ]),
+            columns=self.vars)
+
+# End.
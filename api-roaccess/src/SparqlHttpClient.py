@@ -7,6 +7,9 @@ import sys
 
 import re
 import logging
+import threading
+import Queue
+import multiprocessing.pool
 import httplib
 import urllib
 import urlparse
@@ -16,24 +19,83 @@ except ImportError:
     # Running Python 2.5 with simplejson?
     import simplejson as json
 
+from HttpConnectionPool import HttpConnectionPool, ResponseStream
+from SparqlJsonResults import SparqlJsonReader
+from SparqlColumnarResults import ColumnarResults
+from SparqlPagination import PagedQuery, PAGE_SIZE
+
 logger = logging.getLogger(__name__)
 
+# Class for SPARQL query errors
+
+class SparqlHttpError(Exception):
+
+    def __init__(self, msg="SparqlHttpError", value=None, endpoint=None):
+        self._msg      = msg
+        self._value    = value
+        self._endpoint = endpoint
+        return
+
+    def __str__(self):
+        txt = self._msg
+        if self._endpoint: txt += " for "+str(self._endpoint)
+        if self._value:    txt += ": "+repr(self._value)
+        return txt
+
+    def __repr__(self):
+        return ( "SparqlHttpError(%s, value=%s, endpoint=%s)"%
+                 (repr(self._msg), repr(self._value), repr(self._endpoint)))
+
 class SparqlHttpClient(object):
     """
     Class implements simple SPARQL HTTP protocol client
+
+    Queries are sent over persistent connections, from a pool of up to
+    `maxconnections` connections for each endpoint host (see
+    HttpConnectionPool);  a client may be shared by several threads.
+    Idle connections are closed after `idletimeout` seconds, or when
+    `close` is called.
+
+    For an https: endpoint, sslcontext may be supplied to control certificate
+    validation;  otherwise a shared default SSL context is used.
+
+    If `cache` is supplied, it is a SparqlCache.SparqlResultCache in which
+    the results of successful queries are saved, and from which repeated
+    queries are answered;  streamed queries bypass the cache.  After
+    updating the endpoint's data, call `invalidateCache`.
     """
-    def __init__(self, endpointhost="localhost:3030", endpointpath="/ds", endpointuri=None):
+    def __init__(self, endpointhost="localhost:3030", endpointpath="/ds", endpointuri=None,
+            sslcontext=None, maxconnections=4, idletimeout=30.0, cache=None):
         # Default SPARQL endpoint details based on Fuseki defaults
-        self._endpointhost = None
-        self._endpointpath = None
-        self._endpointuri  = None
+        self._endpointscheme = "http"
+        self._endpointhost   = None
+        self._endpointpath   = None
+        self._endpointuri    = None
+        self._sslcontext     = sslcontext
+        self._maxconnections = maxconnections
+        self._idletimeout    = idletimeout
+        self._cache          = cache
+        self._pools          = {}   # (scheme, host) -> HttpConnectionPool
+        self._poolslock      = threading.Lock()
         self.setQueryEndpoint(endpointhost, endpointpath, endpointuri)
         return
 
+    def close(self):
+        """
+        Close all pooled connections
+        """
+        with self._poolslock:
+            pools = self._pools.values()
+            self._pools = {}
+        for pool in pools:
+            pool.close()
+        return
+
     def setQueryEndpoint(self, endpointhost=None, endpointpath=None, endpointuri=None):
         if endpointuri:
-            # assume scheme is http, no query, no fragment
+            # assume no query, no fragment
             up = urlparse.urlsplit(endpointuri)
+            self._endpointscheme = up.scheme or "http"
             endpointhost = up.netloc
             endpointpath = up.path
         if endpointhost: self._endpointhost = endpointhost
@@ -41,47 +103,219 @@ class SparqlHttpClient(object):
         logger.debug("setQueryEndPoint: endpointhost %s: " % self._endpointhost)
         logger.debug("setQueryEndPoint: endpointpath %s: " % self._endpointpath)
 
-    def doQueryGET(self, query, accept="application/JSON", JSON=True):
+    def endpointUri(self):
+        return "%s://%s%s"%(self._endpointscheme, self._endpointhost, self._endpointpath)
+
+    def error(self, msg, value=None):
+        return SparqlHttpError(msg=msg, value=value, endpoint=self.endpointUri())
+
+    def invalidateCache(self, query=None):
+        """
+        Discard cached results of queries to the current endpoint, or only
+        those of a given query.  Returns the number of results discarded.
+        """
+        if self._cache is None:
+            return 0
+        return self._cache.invalidate(endpoint=self.endpointUri(), query=query)
+
+    def connectionPool(self):
+        """
+        Return connection pool for the current SPARQL endpoint
+        """
+        key = (self._endpointscheme, self._endpointhost)
+        with self._poolslock:
+            if key not in self._pools:
+                self._pools[key] = HttpConnectionPool(self._endpointhost,
+                    scheme=self._endpointscheme, maxsize=self._maxconnections,
+                    idletimeout=self._idletimeout, sslcontext=self._sslcontext)
+            return self._pools[key]
+
+    def doRequest(self, method, path, body, reqheaders, stream=False):
+        """
+        Issue HTTP request to SPARQL endpoint using a pooled connection
+        Return status, reason(text), response body
+
+        If stream is True, the body of a 200 response is returned as a
+        ResponseStream, which must be read to the end or closed.
+        """
+        pool = self.connectionPool()
+        (hc, response) = pool.request(method, path, body, reqheaders)
+        if stream and response.status == 200:
+            return (response.status, response.reason, ResponseStream(pool, hc, response))
+        try:
+            responsedata = response.read()
+        except:
+            pool.release(hc, reuse=False)
+            raise
+        pool.release(hc)
+        return (response.status, response.reason, responsedata)
+
+    def queryResult(self, status, responsedata, JSON, stream, columnar):
+        """
+        Return result for a query response body
+        """
+        if status == 200 and JSON:
+            if columnar and isinstance(responsedata, basestring):
+                return ColumnarResults.fromJson(json.loads(responsedata))
+            if columnar:
+                with SparqlJsonReader(responsedata) as reader:
+                    return ColumnarResults.fromReader(reader)
+            if stream:
+                return SparqlJsonReader(responsedata)
+            return json.loads(responsedata)
+        return responsedata
+
+    def sendQuery(self, method, path, body, reqheaders, query, accept, JSON, stream, columnar):
+        """
+        Send query request, or answer it from the cache, and return
+        ((status, reason), result)
+        """
+        usecache = self._cache is not None and not stream
+        if usecache:
+            responsedata = self._cache.lookup(self.endpointUri(), accept, query)
+            if responsedata is not None:
+                return ((200, "OK"), self.queryResult(200, responsedata, JSON, False, columnar))
+        (status, reason, responsedata) = self.doRequest(method, path, body, reqheaders,
+            stream=stream or (columnar and not usecache))
+        if usecache and status == 200:
+            self._cache.store(self.endpointUri(), accept, query, responsedata)
+        return ((status, reason), self.queryResult(status, responsedata, JSON, stream, columnar))
+
+    def doQueryGET(self, query, accept="application/JSON", JSON=True, stream=False,
+            columnar=False):
         """
         Issue SPARQL query as HTTP GET request.
+
+        If stream is True, the result of a successful query is read as it is
+        used:  with JSON, a SparqlJsonReader which returns binding rows as
+        they are received, otherwise a ResponseStream.  Either must be read
+        to the end or closed, to release the connection used.
+
+        If columnar is True, the JSON result of a successful SELECT query is
+        returned as a ColumnarResults object, which is built as the response
+        is read.
         """
         ###print "---- query "+query
         reqheaders   = {
             "Accept":       accept
             }
-        hc = httplib.HTTPConnection(self._endpointhost)
         encodequery  = urllib.urlencode({"query": query})
-        hc.request("GET", self._endpointpath+"?"+encodequery, None, reqheaders)
-        response = hc.getresponse()
-        status = response.status
-        reason = response.reason
-        responsedata = response.read()
-        hc.close()
-        ###print "---- responsedata "+responsedata
-        if status == 200 and JSON:
-            responsedata = json.loads(responsedata)
-        return ((status, reason), responsedata)
+        return self.sendQuery("GET", self._endpointpath+"?"+encodequery, None, reqheaders,
+            query, accept, JSON, stream, columnar)
 
-    def doQueryPOST(self, query, accept="application/JSON", JSON=True):
+    def doQueryPOST(self, query, accept="application/JSON", JSON=True, stream=False,
+            columnar=False):
         """
         Issue SPARQL query as HTTP POST request.
+
+        stream and columnar are as for doQueryGET.
         """
         ###print "---- query "+query
         reqheaders   = {
             "Content-type": "application/x-www-form-urlencoded",
             "Accept":       accept
             }
-        hc = httplib.HTTPConnection(self._endpointhost)
         encodequery  = urllib.urlencode({"query": query})
-        hc.request("POST", self._endpointpath, encodequery, reqheaders)
-        response = hc.getresponse()
-        status = response.status
-        reason = response.reason
-        responsedata = response.read()
-        hc.close()
-        ###print "---- responsedata "+responsedata
-        if status == 200 and JSON:
-            responsedata = json.loads(responsedata)
-        return ((status, reason), responsedata)
+        return self.sendQuery("POST", self._endpointpath, encodequery, reqheaders,
+            query, accept, JSON, stream, columnar)
+
+    def doQueryPaged(self, query, pagesize=PAGE_SIZE, keyvar=None, orderby=None,
+            prefetch=True, post=False):
+        """
+        Issue SPARQL SELECT query as a series of requests for pages of up to
+        `pagesize` rows, and return a PagedQuery that iterates over the
+        bindings of all pages, requesting each page as it is needed.
+
+        Pages are selected using LIMIT and OFFSET, with the query ordered by
+        `orderby` if it has no ORDER BY clause, or using keyset pagination on
+        variable `keyvar` if given.  If `prefetch` is True, the next page
+        is requested while the current page is read.  If `post` is True,
+        queries are sent using POST rather than GET.  See PagedQuery.
+        """
+        return PagedQuery(self, query, pagesize=pagesize, keyvar=keyvar, orderby=orderby,
+            prefetch=prefetch, post=post)
+
+    def doQueries(self, queries, concurrency=None, ordered=True, post=False,
+            accept="application/JSON", JSON=True, columnar=False):
+        """
+        Issue a number of independent SPARQL queries concurrently, and
+        return an iterator over their results.
+
+        queries is a list or other iterable of query strings.  Up to
+        `concurrency` queries (default, the connection pool size) are in
+        progress at any time, using pooled connections to the endpoint.
+        Queries are taken from `queries` as they are needed, so that no more
+        than twice that number are submitted but not yet returned.
+        If `ordered` is True, results are returned in the order of the
+        queries;  otherwise they are returned as each query completes.
+        accept, JSON and columnar are as for doQueryGET, and queries are
+        sent using POST rather than GET if `post` is True.
+
+        Each result is a dictionary with keys "index" (position of the
+        query in `queries`), "query", "status", "reason", "result" (as
+        returned by doQueryGET) and "error", which is None, or for a query
+        that fails, the exception raised or a SparqlHttpError for a non-200
+        response.  Stopping iteration early cancels queries not yet started.
+        """
+        def runQuery(item):
+            (index, query) = item
+            result = (
+                { "index":  index
+                , "query":  query
+                , "status": None
+                , "reason": None
+                , "result": None
+                , "error":  None
+                })
+            try:
+                if post:
+                    ((status, reason), data) = self.doQueryPOST(query, accept=accept,
+                        JSON=JSON, columnar=columnar)
+                else:
+                    ((status, reason), data) = self.doQueryGET(query, accept=accept,
+                        JSON=JSON, columnar=columnar)
+                result["status"] = status
+                result["reason"] = reason
+                result["result"] = data
+                if status != 200:
+                    result["error"] = self.error("Error executing query",
+                        "%03d %s"%(status, reason))
+            except Exception, e:
+                logger.warn("doQueries: query %d: %s"%(index, e))
+                result["error"] = e
+            return result
+        concurrency = concurrency or self._maxconnections
+        workers     = multiprocessing.pool.ThreadPool(concurrency)
+        items       = enumerate(queries)
+        done        = Queue.Queue()     # Completed results
+        ready       = {}                # Completed results by index, for ordered
+        nextindex   = 0
+        outstanding = 0                 # Submitted but not returned
+        exhausted   = False
+        try:
+            while True:
+                while not exhausted and outstanding < 2*concurrency:
+                    item = next(items, None)
+                    if item is None:
+                        exhausted = True
+                        break
+                    workers.apply_async(runQuery, (item,), callback=done.put)
+                    outstanding += 1
+                if outstanding == 0:
+                    break
+                if ordered:
+                    while nextindex not in ready:
+                        result = done.get()
+                        ready[result["index"]] = result
+                    result = ready.pop(nextindex)
+                    nextindex += 1
+                else:
+                    result = done.get()
+                outstanding -= 1
+                yield result
+        finally:
+            workers.terminate()
+            workers.join()
+        return
 
 # End.
@@ -0,0 +1,221 @@
+"""
+Incremental parser for SPARQL query results in JSON format
+(http://www.w3.org/TR/sparql11-results-json/)
+"""
+
+import re
+import json
+import collections
+import logging
+
+# Logging object
+log = logging.getLogger(__name__)
+
+# Size of block read from the results stream
+
+CHUNK_SIZE = 64*1024
+
+WHITESPACE_RE = re.compile(r"[ \t\n\r]*")
+
+class SparqlJsonReader(object):
+    """
+    Read SPARQL JSON results from a stream, returning binding rows one at
+    a time as they are parsed.
+
+    The results object is parsed incrementally:  each binding row in the
+    results "bindings" array is decoded and returned separately, and all
+    other values (e.g. "head", "boolean") are decoded whole.  Input is read
+    in blocks of `chunksize` bytes as it is needed, and bytes before the
+    current binding are discarded, so memory use does not depend on the
+    number of rows.
+
+    stream is a file-like object with a `read(amt)` method, e.g. a
+    ResponseStream.  Usage:
+
+        reader = SparqlJsonReader(stream)
+        vars   = reader.vars()
+        for binding in reader:
+            ... binding[var]["value"] ...
+
+    Malformed input raises ValueError.
+    """
+
+    def __init__(self, stream, chunksize=CHUNK_SIZE):
+        self._stream    = stream
+        self._chunksize = chunksize
+        self._decoder   = json.JSONDecoder()
+        self._buf       = ""
+        self._pos       = 0
+        self._eof       = False
+        self._events    = self.iterEvents()
+        self._pending   = collections.deque()   # Bindings read while looking for head
+        self._done      = False
+        self.head       = None
+        self.boolean    = None
+        return
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exctype, excval, exctraceback):
+        self.close()
+        return False
+
+    def __iter__(self):
+        return self.bindings()
+
+    # Tokenizer
+
+    def fill(self):
+        """
+        Read next block from stream, returning False at end of input
+        """
+        if self._eof:
+            return False
+        data = self._stream.read(self._chunksize)
+        if not data:
+            self._eof = True
+            return False
+        self._buf = self._buf[self._pos:]+data
+        self._pos = 0
+        return True
+
+    def peek(self):
+        while True:
+            self._pos = WHITESPACE_RE.match(self._buf, self._pos).end()
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self.fill():
+                return ""
+
+    def expect(self, chars):
+        c = self.peek()
+        if not c or c not in chars:
+            raise ValueError("Expected one of %r at %r"%(chars, self._buf[self._pos:self._pos+20]))
+        self._pos += 1
+        return c
+
+    def value(self):
+        """
+        Decode next JSON value, reading more input as required
+        """
+        self.peek()
+        while True:
+            try:
+                (value, end) = self._decoder.raw_decode(self._buf, self._pos)
+            except ValueError:
+                if self.fill(): continue
+                raise
+            if ( end == len(self._buf) and isinstance(value, (int, long, float)) and
+                 self.fill() ):
+                continue    # Number may continue in next block
+            self._pos = end
+            return value
+
+    def members(self):
+        """
+        Iterate over names of members of a JSON object:  the caller must
+        consume the value of each member before requesting the next name
+        """
+        self.expect("{")
+        if self.peek() == "}":
+            self._pos += 1
+            return
+        while True:
+            name = self.value()
+            if not isinstance(name, basestring):
+                raise ValueError("Expected member name, found %r"%(name,))
+            self.expect(":")
+            yield name
+            if self.expect(",}") == "}":
+                return
+
+    def iterEvents(self):
+        """
+        Iterate over (name, value) for top-level members of the results
+        object, except that each binding row is returned as ("binding", row)
+        """
+        for name in self.members():
+            if name != "results":
+                yield (name, self.value())
+                continue
+            for rname in self.members():
+                if rname != "bindings":
+                    self.value()        # e.g. "distinct", "ordered"
+                    continue
+                self.expect("[")
+                if self.peek() == "]":
+                    self._pos += 1
+                    continue
+                while True:
+                    yield ("binding", self.value())
+                    if self.expect(",]") == "]":
+                        break
+        if self.peek():
+            raise ValueError("Unexpected data after results: %r"%(self._buf[self._pos:self._pos+20]))
+        return
+
+    def nextEvent(self):
+        if self._done:
+            return None
+        try:
+            (name, value) = self._events.next()
+        except StopIteration:
+            self._done = True
+            return None
+        if name == "head":
+            self.head = value
+        elif name == "boolean":
+            self.boolean = value
+        return (name, value)
+
+    # Results access
+
+    def vars(self):
+        """
+        Return list of result variable names from the results head.  If the
+        head follows the bindings in the input, rows read before it are
+        retained and returned later by `bindings`.
+        """
+        while self.head is None and not self._done:
+            event = self.nextEvent()
+            if event and event[0] == "binding":
+                self._pending.append(event[1])
+        return (self.head or {}).get("vars", [])
+
+    def bindings(self):
+        """
+        Iterate over binding rows, each of which is a dictionary keyed by
+        variable name, as they are read
+        """
+        while self._pending:
+            yield self._pending.popleft()
+        while True:
+            event = self.nextEvent()
+            if event is None:
+                return
+            if event[0] == "binding":
+                yield event[1]
+
+    def readAll(self):
+        """
+        Read remaining input, and return the results as a complete results
+        structure, as returned by json.loads
+        """
+        bindings = list(self.bindings())
+        results  = { "head": self.head or {} }
+        if self.boolean is not None:
+            results["boolean"] = self.boolean
+        else:
+            results["results"] = { "bindings": bindings }
+        return results
+
+    def close(self):
+        """
+        Close the underlying stream
+        """
+        if hasattr(self._stream, "close"):
+            self._stream.close()
+        return
+
+# End.
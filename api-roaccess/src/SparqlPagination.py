@@ -0,0 +1,276 @@
+"""
+Paginated retrieval of SPARQL SELECT query results
+"""
+
+import re
+import multiprocessing.pool
+import logging
+
+# Logging object
+log = logging.getLogger(__name__)
+
+# Default number of rows requested for each page
+
+PAGE_SIZE = 1000
+
+# Patterns used to take apart a SELECT query
+
+PROLOGUE_RE   = re.compile(r"^(?:\s|#[^\n\r]*|BASE\s*<[^>]*>|PREFIX\s+[\w.-]*:\s*<[^>]*>)*", re.I)
+SELECT_RE     = re.compile(r"^\s*SELECT\b", re.I)
+SELECTVARS_RE = re.compile(r"^\s*SELECT\s+(?:DISTINCT\s+|REDUCED\s+)?((?:\?\w+\s*)+)(?:WHERE\b|\{)", re.I)
+MODIFIERS_RE  = re.compile(r"(?:\s*\b(?:LIMIT|OFFSET)\s+\d+)+\s*$", re.I)
+MODIFIER_RE   = re.compile(r"\b(LIMIT|OFFSET)\s+(\d+)", re.I)
+ORDERBY_RE    = re.compile(r"\bORDER\s+BY\b", re.I)
+DATASET_RE    = re.compile(r"\s*\bFROM\s+(?:NAMED\s+)?(<[^>]*>|[^\s{}]+)", re.I)
+
+def splitQuery(query):
+    """
+    Split a SELECT query into (prologue, body, limit, offset), where the
+    prologue contains any BASE and PREFIX declarations and comments before
+    the SELECT keyword, and limit and offset are the values of any LIMIT and
+    OFFSET modifiers at the end of the query (or None), which are removed
+    from the body.
+    """
+    prologue = PROLOGUE_RE.match(query).group(0)
+    body     = query[len(prologue):]
+    if not SELECT_RE.match(body):
+        raise ValueError("Paginated query must be a SELECT query: %r"%(query[:80],))
+    limit  = None
+    offset = None
+    modifiers = MODIFIERS_RE.search(body)
+    if modifiers:
+        for (name, value) in MODIFIER_RE.findall(modifiers.group(0)):
+            if name.upper() == "LIMIT":
+                limit = int(value)
+            else:
+                offset = int(value)
+        body = body[:modifiers.start()]
+    return (prologue, body.strip(), limit, offset)
+
+def splitDataset(body):
+    """
+    Split the FROM and FROM NAMED clauses from the body of a SELECT query,
+    and return (body, dataset), where dataset is the text of the clauses
+    (or "")
+    """
+    brace   = body.find("{")
+    head    = body if brace < 0 else body[:brace]
+    dataset = " ".join([ m.group(0).strip() for m in DATASET_RE.finditer(head) ])
+    return (DATASET_RE.sub("", head)+body[len(head):], dataset)
+
+def quoteLiteral(value):
+    return '"%s"'%(value.replace("\\", "\\\\").replace('"', '\\"')
+                        .replace("\n", "\\n").replace("\r", "\\r"))
+
+def keyCondition(keyvar, term):
+    """
+    Return FILTER expression selecting rows whose key variable follows a
+    term from a SPARQL JSON results binding in ORDER BY order
+    """
+    if term["type"] == "uri":
+        return "STR(?%s) > %s"%(keyvar, quoteLiteral(term["value"]))
+    if term["type"] in ["literal", "typed-literal"]:
+        literal = quoteLiteral(term["value"])
+        if "datatype" in term:
+            literal += "^^<%s>"%(term["datatype"])
+        elif "xml:lang" in term:
+            literal += "@"+term["xml:lang"]
+        return "?%s > %s"%(keyvar, literal)
+    raise ValueError("Cannot paginate on %s value of ?%s"%(term["type"], keyvar))
+
+class PagedQuery(object):
+    """
+    Iterator over the results of a SPARQL SELECT query, retrieved in pages
+    of up to `pagesize` rows, so that no single request returns a large
+    result set.
+
+    By default, pages are selected by adding LIMIT and OFFSET modifiers to
+    the query.  So that each page continues where the last one ended, the
+    query is ordered:  if it has no ORDER BY clause, `orderby` is used (e.g.
+    "?s ?p"), or else the variables selected by the query, if listed.
+
+    If `keyvar` is given, keyset pagination is used instead:  the query is
+    ordered by that variable, and each page after the first is selected by
+    a FILTER on values following the last value of the previous page, which
+    avoids the endpoint re-evaluating skipped rows for large offsets.  The
+    key variable must be bound in every row, with a distinct value.  The
+    original query becomes a subquery, so any FROM and FROM NAMED clauses
+    are moved to the outer query.
+
+    LIMIT and OFFSET modifiers at the end of the original query are applied
+    to the results as a whole.
+
+    No request is sent until the first row is read.  If `prefetch` is True,
+    the next page is requested in a background thread while the current
+    page is being read, so at most two pages are held in memory at a time.
+    Rows are returned as SPARQL JSON results binding dictionaries.  A query
+    that fails raises the client's error (SparqlHttpError).  Usage:
+
+        for binding in client.doQueryPaged(query, pagesize=5000):
+            ... binding[var]["value"] ...
+    """
+
+    def __init__(self, client, query, pagesize=PAGE_SIZE, keyvar=None, orderby=None,
+            prefetch=True, post=False):
+        if pagesize < 1:
+            raise ValueError("Page size must be at least 1")
+        (self._prologue, self._body, limit, offset) = splitQuery(query)
+        self._dataset   = ""
+        self._client    = client
+        self._pagesize  = pagesize
+        self._keyvar    = keyvar and keyvar.lstrip("?$")
+        self._orderby   = orderby
+        self._post      = post
+        self._offset    = offset or 0       # Offset of next page (LIMIT/OFFSET)
+        self._skip      = 0                 # Rows still to be skipped (keyset)
+        self._after     = None              # Last key value read (keyset)
+        self._remaining = limit             # Rows still wanted, or None
+        self._workers   = None
+        self._pending   = None              # Page request in progress
+        self._pagelimit = None              # Rows requested for pending page
+        self._done      = False
+        self._rows      = []
+        self._pos       = 0
+        self.head       = None
+        self.pages      = 0
+        if self._keyvar:
+            (self._body, self._dataset) = splitDataset(self._body)
+            self._skip   = self._offset
+            self._offset = 0
+        elif not ORDERBY_RE.search(self._body) and not self._orderby:
+            selectvars = SELECTVARS_RE.match(self._body)
+            if selectvars:
+                self._orderby = " ".join(selectvars.group(1).split())
+            else:
+                log.warn("PagedQuery: no ordering for query, pages may overlap")
+        if prefetch:
+            self._workers = multiprocessing.pool.ThreadPool(1)
+        return
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exctype, excval, exctb):
+        self.close()
+        return False
+
+    def __iter__(self):
+        return self
+
+    def pageQuery(self):
+        """
+        Return (query, limit) for the next page of results
+        """
+        limit = self._pagesize
+        if self._keyvar:
+            where = "{ "+self._body+" }"
+            if self._after is not None:
+                where += " FILTER ( "+keyCondition(self._keyvar, self._after)+" )"
+            query = "SELECT * %sWHERE { %s } ORDER BY ?%s LIMIT %d"%(
+                self._dataset and self._dataset+" ", where, self._keyvar, limit)
+        else:
+            if self._remaining is not None:
+                limit = min(limit, self._remaining)
+            query = self._body
+            if self._orderby and not ORDERBY_RE.search(self._body):
+                query += " ORDER BY "+self._orderby
+            query += " LIMIT %d OFFSET %d"%(limit, self._offset)
+        query = self._prologue+query
+        if isinstance(query, unicode):
+            query = query.encode("utf-8")
+        return (query, limit)
+
+    def fetchPage(self, query):
+        """
+        Send query for a page, and return the results structure
+        """
+        if self._post:
+            ((status, reason), result) = self._client.doQueryPOST(query)
+        else:
+            ((status, reason), result) = self._client.doQueryGET(query)
+        if status != 200:
+            raise self._client.error("Error retrieving page of query results",
+                "%03d %s"%(status, reason))
+        return result
+
+    def startPage(self):
+        (query, self._pagelimit) = self.pageQuery()
+        log.debug("PagedQuery.startPage: %s"%(query))
+        if self._workers:
+            self._pending = self._workers.apply_async(self.fetchPage, (query,))
+        else:
+            self._pending = query
+        return
+
+    def nextPage(self):
+        """
+        Read next page of rows, and start request for the following page.
+        Returns False if there are no more pages.
+        """
+        if self._pending is None:
+            if self._done:
+                return False
+            self.startPage()
+        if self._workers:
+            result = self._pending.get()
+        else:
+            result = self.fetchPage(self._pending)
+        self._pending = None
+        self.pages   += 1
+        if self.head is None:
+            self.head = result.get("head", {})
+        rows = result.get("results", {}).get("bindings", [])
+        more = len(rows) >= self._pagelimit
+        if self._keyvar:
+            if rows:
+                if self._keyvar not in rows[-1]:
+                    raise self._client.error("Key variable not bound in query results", self._keyvar)
+                self._after = rows[-1][self._keyvar]
+            skipped    = min(self._skip, len(rows))
+            rows       = rows[skipped:]
+            self._skip -= skipped
+        else:
+            self._offset += len(rows)
+        if self._remaining is not None:
+            rows = rows[:self._remaining]
+            self._remaining -= len(rows)
+            more = more and self._remaining > 0
+        if more:
+            self.startPage()
+        else:
+            self._done = True
+        self._rows = rows
+        self._pos  = 0
+        return True
+
+    def next(self):
+        while self._pos >= len(self._rows):
+            if not self.nextPage():
+                self.close()
+                raise StopIteration
+        row = self._rows[self._pos]
+        self._pos += 1
+        return row
+
+    def vars(self):
+        """
+        Return list of result variable names, reading the first page if needed
+        """
+        if self.head is None and not self._done:
+            self.nextPage()
+        return (self.head or {}).get("vars", [])
+
+    def close(self):
+        """
+        Stop reading results.  A page request in progress is allowed to
+        complete in the background.
+        """
+        self._done    = True
+        self._pending = None
+        self._rows    = []
+        if self._workers:
+            self._workers.close()
+            self._workers = None
+        return
+
+# End.
@@ -0,0 +1,654 @@
+"""
+Local stand-in HTTP server for testing RO SRS and SPARQL clients
+
+This provides a minimal in-memory emulation of the RO SRS interface used by
+ROSRS_Session, running in a background thread, so that client behaviour can
+be tested without access to a live RODL service.
+"""
+
+import re
+import json
+import ssl
+import time
+import threading
+import email.utils
+import hashlib
+import urlparse
+import StringIO
+import zipfile
+import BaseHTTPServer
+import SocketServer
+import logging
+
+import rdflib, rdflib.graph
+
+from ro_namespaces import RDF, ORE, RO, AO, DCTERMS
+
+# Logging object
+log = logging.getLogger(__name__)
+
+# Emulated RO SRS state
+
+class StandInRO(object):
+    """
+    Emulated research object:  aggregated resources, proxies and annotations
+    """
+
+    def __init__(self, uri, info):
+        self.uri         = uri
+        self.info        = info
+        self.manifesturi = uri+".ro/manifest.rdf"
+        self.proxies     = {}   # proxyuri -> resuri
+        self.resources   = {}   # resuri -> (ctype, data), for internal resources
+        self.annotations = {}   # annuri -> (resuri, bodyuri)
+        self.listbodies  = True # Include annotation bodies in manifest?
+        self.counter     = 0
+        self.version     = 0
+        self.mtime       = time.time()
+        self.zipcache    = (None, None)
+        return
+
+    def modified(self):
+        """
+        Record change to RO manifest content
+        """
+        self.version += 1
+        self.mtime    = time.time()
+        return
+
+    def manifestValidators(self):
+        """
+        Return (etag, last-modified) header values for the current manifest
+        """
+        return ('"%s-%d"'%(id(self), self.version), email.utils.formatdate(self.mtime, usegmt=True))
+
+    def newUri(self, kind):
+        self.counter += 1
+        return "%s.ro/%s/%d"%(self.uri, kind, self.counter)
+
+    def getProxy(self, resuri):
+        for (p, r) in self.proxies.items():
+            if r == resuri: return p
+        return None
+
+    def manifest(self):
+        """
+        Return manifest for this RO as RDF/XML
+        """
+        rouri = rdflib.URIRef(self.uri)
+        graph = rdflib.graph.Graph()
+        graph.add( (rouri, RDF.type,            RO.ResearchObject) )
+        graph.add( (rouri, ORE.isDescribedBy,   rdflib.URIRef(self.manifesturi)) )
+        graph.add( (rouri, DCTERMS.creator,     rdflib.Literal(self.info.get("creator", ""))) )
+        graph.add( (rouri, DCTERMS.created,     rdflib.Literal(self.info.get("date", ""))) )
+        for (p, r) in self.proxies.items():
+            graph.add( (rouri, ORE.aggregates,        rdflib.URIRef(r)) )
+            graph.add( (rdflib.URIRef(p), RDF.type,   ORE.Proxy) )
+            graph.add( (rdflib.URIRef(p), ORE.proxyFor, rdflib.URIRef(r)) )
+            graph.add( (rdflib.URIRef(p), ORE.proxyIn,  rouri) )
+        for (a, (r, b)) in self.annotations.items():
+            graph.add( (rouri, ORE.aggregates,  rdflib.URIRef(a)) )
+            graph.add( (rdflib.URIRef(a), RDF.type, RO.AggregatedAnnotation) )
+            graph.add( (rdflib.URIRef(a), AO.annotatesResource, rdflib.URIRef(r)) )
+            if self.listbodies:
+                graph.add( (rdflib.URIRef(a), AO.body, rdflib.URIRef(b)) )
+        return graph.serialize(format="xml")
+
+    def zipdata(self):
+        """
+        Return content of this RO as a ZIP file
+        """
+        # Manifest serialization order varies, so reuse ZIP until content changes
+        key = (self.version, sorted(self.resources.items()))
+        if self.zipcache[0] == key:
+            return self.zipcache[1]
+        zipbuf = StringIO.StringIO()
+        zipobj = zipfile.ZipFile(zipbuf, "w")
+        # Fixed timestamps, so that content is the same for each request
+        datetime = time.gmtime(self.mtime)[:6]
+        zipobj.writestr(zipfile.ZipInfo(".ro/manifest.rdf", datetime), self.manifest())
+        for (resuri, (ctype, data)) in sorted(self.resources.items()):
+            zipobj.writestr(zipfile.ZipInfo(resuri[len(self.uri):], datetime), data)
+        zipobj.close()
+        self.zipcache = (key, zipbuf.getvalue())
+        return self.zipcache[1]
+
+class StandInROSRS(object):
+    """
+    Emulated RO SRS service state:  a collection of ROs
+    """
+
+    def __init__(self, basepath="/ROs/"):
+        self.basepath = basepath
+        self.baseuri  = None    # Set when server starts
+        self.ros      = {}      # rouri -> StandInRO
+        self.redirects = {}     # uri -> (status, location), for any method
+        self.cachecontrol = None    # Cache-Control header for resources, if any
+        self.truncations  = []      # Byte counts after which to cut off next ZIP or resource responses
+        self.rangelength  = True    # Include resource length in Content-Range headers
+        self.rangeoverride = None   # (first, last) sent instead of requested range, if any
+        self.lock     = threading.RLock()
+        return
+
+    def findRO(self, uri):
+        """
+        Return RO that contains the given URI, or None
+        """
+        for rouri in self.ros:
+            if uri.startswith(rouri): return self.ros[rouri]
+        return None
+
+# Request handler for emulated RO SRS
+
+RANGE_RE     = re.compile(r"^bytes=(\d*)-(\d*)$")
+PROXY_FOR_RE = re.compile(r'''proxyFor\s+rdf:resource\s*=\s*"([^"]*)"''')
+ANN_RES_RE   = re.compile(r'''annotatesResource\s+rdf:resource\s*=\s*"([^"]*)"''')
+ANN_BODY_RE  = re.compile(r'''body\s+rdf:resource\s*=\s*"([^"]*)"''')
+
+class StandInHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """
+    Request handler for the emulated RO SRS
+    """
+
+    protocol_version = "HTTP/1.1"
+    wbufsize         = -1       # Buffer response; flushed after each request
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        self.timeout = self.server.idletimeout
+        self.server.countConnection()
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+        return
+
+    def log_message(self, format, *args):
+        log.debug("StandInHandler: "+format%args)
+        return
+
+    def requestUri(self):
+        return urlparse.urljoin(self.server.baseuri, self.path)
+
+    def readBody(self):
+        if (self.headers.getheader("transfer-encoding") or "").lower() == "chunked":
+            chunks = []
+            while True:
+                size = int(self.rfile.readline().split(";")[0], 16)
+                if size == 0: break
+                chunks.append(self.rfile.read(size))
+                self.rfile.readline()
+            while self.rfile.readline().strip():
+                pass    # Skip trailer
+            self.server.countChunkedRequest()
+            return "".join(chunks)
+        length = int(self.headers.getheader("content-length") or 0)
+        return self.rfile.read(length)
+
+    def parse_request(self):
+        # Simulated latency is added outside any lock on the server state
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        if not BaseHTTPServer.BaseHTTPRequestHandler.parse_request(self):
+            return False
+        failure = self.server.nextFailure()
+        if failure is None:
+            return True
+        # Injected failure: discard request and fail without calling do_XXX
+        self.readBody()
+        if failure == "reset":
+            self.close_connection = 1
+        else:
+            (status, retryafter) = failure
+            self.send_response(status)
+            self.send_header("Content-Length", "0")
+            if retryafter is not None:
+                self.send_header("Retry-After", str(retryafter))
+            self.end_headers()
+            self.wfile.flush()
+        return False
+
+    def sendResponse(self, status, body="", ctype="text/plain", headers=()):
+        self.send_response(status)
+        if body:
+            self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(body)))
+        for (h, v) in headers:
+            self.send_header(h, v)
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+        return
+
+    def notModified(self, etag, lastmodified):
+        """
+        Test conditional request headers against supplied validators
+        """
+        inm = self.headers.getheader("if-none-match")
+        if inm is not None:
+            return etag in [ t.strip() for t in inm.split(",") ] or inm.strip() == "*"
+        ims = self.headers.getheader("if-modified-since")
+        if ims is not None and lastmodified is not None:
+            imstime = email.utils.parsedate_tz(ims)
+            lmtime  = email.utils.parsedate_tz(lastmodified)
+            return imstime is not None and email.utils.mktime_tz(lmtime) <= email.utils.mktime_tz(imstime)
+        return False
+
+    def sendRanged(self, data, ctype, etag, kind):
+        """
+        Send response for a resource that supports single byte range
+        requests, counted as `kind` or `kind`+"-range", and cut off early
+        if a truncation has been configured
+        """
+        rosrs   = self.server.rosrs
+        status  = 200
+        headers = [("Accept-Ranges", "bytes"), ("ETag", etag)]
+        byterange = RANGE_RE.match(self.headers.getheader("range") or "")
+        ifrange   = self.headers.getheader("if-range")
+        if byterange and (ifrange is None or ifrange == etag):
+            (first, last) = byterange.groups()
+            if first:
+                (first, last) = (int(first), min(int(last or len(data)-1), len(data)-1))
+            else:
+                (first, last) = (max(0, len(data)-int(last or 0)), len(data)-1)
+            if first > last:
+                self.sendResponse(416, headers=[("Content-Range", "bytes */%d"%len(data))])
+                return
+            if rosrs.rangeoverride:
+                (first, last) = rosrs.rangeoverride
+            headers.append( ("Content-Range", "bytes %d-%d/%s"%(first, last,
+                len(data) if rosrs.rangelength else "*")) )
+            status = 206
+            kind  += "-range"
+            data   = data[first:last+1]
+        self.server.countRequest(kind)
+        self.sendTruncatable(status, data, ctype, headers)
+        return
+
+    def sendTruncatable(self, status, data, ctype, headers):
+        """
+        Send response with body, cut off early if a truncation has been
+        configured
+        """
+        rosrs = self.server.rosrs
+        with rosrs.lock:
+            truncate = rosrs.truncations.pop(0) if rosrs.truncations else None
+        if truncate is None:
+            self.sendResponse(status, data, ctype=ctype, headers=headers)
+            return
+        self.send_response(status)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(data)))
+        for (h, v) in headers:
+            self.send_header(h, v)
+        self.end_headers()
+        self.wfile.write(data[:truncate])
+        self.wfile.flush()
+        self.close_connection = 1
+        return
+
+    def sendRedirect(self, location, status=303):
+        self.sendResponse(status, headers=[("Location", location)])
+        return
+
+    def redirected(self, uri):
+        """
+        Send configured redirect for URI, if any, and return True if sent
+        """
+        rosrs = self.server.rosrs
+        with rosrs.lock:
+            redirect = rosrs.redirects.get(uri)
+        if redirect is None:
+            return False
+        self.readBody()
+        self.sendRedirect(redirect[1], status=redirect[0])
+        return True
+
+    def do_GET(self):
+        rosrs  = self.server.rosrs
+        uri    = self.requestUri()
+        if self.redirected(uri): return
+        accept = self.headers.getheader("accept") or "*/*"
+        with rosrs.lock:
+            if uri == rosrs.baseuri:
+                self.sendResponse(200, "".join([ u+"\n" for u in sorted(rosrs.ros) ]))
+                return
+            ro = rosrs.findRO(uri)
+            if ro is None:
+                self.sendResponse(404)
+            elif uri == ro.uri:
+                if "application/zip" in accept:
+                    data = ro.zipdata()
+                    self.sendRanged(data, "application/zip",
+                        '"%s"'%hashlib.md5(data).hexdigest(), "zip")
+                elif "text/html" in accept:
+                    self.sendRedirect(ro.uri+"?format=html")
+                else:
+                    self.sendRedirect(ro.manifesturi)
+            elif uri == ro.uri+"?format=html":
+                self.sendResponse(200, "<html><body>%s</body></html>"%ro.uri,
+                    ctype="text/html;charset=UTF-8")
+            elif uri == ro.manifesturi:
+                (etag, lastmodified) = ro.manifestValidators()
+                validators = [("ETag", etag), ("Last-Modified", lastmodified)]
+                if self.notModified(etag, lastmodified):
+                    self.server.countRequest("manifest-304")
+                    self.sendResponse(304, headers=validators)
+                else:
+                    self.server.countRequest("manifest")
+                    self.sendResponse(200, ro.manifest(), ctype="application/rdf+xml",
+                        headers=validators)
+            elif uri in ro.resources:
+                (ctype, data) = ro.resources[uri]
+                headers = [("ETag", '"%s"'%hashlib.md5(data).hexdigest())]
+                if rosrs.cachecontrol:
+                    headers.append( ("Cache-Control", rosrs.cachecontrol) )
+                if self.notModified(headers[0][1], None):
+                    self.server.countRequest("resource-304")
+                    self.sendResponse(304, headers=headers)
+                else:
+                    self.server.countRequest("resource")
+                    self.sendTruncatable(200, data, ctype, headers)
+            elif uri in ro.annotations:
+                self.server.countRequest("annotation-"+self.command)
+                self.sendRedirect(ro.annotations[uri][1])
+            else:
+                self.sendResponse(404)
+        return
+
+    def do_HEAD(self):
+        self.do_GET()
+        return
+
+    def do_POST(self):
+        rosrs = self.server.rosrs
+        uri   = self.requestUri()
+        if self.redirected(uri): return
+        ctype = self.headers.getheader("content-type") or ""
+        slug  = self.headers.getheader("slug")
+        body  = self.readBody()
+        with rosrs.lock:
+            if uri == rosrs.baseuri:
+                rouri = rosrs.baseuri+slug+"/"
+                if rouri in rosrs.ros:
+                    self.sendResponse(409)
+                    return
+                ro = StandInRO(rouri, json.loads(body))
+                rosrs.ros[rouri] = ro
+                self.sendResponse(201, ro.manifest(), ctype="application/rdf+xml",
+                    headers=[("Location", rouri)])
+                return
+            ro = rosrs.ros.get(uri)
+            if ro is None:
+                self.sendResponse(404)
+            elif ctype == "application/vnd.wf4ever.proxy":
+                m = PROXY_FOR_RE.search(body)
+                if m:
+                    resuri = m.group(1)
+                elif slug:
+                    resuri = urlparse.urljoin(ro.uri, slug)
+                else:
+                    resuri = ro.newUri("resources")
+                proxyuri = ro.newUri("proxies")
+                ro.proxies[proxyuri] = resuri
+                ro.modified()
+                self.sendResponse(201, headers=
+                    [ ("Location", proxyuri)
+                    , ("Link", '<%s>; rel="%s"'%(resuri, str(ORE.proxyFor)))
+                    ])
+            elif ctype == "application/vnd.wf4ever.annotation":
+                annuri = ro.newUri("annotations")
+                ro.annotations[annuri] = (
+                    urlparse.urljoin(ro.uri, ANN_RES_RE.search(body).group(1)),
+                    urlparse.urljoin(ro.uri, ANN_BODY_RE.search(body).group(1)))
+                ro.modified()
+                self.sendResponse(201, headers=[("Location", annuri)])
+            else:
+                self.sendResponse(415)
+        return
+
+    def do_PUT(self):
+        rosrs = self.server.rosrs
+        uri   = self.requestUri()
+        if self.redirected(uri): return
+        ctype = self.headers.getheader("content-type") or "application/octet-stream"
+        body  = self.readBody()
+        with rosrs.lock:
+            ro = rosrs.findRO(uri)
+            if ro is None:
+                self.sendResponse(404)
+            elif uri in ro.annotations:
+                ro.annotations[uri] = (
+                    urlparse.urljoin(ro.uri, ANN_RES_RE.search(body).group(1)),
+                    urlparse.urljoin(ro.uri, ANN_BODY_RE.search(body).group(1)))
+                ro.modified()
+                self.sendResponse(200)
+            elif ro.getProxy(uri):
+                status = 200 if uri in ro.resources else 201
+                ro.resources[uri] = (ctype, body)
+                self.sendResponse(status)
+            else:
+                self.sendResponse(404)
+        return
+
+    def do_DELETE(self):
+        rosrs = self.server.rosrs
+        uri   = self.requestUri()
+        if self.redirected(uri): return
+        with rosrs.lock:
+            ro = rosrs.findRO(uri)
+            if ro is None:
+                self.sendResponse(404)
+            elif uri == ro.uri:
+                del rosrs.ros[uri]
+                self.sendResponse(204)
+            elif uri in ro.proxies:
+                resuri = ro.proxies.pop(uri)
+                ro.resources.pop(resuri, None)
+                ro.modified()
+                self.sendResponse(204)
+            elif uri in ro.annotations:
+                del ro.annotations[uri]
+                ro.modified()
+                self.sendResponse(204)
+            else:
+                self.sendResponse(404)
+        return
+
+# Request handler for emulated SPARQL endpoint
+
+class StandInSparqlHandler(StandInHandler):
+    """
+    Request handler for an emulated (Fuseki-like) SPARQL endpoint.
+
+    Any query sent to the endpoint path is answered with the SPARQL JSON
+    results structure returned by the server's `sparqlresults` function,
+    or a 400 (Bad Request) response if that function raises ValueError.
+    """
+
+    def sparqlQuery(self, query):
+        try:
+            results = self.server.sparqlresults(query)
+        except ValueError, e:
+            self.sendResponse(400, str(e))
+            return
+        self.sendResponse(200, json.dumps(results), ctype="application/sparql-results+json")
+        return
+
+    def do_GET(self):
+        (path, _, querystr) = self.path.partition("?")
+        query = urlparse.parse_qs(querystr).get("query")
+        if path != self.server.basepath or not query:
+            self.sendResponse(404)
+            return
+        self.sparqlQuery(query[0])
+        return
+
+    def do_POST(self):
+        body  = self.readBody()
+        query = urlparse.parse_qs(body).get("query")
+        if self.path != self.server.basepath or not query:
+            self.sendResponse(404)
+            return
+        self.sparqlQuery(query[0])
+        return
+
+def defaultSparqlResults(query):
+    """
+    Default results for the emulated SPARQL endpoint:  a fixed set of bindings
+    """
+    return (
+        { "head":    { "vars": ["s", "o"] }
+        , "results": { "bindings":
+            [ { "s": { "type": "uri",     "value": "http://example.org/s%d"%i }
+              , "o": { "type": "literal", "value": "Value %d"%i }
+              } for i in range(3) ]
+            }
+        })
+
+# Server
+
+class StandInHTTPServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+
+    daemon_threads      = True
+    allow_reuse_address = True
+    request_queue_size  = 128
+
+    def handle_error(self, request, client_address):
+        log.debug("StandInHTTPServer: error handling request from %s"%(repr(client_address)), exc_info=True)
+        return
+
+    def countConnection(self):
+        with self.countlock:
+            self.connections += 1
+        return
+
+    def countChunkedRequest(self):
+        with self.countlock:
+            self.chunkedrequests += 1
+        return
+
+    def nextFailure(self):
+        with self.countlock:
+            if self.failures:
+                return self.failures.pop(0)
+        return None
+
+    def countRequest(self, kind):
+        with self.countlock:
+            self.requestcounts[kind] = self.requestcounts.get(kind, 0) + 1
+        return
+
+class StandInServer(object):
+    """
+    Run a stand-in server on a local port, in a background thread.
+
+    idletimeout, if not None, is the time in seconds after which the server
+    closes idle keep-alive connections.
+
+    latency, if not None, is a delay in seconds added to every response,
+    to emulate a remote server.
+
+    sslcert, if given, is the name of a PEM file containing a private key and
+    certificate, and the server accepts HTTPS connections.
+
+    With handler=StandInSparqlHandler, the server emulates a SPARQL endpoint
+    at basepath, answering queries using the `sparqlresults` function, which
+    may be replaced before the server is started.
+
+    Usage:
+        server = StandInServer()
+        srsuri = server.start()
+          :
+        server.stop()
+    """
+
+    def __init__(self, handler=StandInHandler, basepath="/ROs/", idletimeout=None,
+            latency=None, sslcert=None):
+        self._handler  = handler
+        self._basepath = basepath
+        self._idle     = idletimeout
+        self._latency  = latency
+        self._sslcert  = sslcert
+        self.sparqlresults = defaultSparqlResults
+        self._server   = None
+        self._thread   = None
+        return
+
+    def start(self):
+        """
+        Start server, and return base URI of emulated RO SRS or SPARQL endpoint
+        """
+        server = StandInHTTPServer(("localhost", 0), self._handler)
+        scheme = "http"
+        if self._sslcert:
+            sslcontext = ssl.SSLContext(ssl.PROTOCOL_SSLv23)
+            sslcontext.load_cert_chain(self._sslcert)
+            server.socket = sslcontext.wrap_socket(server.socket, server_side=True)
+            scheme = "https"
+        server.idletimeout = self._idle
+        server.latency     = self._latency
+        server.basepath    = self._basepath
+        server.sparqlresults = self.sparqlresults
+        server.connections = 0
+        server.chunkedrequests = 0
+        server.requestcounts   = {}
+        server.failures    = []
+        server.countlock   = threading.Lock()
+        server.baseuri     = "%s://localhost:%d%s"%(scheme, server.server_address[1], self._basepath)
+        server.rosrs       = StandInROSRS(self._basepath)
+        server.rosrs.baseuri = server.baseuri
+        self._server = server
+        self._thread = threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05})
+        self._thread.daemon = True
+        self._thread.start()
+        return server.baseuri
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+        return
+
+    def baseuri(self):
+        return self._server.baseuri
+
+    def connections(self):
+        """
+        Return number of client connections accepted by the server
+        """
+        return self._server.connections
+
+    def chunkedRequests(self):
+        """
+        Return number of requests received with chunked transfer encoding
+        """
+        return self._server.chunkedrequests
+
+    def requestCounts(self):
+        """
+        Return dictionary of request counts for selected kinds of request,
+        e.g. "manifest" for full manifest responses, "manifest-304" for
+        not-modified responses to conditional manifest requests.
+        """
+        with self._server.countlock:
+            return dict(self._server.requestcounts)
+
+    def injectFailures(self, failures):
+        """
+        Fail the next requests received:  failures is a list with an entry
+        for each request to fail, which is either "reset" to close the
+        connection without a response, or a response status code, or a
+        (status, retryafter) pair to include a Retry-After header.
+        """
+        with self._server.countlock:
+            for f in failures:
+                if f != "reset" and not isinstance(f, tuple):
+                    f = (f, None)
+                self._server.failures.append(f)
+        return
+
+    def rosrs(self):
+        """
+        Return emulated RO SRS state
+        """
+        return self._server.rosrs
+
+# End.
@@ -0,0 +1,315 @@
+#!/usr/bin/env python
+
+"""
+Module to test local HTTP cache, alone and with a local stand-in RO SRS
+"""
+
+import sys
+import os
+import shutil
+import tempfile
+import email.utils
+import unittest
+import logging
+
+from MiscLib import TestUtils
+
+from ROSRS_Session import ROSRS_Session
+from HttpCache import HttpCache, CacheEntry, parseCacheControl
+from StandInServer import StandInServer
+
+# Logging object
+log = logging.getLogger(__name__)
+
+# Clock for testing time-dependent behaviour
+
+class TestClock(object):
+
+    def __init__(self):
+        self.now = 1000000000.0
+        return
+
+    def __call__(self):
+        return self.now
+
+def responseHeaders(*headerlist):
+    headers = dict(headerlist)
+    headers["_headerlist"] = list(headerlist)
+    return headers
+
+# Test cases
+
+class TestHttpCache(unittest.TestCase):
+    """
+    This test suite tests HttpCache, alone and with ROSRS_Session
+    """
+
+    def setUp(self):
+        super(TestHttpCache, self).setUp()
+        self.clock    = TestClock()
+        self.cachedir = tempfile.mkdtemp(prefix="TestHttpCache")
+        self.server   = StandInServer()
+        self.srsuri   = self.server.start()
+        return
+
+    def tearDown(self):
+        super(TestHttpCache, self).tearDown()
+        self.server.stop()
+        shutil.rmtree(self.cachedir)
+        return
+
+    def cache(self, **kwargs):
+        return HttpCache(self.cachedir, clock=self.clock, **kwargs)
+
+    def store(self, cache, uri, data, *headerlist):
+        return cache.store(uri, {}, 200, "OK", responseHeaders(*headerlist), data,
+            self.clock.now, self.clock.now)
+
+    def session(self, cache, accesskey="dummy"):
+        rosrs = ROSRS_Session(self.srsuri, accesskey=accesskey, httpcache=cache)
+        self.addCleanup(rosrs.close)
+        return rosrs
+
+    def createRO(self, rosrs):
+        (status, reason, rouri, manifest) = rosrs.createRO("TestCacheRO",
+            "Test RO", "TestHttpCache.py", "2012-09-06")
+        self.assertEqual(status, 201)
+        rosrs.aggregateResourceInt(rouri, "data.txt", ctype="text/plain", body="Original\n")
+        return rouri
+
+    # Actual tests follow
+
+    def testParseCacheControl(self):
+        self.assertEqual(parseCacheControl('max-age=60, No-Cache, private="x"'),
+            { "max-age": "60", "no-cache": None, "private": "x" })
+        self.assertEqual(parseCacheControl(None), {})
+        return
+
+    def testFreshness(self):
+        now  = self.clock.now
+        date = email.utils.formatdate(now, usegmt=True)
+        def entry(*headerlist):
+            return CacheEntry("http://example.org/", 200, "OK", list(headerlist),
+                "0", 0, {}, now-2, now)
+        self.assertEqual(entry(("cache-control", "max-age=60")).freshnessLifetime(0.1, 3600), 60)
+        e = entry(("date", date), ("expires", email.utils.formatdate(now+30, usegmt=True)))
+        self.assertEqual(e.freshnessLifetime(0.1, 3600), 30)
+        self.assertEqual(entry(("date", date), ("expires", "0")).freshnessLifetime(0.1, 3600), 0)
+        e = entry(("date", date), ("last-modified", email.utils.formatdate(now-1000, usegmt=True)))
+        self.assertEqual(e.freshnessLifetime(0.1, 3600), 100)
+        self.assertEqual(e.freshnessLifetime(0.1, 50), 50)
+        self.assertEqual(entry(("etag", '"x"')).freshnessLifetime(0.1, 3600), 0)
+        # Age includes response delay, Age header and time since response
+        self.assertEqual(entry(("age", "10")).currentAge(now+5), 17)
+        return
+
+    def testFreshLookup(self):
+        cache = self.cache()
+        self.store(cache, "http://example.org/a", "Content A", ("cache-control", "max-age=60"))
+        entry = cache.lookup("http://example.org/a", {})
+        self.assertTrue(cache.isFresh(entry, {}))
+        self.assertFalse(cache.isFresh(entry, { "cache-control": "no-cache" }))
+        self.assertFalse(cache.isFresh(entry, { "cache-control": "max-age=0" }))
+        (status, reason, headers, data) = cache.response(entry)
+        self.assertEqual((status, data), (200, "Content A"))
+        self.clock.now += 60
+        self.assertFalse(cache.isFresh(entry, {}))
+        self.assertEqual(cache.response(entry)[2]["age"], "60")
+        self.assertEqual(cache.lookup("http://example.org/b", {}), None)
+        return
+
+    def testNotStored(self):
+        cache = self.cache()
+        self.store(cache, "http://example.org/a", "A", ("cache-control", "no-store, max-age=60"))
+        self.store(cache, "http://example.org/b", "B", ("etag", '"b"'), ("vary", "*"))
+        self.store(cache, "http://example.org/c", "C")
+        self.assertEqual(cache.stats()["entries"], 0)
+        return
+
+    def testVary(self):
+        cache = self.cache()
+        cache.store("http://example.org/a", { "accept": "text/turtle" }, 200, "OK",
+            responseHeaders(("etag", '"a"'), ("vary", "Accept")), "A",
+            self.clock.now, self.clock.now)
+        self.assertNotEqual(cache.lookup("http://example.org/a", { "accept": "text/turtle" }), None)
+        self.assertEqual(cache.lookup("http://example.org/a", { "accept": "text/plain" }), None)
+        return
+
+    def testCredentials(self):
+        cache = self.cache()
+        for (key, data) in [("Bearer one", "A1"), ("Bearer two", "A2"), (None, "A0")]:
+            reqheaders = { "authorization": key } if key else {}
+            cache.store("http://example.org/a", reqheaders, 200, "OK",
+                responseHeaders(("cache-control", "max-age=60")), data,
+                self.clock.now, self.clock.now)
+        for (key, data) in [("Bearer one", "A1"), ("Bearer two", "A2"), (None, "A0")]:
+            reqheaders = { "authorization": key } if key else {}
+            self.assertEqual(cache.response(cache.lookup("http://example.org/a", reqheaders))[3], data)
+        self.assertEqual(cache.lookup("http://example.org/a", { "authorization": "Bearer three" }), None)
+        # Credentials are not stored, and all variants persist and are invalidated together
+        for name in os.listdir(os.path.join(self.cachedir, "entries")):
+            with open(os.path.join(self.cachedir, "entries", name)) as f:
+                self.assertNotIn("Bearer", f.read())
+        cache = self.cache()
+        self.assertEqual(cache.stats()["entries"], 3)
+        cache.invalidate("http://example.org/a")
+        self.assertEqual(cache.stats()["entries"], 0)
+        return
+
+    def testEvictionAndSharing(self):
+        cache = self.cache(maxsize=25)
+        self.store(cache, "http://example.org/a", "0123456789", ("etag", '"a"'))
+        self.store(cache, "http://example.org/b", "0123456789", ("etag", '"a"'))
+        self.assertEqual(cache.stats()["size"], 10)
+        self.assertEqual(len(os.listdir(os.path.join(self.cachedir, "objects"))), 1)
+        self.store(cache, "http://example.org/c", "abcdefghij", ("etag", '"c"'))
+        cache.lookup("http://example.org/a", {})       # Most recently used
+        self.store(cache, "http://example.org/d", "ABCDEFGHIJ", ("etag", '"d"'))
+        stats = cache.stats()
+        self.assertEqual(stats["entries"], 2)
+        self.assertEqual(stats["size"], 20)
+        self.assertEqual(stats["evictions"], 2)
+        self.assertEqual(cache.lookup("http://example.org/b", {}), None)
+        self.assertEqual(cache.lookup("http://example.org/c", {}), None)
+        self.assertNotEqual(cache.lookup("http://example.org/a", {}), None)
+        return
+
+    def testPersistence(self):
+        cache = self.cache()
+        self.store(cache, "http://example.org/a", "Content A", ("etag", '"a"'))
+        self.store(cache, "http://example.org/b", "Content B", ("etag", '"b"'))
+        cache.invalidate("http://example.org/b")
+        cache = self.cache()
+        self.assertEqual(cache.stats()["entries"], 1)
+        entry = cache.lookup("http://example.org/a", {})
+        self.assertEqual(cache.response(entry)[3], "Content A")
+        self.assertEqual(entry.validators(), { "if-none-match": '"a"' })
+        self.assertEqual(len(os.listdir(os.path.join(self.cachedir, "objects"))), 1)
+        return
+
+    def testSessionFresh(self):
+        cache = self.cache()
+        rosrs = self.session(cache)
+        rouri = self.createRO(rosrs)
+        self.server.rosrs().cachecontrol = "max-age=60"
+        for i in range(3):
+            (status, reason, headers, uri, data) = rosrs.getROResource("data.txt", rouri)
+            self.assertEqual((status, data), (200, "Original\n"))
+        self.assertEqual(self.server.requestCounts().get("resource", 0), 1)
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (2, 1))
+        # Request Cache-Control no-cache forces revalidation
+        (status, reason, headers, data) = rosrs.doRequest(str(rouri)+"data.txt",
+            reqheaders={ "cache-control": "no-cache" })
+        self.assertEqual((status, data), (200, "Original\n"))
+        self.assertEqual(self.server.requestCounts().get("resource-304", 0), 1)
+        return
+
+    def testSessionRevalidate(self):
+        cache = self.cache()
+        rosrs = self.session(cache)
+        rouri = self.createRO(rosrs)
+        for i in range(2):
+            (status, reason, headers, uri, data) = rosrs.getROResource("data.txt", rouri)
+            self.assertEqual((status, data), (200, "Original\n"))
+        self.assertEqual(self.server.requestCounts().get("resource", 0), 1)
+        self.assertEqual(self.server.requestCounts().get("resource-304", 0), 1)
+        self.assertEqual(cache.stats()["revalidated"], 1)
+        # Conditional requests from the caller are not handled by the cache
+        etag = headers["etag"]
+        (status, reason, headers, data) = rosrs.doRequest(str(rouri)+"data.txt",
+            reqheaders={ "if-none-match": etag })
+        self.assertEqual(status, 304)
+        return
+
+    def testSessionInvalidate(self):
+        cache = self.cache()
+        rosrs = self.session(cache)
+        rouri = self.createRO(rosrs)
+        self.server.rosrs().cachecontrol = "max-age=60"
+        rosrs.getROResource("data.txt", rouri)
+        (status, reason, headers, data) = rosrs.doRequest(str(rouri)+"data.txt",
+            method="PUT", ctype="text/plain", body="Updated\n")
+        self.assertIn(status, [200, 201])
+        (status, reason, headers, uri, data) = rosrs.getROResource("data.txt", rouri)
+        self.assertEqual(data, "Updated\n")
+        self.assertEqual(self.server.requestCounts().get("resource", 0), 2)
+        return
+
+    def testSessionNoStore(self):
+        cache = self.cache()
+        rosrs = self.session(cache)
+        rouri = self.createRO(rosrs)
+        self.server.rosrs().cachecontrol = "no-store"
+        for i in range(2):
+            rosrs.getROResource("data.txt", rouri)
+        self.assertEqual(self.server.requestCounts().get("resource", 0), 2)
+        self.assertEqual(cache.lookup(str(rouri)+"data.txt", {}), None)
+        return
+
+    def testSessionCredentials(self):
+        cache  = self.cache()
+        rosrs1 = self.session(cache, accesskey="user1")
+        rosrs2 = self.session(cache, accesskey="user2")
+        rouri  = self.createRO(rosrs1)
+        self.server.rosrs().cachecontrol = "max-age=60"
+        rosrs1.getROResource("data.txt", rouri)
+        (status, reason, headers, uri, data) = rosrs2.getROResource("data.txt", rouri)
+        self.assertEqual((status, data), (200, "Original\n"))
+        self.assertEqual(self.server.requestCounts().get("resource", 0), 2)
+        self.assertEqual(cache.stats()["hits"], 0)
+        for rosrs in [rosrs1, rosrs2]:
+            rosrs.getROResource("data.txt", rouri)
+        self.assertEqual(self.server.requestCounts().get("resource", 0), 2)
+        self.assertEqual(cache.stats()["hits"], 2)
+        # Update by one session invalidates responses cached for both
+        rosrs2.doRequest(str(rouri)+"data.txt", method="PUT", ctype="text/plain", body="Updated\n")
+        (status, reason, headers, uri, data) = rosrs1.getROResource("data.txt", rouri)
+        self.assertEqual(data, "Updated\n")
+        return
+
+# Assemble test suite
+
+def getTestSuite(select="unit"):
+    """
+    Get test suite
+
+    select  is one of the following:
+            "unit"      return suite of unit tests only
+            "component" return suite of unit and component tests
+            "all"       return suite of unit, component and integration tests
+            "pending"   return suite of pending tests
+            name        a single named test to be run
+    """
+    testdict = {
+        "unit":
+            [ "testParseCacheControl"
+            , "testFreshness"
+            , "testFreshLookup"
+            , "testNotStored"
+            , "testVary"
+            , "testCredentials"
+            , "testEvictionAndSharing"
+            , "testPersistence"
+            , "testSessionFresh"
+            , "testSessionRevalidate"
+            , "testSessionInvalidate"
+            , "testSessionNoStore"
+            , "testSessionCredentials"
+            ],
+        "component":
+            [
+            ],
+        "integration":
+            [
+            ],
+        "pending":
+            [
+            ]
+        }
+    return TestUtils.getTestSuite(TestHttpCache, testdict, select=select)
+
+if __name__ == "__main__":
+    TestUtils.runTests("TestHttpCache.log", getTestSuite, sys.argv)
+
+# End.
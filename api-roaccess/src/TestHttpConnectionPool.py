@@ -0,0 +1,259 @@
+#!/usr/bin/env python
+
+"""
+Module to test HTTP connection pool, using a local stand-in server
+"""
+
+import os, os.path
+import sys
+import time
+import ssl
+import threading
+import unittest
+import logging
+
+from MiscLib import TestUtils
+
+from HttpConnectionPool import HttpConnectionPool, HttpPoolError
+from ROSRS_Session import ROSRS_Session
+from SparqlHttpClient import SparqlHttpClient
+from StandInServer import StandInServer, StandInSparqlHandler
+
+# Logging object
+log = logging.getLogger(__name__)
+
+# Base directory for file access tests in this module
+testbase = os.path.dirname(__file__)
+
+# Self-signed key and certificate for local HTTPS server
+testcert = os.path.join(testbase, "resources", "localhost.pem")
+
+# Test cases
+
+class TestHttpConnectionPool(unittest.TestCase):
+    """
+    This test suite tests the HTTP connection pool used by ROSRS_Session
+    """
+
+    def setUp(self):
+        super(TestHttpConnectionPool, self).setUp()
+        self.server = StandInServer(idletimeout=0.5)
+        self.srsuri = self.server.start()
+        self.host   = self.srsuri.split("/")[2]
+        return
+
+    def tearDown(self):
+        super(TestHttpConnectionPool, self).tearDown()
+        self.server.stop()
+        return
+
+    def startHttpsServer(self, handler=None):
+        kwargs = { "sslcert": testcert }
+        if handler: kwargs["handler"] = handler
+        server = StandInServer(**kwargs)
+        uri    = server.start()
+        self.addCleanup(server.stop)
+        return uri
+
+    def trustedSSLContext(self):
+        sslcontext = ssl.create_default_context(cafile=testcert)
+        return sslcontext
+
+    def doGet(self, pool, path="/ROs/"):
+        (conn, response) = pool.request("GET", path)
+        data = response.read()
+        pool.release(conn)
+        return (response.status, data)
+
+    # Actual tests follow
+
+    def testReuseConnection(self):
+        pool = HttpConnectionPool(self.host)
+        for i in range(5):
+            (status, data) = self.doGet(pool)
+            self.assertEqual(status, 200)
+        stats = pool.stats()
+        self.assertEqual(stats["created"], 1)
+        self.assertEqual(stats["reused"], 4)
+        self.assertEqual(self.server.connections(), 1)
+        pool.close()
+        return
+
+    def testIdleTimeout(self):
+        pool = HttpConnectionPool(self.host, idletimeout=0.1)
+        (status, data) = self.doGet(pool)
+        time.sleep(0.2)
+        (status, data) = self.doGet(pool)
+        self.assertEqual(status, 200)
+        stats = pool.stats()
+        self.assertEqual(stats["created"], 2)
+        self.assertEqual(stats["stale"], 1)
+        pool.close()
+        return
+
+    def testServerClosedConnection(self):
+        # Server closes idle connection after 0.5s
+        pool = HttpConnectionPool(self.host)
+        (status, data) = self.doGet(pool)
+        time.sleep(1.0)
+        (status, data) = self.doGet(pool)
+        self.assertEqual(status, 200)
+        stats = pool.stats()
+        self.assertEqual(stats["created"], 2)
+        self.assertEqual(stats["stale"], 1)
+        pool.close()
+        return
+
+    def testBoundedPool(self):
+        pool    = HttpConnectionPool(self.host, maxsize=2)
+        results = []
+        def worker():
+            for i in range(10):
+                results.append(self.doGet(pool)[0])
+        threads = [ threading.Thread(target=worker) for i in range(8) ]
+        for t in threads: t.start()
+        for t in threads: t.join()
+        self.assertEqual(results, [200]*80)
+        self.assertTrue(pool.stats()["created"] <= 2)
+        self.assertTrue(self.server.connections() <= 2)
+        pool.close()
+        return
+
+    def testClosedPool(self):
+        pool = HttpConnectionPool(self.host)
+        pool.close()
+        self.assertRaises(HttpPoolError, pool.acquire)
+        return
+
+    def testSharedSession(self):
+        rosrs  = ROSRS_Session(self.srsuri, accesskey="dummy", maxconnections=3)
+        (status, reason, rouri, manifest) = rosrs.createRO("TestPoolRO",
+            "Test RO for HttpConnectionPool", "TestHttpConnectionPool.py", "2012-09-06")
+        self.assertEqual(status, 201)
+        errors = []
+        def worker(n):
+            try:
+                for i in range(5):
+                    respath = "data/%d/%d.txt"%(n, i)
+                    rosrs.aggregateResourceInt(rouri, respath,
+                        ctype="text/plain", body="Resource %s\n"%respath)
+                    (status, reason, headers, uri, data) = rosrs.getROResource(respath, rouri)
+                    self.assertEqual(data, "Resource %s\n"%respath)
+            except Exception, e:
+                errors.append(e)
+        threads = [ threading.Thread(target=worker, args=(n,)) for n in range(6) ]
+        for t in threads: t.start()
+        for t in threads: t.join()
+        self.assertEqual(errors, [])
+        self.assertTrue(self.server.connections() <= 3)
+        rosrs.close()
+        return
+
+    def testHttpsSession(self):
+        srsuri = self.startHttpsServer()
+        self.assertTrue(srsuri.startswith("https://"))
+        rosrs  = ROSRS_Session(srsuri, accesskey="dummy", sslcontext=self.trustedSSLContext())
+        (status, reason, rouri, manifest) = rosrs.createRO("TestHttpsRO",
+            "Test RO for HTTPS", "TestHttpConnectionPool.py", "2012-09-06")
+        self.assertEqual(status, 201)
+        self.assertEqual(str(rouri), srsuri+"TestHttpsRO/")
+        rolist = rosrs.listROs()
+        self.assertIn(srsuri+"TestHttpsRO/", [ r["uri"] for r in rolist ])
+        stats = rosrs._httppool.stats()
+        self.assertEqual(stats["created"], 1)
+        self.assertEqual(stats["tlshandshakes"], 1)
+        rosrs.close()
+        return
+
+    def testHttpsUntrusted(self):
+        # Self-signed server certificate is rejected by default SSL context
+        srsuri = self.startHttpsServer()
+        rosrs  = ROSRS_Session(srsuri, accesskey="dummy")
+        self.assertRaises(ssl.SSLError, rosrs.listROs)
+        rosrs.close()
+        return
+
+    def testHttpsSparql(self):
+        endpoint = self.startHttpsServer(handler=StandInSparqlHandler)
+        sparql   = SparqlHttpClient(endpointuri=endpoint, sslcontext=self.trustedSSLContext())
+        query    = "SELECT * WHERE { ?s ?p ?o }"
+        for i in range(3):
+            ((status, reason), result) = sparql.doQueryGET(query)
+            self.assertEqual(status, 200)
+            self.assertEqual(len(result["results"]["bindings"]), 3)
+        ((status, reason), result) = sparql.doQueryPOST(query)
+        self.assertEqual(status, 200)
+        self.assertEqual(result["head"]["vars"], ["s", "o"])
+        stats = sparql.connectionPool().stats()
+        self.assertEqual((stats["created"], stats["tlshandshakes"]), (1, 1))
+        sparql.close()
+        return
+
+    def testSparqlPooled(self):
+        server   = StandInServer(handler=StandInSparqlHandler, idletimeout=0.5)
+        endpoint = server.start()
+        self.addCleanup(server.stop)
+        sparql   = SparqlHttpClient(endpointuri=endpoint, maxconnections=2)
+        query    = "SELECT * WHERE { ?s ?p ?o }"
+        results  = []
+        def worker():
+            for i in range(10):
+                ((status, reason), result) = sparql.doQueryGET(query)
+                results.append( (status, len(result["results"]["bindings"])) )
+                ((status, reason), result) = sparql.doQueryPOST(query)
+                results.append( (status, len(result["results"]["bindings"])) )
+        threads = [ threading.Thread(target=worker) for i in range(4) ]
+        for t in threads: t.start()
+        for t in threads: t.join()
+        self.assertEqual(results, [(200, 3)]*80)
+        self.assertTrue(server.connections() <= 2)
+        # Server closes idle connections after 0.5s:  client reconnects
+        time.sleep(1.0)
+        ((status, reason), result) = sparql.doQueryPOST(query)
+        self.assertEqual(status, 200)
+        self.assertTrue(sparql.connectionPool().stats()["stale"] >= 1)
+        sparql.close()
+        return
+
+# Assemble test suite
+
+def getTestSuite(select="unit"):
+    """
+    Get test suite
+
+    select  is one of the following:
+            "unit"      return suite of unit tests only
+            "component" return suite of unit and component tests
+            "all"       return suite of unit, component and integration tests
+            "pending"   return suite of pending tests
+            name        a single named test to be run
+    """
+    testdict = {
+        "unit":
+            [ "testReuseConnection"
+            , "testIdleTimeout"
+            , "testServerClosedConnection"
+            , "testBoundedPool"
+            , "testClosedPool"
+            , "testSharedSession"
+            , "testHttpsSession"
+            , "testHttpsUntrusted"
+            , "testHttpsSparql"
+            , "testSparqlPooled"
+            ],
+        "component":
+            [
+            ],
+        "integration":
+            [
+            ],
+        "pending":
+            [
+            ]
+        }
+    return TestUtils.getTestSuite(TestHttpConnectionPool, testdict, select=select)
+
+if __name__ == "__main__":
+    TestUtils.runTests("TestHttpConnectionPool.log", getTestSuite, sys.argv)
+
+# End.
@@ -0,0 +1,220 @@
+#!/usr/bin/env python
+
+"""
+Module to test range requests, resumable downloads and remote ZIP access,
+using a local stand-in RO SRS
+"""
+
+import sys
+import os
+import random
+import shutil
+import tempfile
+import zipfile
+import unittest
+import logging
+
+from MiscLib import TestUtils
+
+from ROSRS_Session import ROSRS_Session, ROSRS_Error
+from HttpRange import RangeReader, parseContentRange, rangeValidator
+from StandInServer import StandInServer
+
+# Logging object
+log = logging.getLogger(__name__)
+
+# Test cases
+
+class TestHttpRange(unittest.TestCase):
+    """
+    This test suite tests range requests with ROSRS_Session
+    """
+
+    def setUp(self):
+        super(TestHttpRange, self).setUp()
+        self.server  = StandInServer()
+        self.srsuri  = self.server.start()
+        self.rosrs   = ROSRS_Session(self.srsuri, accesskey="dummy")
+        self.tempdir = tempfile.mkdtemp(prefix="TestHttpRange")
+        return
+
+    def tearDown(self):
+        super(TestHttpRange, self).tearDown()
+        self.rosrs.close()
+        self.server.stop()
+        shutil.rmtree(self.tempdir)
+        return
+
+    def createRO(self, size=200000):
+        (status, reason, rouri, manifest) = self.rosrs.createRO("TestRangeRO",
+            "Test RO", "TestHttpRange.py", "2012-09-06")
+        self.assertEqual(status, 201)
+        rnd = random.Random(1)
+        self.content = "".join([ chr(rnd.randrange(256)) for i in range(size) ])
+        self.rosrs.aggregateResourceInt(rouri, "data.bin", body=self.content)
+        self.rosrs.aggregateResourceInt(rouri, "small.txt", ctype="text/plain", body="Small\n")
+        return rouri
+
+    def zipData(self, rouri):
+        (status, reason, headers, uri, data) = self.rosrs.getROZip(rouri)
+        self.assertEqual(status, 200)
+        return data
+
+    # Actual tests follow
+
+    def testParseContentRange(self):
+        self.assertEqual(parseContentRange("bytes 0-99/1000"), (0, 99, 1000))
+        self.assertEqual(parseContentRange("Bytes 100-199/*"), (100, 199, None))
+        self.assertEqual(parseContentRange("bytes */1000"), None)
+        self.assertEqual(parseContentRange(None), None)
+        self.assertEqual(rangeValidator({ "etag": '"x"', "last-modified": "lm" }), '"x"')
+        self.assertEqual(rangeValidator({ "etag": 'W/"x"', "last-modified": "lm" }), "lm")
+        self.assertEqual(rangeValidator({}), None)
+        return
+
+    def testRangeReader(self):
+        rouri  = self.createRO()
+        zipped = self.zipData(rouri)
+        reader = RangeReader(self.rosrs, rouri, accept="application/zip", blocksize=1000)
+        self.assertEqual(reader.size(), len(zipped))
+        reader.seek(-10, 2)
+        self.assertEqual(reader.read(), zipped[-10:])
+        reader.seek(500)
+        self.assertEqual(reader.read(2000), zipped[500:2500])
+        self.assertEqual(reader.tell(), 2500)
+        reader.seek(-100, 1)
+        self.assertEqual(reader.read(50), zipped[2400:2450])
+        reader.seek(len(zipped)+10)
+        self.assertEqual(reader.read(10), "")
+        # Initial tail request, and one request for range 500-2499
+        self.assertEqual(reader.stats(), { "requests": 2, "bytes": 3000 })
+        return
+
+    def testRangeReaderChanged(self):
+        rouri  = self.createRO()
+        reader = RangeReader(self.rosrs, rouri, accept="application/zip", blocksize=1000)
+        self.rosrs.aggregateResourceInt(rouri, "new.txt", ctype="text/plain", body="New\n")
+        self.assertRaises(ROSRS_Error, reader.read, 10)
+        return
+
+    def testRangeReaderUnknownLength(self):
+        rouri  = self.createRO()
+        zipped = self.zipData(rouri)
+        self.server.rosrs().rangelength = False
+        reader = RangeReader(self.rosrs, rouri, accept="application/zip", blocksize=1000)
+        self.assertEqual(reader.size(), None)
+        self.assertRaises(IOError, reader.seek, -10, 2)
+        reader.seek(500)
+        self.assertEqual(reader.read(2000), zipped[500:2500])
+        # Remainder is read until a short block is received
+        self.assertEqual(reader.read(), zipped[2500:])
+        self.assertEqual(reader.size(), len(zipped))
+        reader.seek(-10, 2)
+        self.assertEqual(reader.read(), zipped[-10:])
+        return
+
+    def testRangeReaderWrongRange(self):
+        rouri  = self.createRO()
+        reader = RangeReader(self.rosrs, rouri, accept="application/zip", blocksize=1000)
+        self.server.rosrs().rangeoverride = (0, 99)
+        reader.seek(5000)
+        self.assertRaises(ROSRS_Error, reader.read, 10)
+        self.assertEqual(reader.stats()["requests"], 2)
+        return
+
+    def testOpenROZip(self):
+        rouri   = self.createRO(size=500000)
+        zipfile = self.rosrs.openROZip(rouri, blocksize=4096)
+        self.assertEqual(sorted(zipfile.namelist()), [".ro/manifest.rdf", "data.bin", "small.txt"])
+        self.assertIn("TestRangeRO", zipfile.read(".ro/manifest.rdf"))
+        self.assertEqual(zipfile.read("small.txt"), "Small\n")
+        stats = zipfile.fp.stats()
+        self.assertTrue(stats["bytes"] < 20000, stats)
+        self.assertEqual(zipfile.read("data.bin"), self.content)
+        self.assertEqual(self.server.requestCounts().get("zip", 0), 0)
+        return
+
+    def testDownloadResume(self):
+        rouri   = self.createRO()
+        zipped  = self.zipData(rouri)
+        zippath = os.path.join(self.tempdir, "ro.zip")
+        self.server.rosrs().truncations = [50000, 70000]
+        progress = []
+        (status, reason, headers, uri, size) = self.rosrs.getROZipTo(rouri, zippath,
+            progress=lambda received, total: progress.append( (received, total) ))
+        self.assertEqual((status, size), (200, len(zipped)))
+        with open(zippath, "rb") as f:
+            self.assertEqual(f.read(), zipped)
+        self.assertEqual(sorted(os.listdir(self.tempdir)), ["ro.zip"])
+        self.assertEqual(self.server.requestCounts()["zip-range"], 2)
+        self.assertEqual(progress[-1], (len(zipped), len(zipped)))
+        return
+
+    def testDownloadResumeLimit(self):
+        rouri   = self.createRO()
+        zippath = os.path.join(self.tempdir, "ro.zip")
+        self.server.rosrs().truncations = [1000, 1000, 1000]
+        self.assertRaises(ROSRS_Error, self.rosrs.getROZipTo, rouri, zippath, maxresumes=2)
+        self.assertEqual(os.path.getsize(zippath+".part"), 3000)
+        # Later call resumes from saved partial content
+        (status, reason, headers, uri, size) = self.rosrs.getROZipTo(rouri, zippath)
+        self.assertEqual(status, 200)
+        with open(zippath, "rb") as f:
+            self.assertEqual(f.read(), self.zipData(rouri))
+        self.assertEqual(self.server.requestCounts()["zip-range"], 3)
+        return
+
+    def testDownloadChanged(self):
+        rouri   = self.createRO()
+        zippath = os.path.join(self.tempdir, "ro.zip")
+        self.server.rosrs().truncations = [1000]
+        self.assertRaises(ROSRS_Error, self.rosrs.getROZipTo, rouri, zippath, maxresumes=0)
+        # Resource changed:  If-Range fails, and whole resource is returned
+        self.rosrs.aggregateResourceInt(rouri, "new.txt", ctype="text/plain", body="New\n")
+        (status, reason, headers, uri, size) = self.rosrs.getROZipTo(rouri, zippath)
+        self.assertEqual(status, 200)
+        self.assertIn("new.txt", zipfile.ZipFile(zippath).namelist())
+        self.assertEqual(self.server.requestCounts().get("zip-range", 0), 0)
+        return
+
+# Assemble test suite
+
+def getTestSuite(select="unit"):
+    """
+    Get test suite
+
+    select  is one of the following:
+            "unit"      return suite of unit tests only
+            "component" return suite of unit and component tests
+            "all"       return suite of unit, component and integration tests
+            "pending"   return suite of pending tests
+            name        a single named test to be run
+    """
+    testdict = {
+        "unit":
+            [ "testParseContentRange"
+            , "testRangeReader"
+            , "testRangeReaderChanged"
+            , "testRangeReaderUnknownLength"
+            , "testRangeReaderWrongRange"
+            , "testOpenROZip"
+            , "testDownloadResume"
+            , "testDownloadResumeLimit"
+            , "testDownloadChanged"
+            ],
+        "component":
+            [
+            ],
+        "integration":
+            [
+            ],
+        "pending":
+            [
+            ]
+        }
+    return TestUtils.getTestSuite(TestHttpRange, testdict, select=select)
+
+if __name__ == "__main__":
+    TestUtils.runTests("TestHttpRange.log", getTestSuite, sys.argv)
+
+# End.
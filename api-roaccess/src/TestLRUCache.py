@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+
+"""
+Module to test size-bounded LRU cache
+"""
+
+import sys
+import threading
+import unittest
+import logging
+
+from MiscLib import TestUtils
+
+from LRUCache import LRUCache
+
+# Logging object
+log = logging.getLogger(__name__)
+
+# Test cases
+
+class TestLRUCache(unittest.TestCase):
+    """
+    This test suite tests the LRU cache used by the RO SRS and SPARQL clients
+    """
+
+    def setUp(self):
+        super(TestLRUCache, self).setUp()
+        return
+
+    def tearDown(self):
+        super(TestLRUCache, self).tearDown()
+        return
+
+    # Actual tests follow
+
+    def testGetPut(self):
+        cache = LRUCache(maxsize=3)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertEqual(cache.get("b"), 2)
+        self.assertEqual(cache.get("c"), None)
+        self.assertEqual(cache.get("c", 99), 99)
+        self.assertIn("a", cache)
+        self.assertNotIn("c", cache)
+        self.assertEqual(len(cache), 2)
+        stats = cache.stats()
+        self.assertEqual(stats["hits"], 2)
+        self.assertEqual(stats["misses"], 2)
+        self.assertEqual(cache.values(), [1, 2])
+        self.assertEqual(cache.stats()["hits"], 2)
+        return
+
+    def testEviction(self):
+        cache = LRUCache(maxsize=3)
+        for k in "abc": cache.put(k, k.upper())
+        cache.get("a")                  # "b" is now least recently used
+        cache.put("d", "D")
+        self.assertEqual(cache.keys(), ["c", "a", "d"])
+        cache.put("c", "CC")            # Replace does not evict
+        self.assertEqual(cache.keys(), ["a", "d", "c"])
+        self.assertEqual(cache.get("c"), "CC")
+        self.assertEqual(cache.stats()["evictions"], 1)
+        return
+
+    def testSizeof(self):
+        cache = LRUCache(maxsize=10, sizeof=len)
+        cache.put("a", "xxxx")
+        cache.put("b", "yyyy")
+        cache.put("c", "zzzz")          # Evicts "a"
+        self.assertEqual(cache.keys(), ["b", "c"])
+        self.assertEqual(cache.size(), 8)
+        cache.put("d", "w"*11)          # Too large to cache
+        self.assertEqual(cache.keys(), ["b", "c"])
+        cache.put("e", "v"*10)          # Evicts everything else
+        self.assertEqual(cache.keys(), ["e"])
+        self.assertEqual(cache.size(), 10)
+        return
+
+    def testRemoveClear(self):
+        cache = LRUCache(maxsize=10, sizeof=len)
+        cache.put("a", "xxxx")
+        cache.put("b", "yyyy")
+        self.assertEqual(cache.remove("a"), "xxxx")
+        self.assertEqual(cache.remove("a"), None)
+        self.assertEqual(cache.size(), 4)
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.size(), 0)
+        return
+
+    def testThreads(self):
+        cache = LRUCache(maxsize=50)
+        def worker(n):
+            for i in range(1000):
+                cache.put((n, i%100), i)
+                cache.get((n, (i*7)%100))
+        threads = [ threading.Thread(target=worker, args=(n,)) for n in range(4) ]
+        for t in threads: t.start()
+        for t in threads: t.join()
+        self.assertEqual(len(cache), 50)
+        self.assertEqual(cache.size(), 50)
+        return
+
+# Assemble test suite
+
+def getTestSuite(select="unit"):
+    """
+    Get test suite
+
+    select  is one of the following:
+            "unit"      return suite of unit tests only
+            "component" return suite of unit and component tests
+            "all"       return suite of unit, component and integration tests
+            "pending"   return suite of pending tests
+            name        a single named test to be run
+    """
+    testdict = {
+        "unit":
+            [ "testGetPut"
+            , "testEviction"
+            , "testSizeof"
+            , "testRemoveClear"
+            , "testThreads"
+            ],
+        "component":
+            [
+            ],
+        "integration":
+            [
+            ],
+        "pending":
+            [
+            ]
+        }
+    return TestUtils.getTestSuite(TestLRUCache, testdict, select=select)
+
+if __name__ == "__main__":
+    TestUtils.runTests("TestLRUCache.log", getTestSuite, sys.argv)
+
+# End.
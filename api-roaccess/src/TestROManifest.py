@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+
+"""
+Module to test indexed RO manifest model
+"""
+
+import sys
+import unittest
+import logging
+import rdflib, rdflib.graph
+
+from MiscLib import TestUtils
+
+from ro_namespaces import RDF, ORE, RO, AO, DCTERMS
+from ROManifest import ROManifest
+
+# Logging object
+log = logging.getLogger(__name__)
+
+# Test data
+
+ROURI = rdflib.URIRef("http://example.org/ROs/test/")
+
+def makeManifestGraph():
+    def uri(path): return rdflib.URIRef(ROURI+path)
+    graph = rdflib.graph.Graph()
+    graph.add( (ROURI, RDF.type, RO.ResearchObject) )
+    for (p, r) in [("proxy/1", "a.txt"), ("proxy/2", "b.txt"), ("proxy/3", "body1.rdf")]:
+        graph.add( (ROURI,  ORE.aggregates, uri(r)) )
+        graph.add( (uri(p), RDF.type,       ORE.Proxy) )
+        graph.add( (uri(p), ORE.proxyFor,   uri(r)) )
+    # Second proxy for same resource makes proxy ambiguous
+    graph.add( (uri("proxy/4"), ORE.proxyFor, uri("b.txt")) )
+    graph.add( (uri("ann/1"), AO.annotatesResource, uri("a.txt")) )
+    graph.add( (uri("ann/1"), AO.annotatesResource, ROURI) )
+    graph.add( (uri("ann/1"), AO.body,              uri("body1.rdf")) )
+    graph.add( (uri("ann/2"), RO.annotatesAggregatedResource, uri("a.txt")) )
+    graph.add( (uri("ann/2"), AO.body,              rdflib.URIRef("http://example.com/ext.rdf")) )
+    graph.add( (uri("ann/3"), AO.annotatesResource, uri("b.txt")) )
+    return graph
+
+# Test cases
+
+class TestROManifest(unittest.TestCase):
+    """
+    This test suite tests the ROManifest indexes
+    """
+
+    def setUp(self):
+        super(TestROManifest, self).setUp()
+        self.manifest = ROManifest(makeManifestGraph(), rouri=ROURI)
+        return
+
+    def tearDown(self):
+        super(TestROManifest, self).tearDown()
+        return
+
+    def uri(self, path):
+        return rdflib.URIRef(ROURI+path)
+
+    # Actual tests follow
+
+    def testGraph(self):
+        self.assertIn((ROURI, RDF.type, RO.ResearchObject), self.manifest)
+        self.assertEqual(len(self.manifest), len(self.manifest.graph))
+        return
+
+    def testProxies(self):
+        self.assertEqual(self.manifest.getProxy(self.uri("a.txt")), self.uri("proxy/1"))
+        self.assertEqual(self.manifest.getProxy(str(ROURI)+"a.txt"), self.uri("proxy/1"))
+        self.assertEqual(self.manifest.getProxy(self.uri("b.txt")), None)
+        self.assertEqual(self.manifest.getProxy(self.uri("c.txt")), None)
+        self.assertEqual(self.manifest.getProxyResource(self.uri("proxy/4")), self.uri("b.txt"))
+        self.assertEqual(self.manifest.getProxyResource(self.uri("proxy/9")), None)
+        self.assertEqual(len(self.manifest.getProxies()), 4)
+        self.assertEqual(set(self.manifest.getAggregatedResources()),
+            set([self.uri("a.txt"), self.uri("b.txt"), self.uri("body1.rdf")]))
+        return
+
+    def testAnnotations(self):
+        self.assertEqual(set(self.manifest.getAnnotations(self.uri("a.txt"))),
+            set([self.uri("ann/1"), self.uri("ann/2")]))
+        self.assertEqual(self.manifest.getAnnotations(ROURI), [self.uri("ann/1")])
+        self.assertEqual(self.manifest.getAnnotations(self.uri("c.txt")), [])
+        self.assertEqual(set(self.manifest.getAnnotations()),
+            set([self.uri("ann/1"), self.uri("ann/2"), self.uri("ann/3")]))
+        self.assertEqual(len(self.manifest.getAnnotations()), 3)
+        return
+
+    def testAnnotationBody(self):
+        self.assertEqual(self.manifest.getAnnotationBody(self.uri("ann/1")), self.uri("body1.rdf"))
+        self.assertEqual(self.manifest.getAnnotationBody(str(ROURI)+"ann/2"),
+            rdflib.URIRef("http://example.com/ext.rdf"))
+        self.assertEqual(self.manifest.getAnnotationBody(self.uri("ann/3")), None)
+        return
+
+# Assemble test suite
+
+def getTestSuite(select="unit"):
+    """
+    Get test suite
+
+    select  is one of the following:
+            "unit"      return suite of unit tests only
+            "component" return suite of unit and component tests
+            "all"       return suite of unit, component and integration tests
+            "pending"   return suite of pending tests
+            name        a single named test to be run
+    """
+    testdict = {
+        "unit":
+            [ "testGraph"
+            , "testProxies"
+            , "testAnnotations"
+            , "testAnnotationBody"
+            ],
+        "component":
+            [
+            ],
+        "integration":
+            [
+            ],
+        "pending":
+            [
+            ]
+        }
+    return TestUtils.getTestSuite(TestROManifest, testdict, select=select)
+
+if __name__ == "__main__":
+    TestUtils.runTests("TestROManifest.log", getTestSuite, sys.argv)
+
+# End.
@@ -18,7 +18,7 @@ import rdflib, rdflib.graph
 from MiscLib import TestUtils
 
 from ro_namespaces import RDF, RDFS, ORE, RO, DCTERMS, AO
-from ROSRS_Session import ROSRS_Error, ROSRS_Session, testSplitValues, testParseLinks
+from ROSRS_Session import ROSRS_Error, ROSRS_Session, testSplitValues, testParseLinks, testParseLinkHeaders
 
 # Logging object
 log = logging.getLogger(__name__)
@@ -69,6 +69,7 @@ class TestROSRS_Session(unittest.TestCase):
     def testHelpers(self):
         testSplitValues()
         testParseLinks()
+        testParseLinkHeaders()
         return
 
     def testListROs(self):
@@ -0,0 +1,688 @@
+#!/usr/bin/env python
+
+"""
+Module to test RO SRS session functions against a local stand-in RO SRS
+"""
+
+import os, os.path
+import sys
+import unittest
+import logging
+import zipfile
+import tempfile
+import shutil
+import threading
+import mmap
+import multiprocessing.pool
+import StringIO
+import rdflib, rdflib.graph
+
+from MiscLib import TestUtils
+
+from ro_namespaces import RDF, RDFS, ORE, RO, DCTERMS, AO
+from HttpConnectionPool import ResponseStream
+from RequestTrace import RequestTrace, LogTrace
+from ROSRS_Session import ROSRS_Error, ROSRS_Session, testSplitValues, testParseLinks, testParseLinkHeaders
+from StandInServer import StandInServer
+
+# Logging object
+log = logging.getLogger(__name__)
+
+# Base directory for file access tests in this module
+testbase = os.path.dirname(__file__)
+
+# Test config details
+
+class Config:
+    TEST_RO_NAME  = "TestStandInRO"
+    TEST_RO_PATH  = TEST_RO_NAME+"/"
+
+# Request trace and log handler that collect trace output
+
+class CollectTrace(RequestTrace):
+
+    def __init__(self):
+        self.requests  = []
+        self.reqheaders = []
+        self.responses = []
+        return
+
+    def isEnabled(self):
+        return True
+
+    def traceRequest(self, method, path, reqheaders, body):
+        self.requests.append( (method, path) )
+        self.reqheaders.append(reqheaders)
+        return
+
+    def traceResponse(self, record):
+        self.responses.append(record)
+        return
+
+class CollectHandler(logging.Handler):
+
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.messages = []
+        return
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+        return
+
+# Test cases
+
+class TestROSRS_StandIn(unittest.TestCase):
+    """
+    This test suite tests ROSRS_Session features using a local stand-in RO SRS
+    """
+
+    def setUp(self):
+        super(TestROSRS_StandIn, self).setUp()
+        self.server = StandInServer()
+        self.srsuri = self.server.start()
+        self.rosrs  = ROSRS_Session(self.srsuri, accesskey="dummy")
+        self.tmpdir = tempfile.mkdtemp()
+        return
+
+    def tearDown(self):
+        super(TestROSRS_StandIn, self).tearDown()
+        self.rosrs.close()
+        self.server.stop()
+        shutil.rmtree(self.tmpdir)
+        return
+
+    def createTestRO(self):
+        (status, reason, rouri, manifest) = self.rosrs.createRO(Config.TEST_RO_NAME,
+            "Test RO for ROSRS_Session", "TestROSRS_StandIn.py", "2012-09-06")
+        self.assertEqual(status, 201)
+        return (status, reason, rouri, manifest)
+
+    def largeContent(self, size):
+        line = "0123456789abcdef"*4+"\n"
+        return (line*(size//len(line)+1))[:size]
+
+    # Actual tests follow
+
+    def testHelpers(self):
+        testSplitValues()
+        testParseLinks()
+        testParseLinkHeaders()
+        return
+
+    def testGetROResourceStream(self):
+        (status, reason, rouri, manifest) = self.createTestRO()
+        rescontent = self.largeContent(1000000)
+        self.rosrs.aggregateResourceInt(rouri, "test/large.txt",
+            ctype="text/plain", body=rescontent)
+        (status, reason, headers, uri, data) = self.rosrs.getROResource(
+            "test/large.txt", rouri, stream=True)
+        self.assertEqual(status, 200)
+        self.assertTrue(isinstance(data, ResponseStream))
+        self.assertEqual(data.length(), len(rescontent))
+        chunks = list(data.iterChunks(10000))
+        self.assertTrue(data.closed())
+        self.assertTrue(max(map(len, chunks)) <= 10000)
+        self.assertEqual("".join(chunks), rescontent)
+        # Connection is returned to pool for reuse
+        (status, reason, headers, uri, data) = self.rosrs.getROResource(
+            "test/large.txt", rouri)
+        self.assertEqual(data, rescontent)
+        self.assertEqual(self.server.connections(), 1)
+        return
+
+    def testGetROResourceStreamClose(self):
+        (status, reason, rouri, manifest) = self.createTestRO()
+        rescontent = self.largeContent(1000000)
+        self.rosrs.aggregateResourceInt(rouri, "test/large.txt",
+            ctype="text/plain", body=rescontent)
+        with self.rosrs.getROResource("test/large.txt", rouri, stream=True)[4] as data:
+            self.assertEqual(data.read(100), rescontent[:100])
+        self.assertTrue(data.closed())
+        self.assertEqual(data.read(), "")
+        # Partly read connection is discarded
+        (status, reason, headers, uri, data) = self.rosrs.getROResource(
+            "test/large.txt", rouri)
+        self.assertEqual(data, rescontent)
+        self.assertEqual(self.server.connections(), 2)
+        return
+
+    def testGetROResourceStreamNotFound(self):
+        (status, reason, rouri, manifest) = self.createTestRO()
+        (status, reason, headers, uri, data) = self.rosrs.getROResource(
+            "test/missing.txt", rouri, stream=True)
+        self.assertEqual(status, 404)
+        self.assertEqual(data, None)
+        return
+
+    def testGetROZipDownload(self):
+        (status, reason, rouri, manifest) = self.createTestRO()
+        rescontent = self.largeContent(200000)
+        self.rosrs.aggregateResourceInt(rouri, "test/data.txt",
+            ctype="text/plain", body=rescontent)
+        (status, reason, headers, uri, data) = self.rosrs.getROZip(rouri, stream=True)
+        self.assertEqual(status, 200)
+        self.assertEqual(headers["content-type"], "application/zip")
+        zippath = os.path.join(self.tmpdir, "ro.zip")
+        count   = data.downloadTo(zippath, chunksize=4096)
+        self.assertTrue(data.closed())
+        self.assertEqual(count, os.path.getsize(zippath))
+        zipobj = zipfile.ZipFile(zippath)
+        self.assertIn(".ro/manifest.rdf", zipobj.namelist())
+        self.assertEqual(zipobj.read("test/data.txt"), rescontent)
+        zipobj.close()
+        return
+
+    def writeTestFile(self, name, content):
+        path = os.path.join(self.tmpdir, name)
+        with open(path, "wb") as f:
+            f.write(content)
+        return path
+
+    def storedResource(self, resuri):
+        ro = self.server.rosrs().findRO(str(resuri))
+        return ro.resources[str(resuri)]
+
+    def testAggregateResourceFile(self):
+        (status, reason, rouri, manifest) = self.createTestRO()
+        rescontent = self.largeContent(300000)
+        progress   = []
+        with open(self.writeTestFile("upload.txt", rescontent), "rb") as body:
+            (status, reason, proxyuri, resuri) = self.rosrs.aggregateResourceInt(
+                rouri, "test/upload.txt", ctype="text/plain", body=body,
+                progress=lambda sent, total: progress.append((sent, total)))
+        self.assertEqual(status, 201)
+        self.assertEqual(self.storedResource(resuri), ("text/plain", rescontent))
+        self.assertEqual(progress[-1], (len(rescontent), len(rescontent)))
+        self.assertEqual(len(progress), 5)
+        self.assertEqual(self.server.chunkedRequests(), 0)
+        return
+
+    def testAggregateResourceMmap(self):
+        (status, reason, rouri, manifest) = self.createTestRO()
+        rescontent = self.largeContent(100000)
+        with open(self.writeTestFile("upload.dat", rescontent), "rb") as f:
+            body = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            (status, reason, proxyuri, resuri) = self.rosrs.aggregateResourceInt(
+                rouri, "test/upload.dat", body=body)
+            body.close()
+        self.assertEqual(status, 201)
+        self.assertEqual(self.storedResource(resuri), ("application/octet-stream", rescontent))
+        self.assertEqual(self.server.chunkedRequests(), 0)
+        return
+
+    def testAggregateResourceGenerator(self):
+        (status, reason, rouri, manifest) = self.createTestRO()
+        lines    = [ "line %d\n"%i for i in range(10000) ]
+        progress = []
+        (status, reason, proxyuri, resuri) = self.rosrs.aggregateResourceInt(
+            rouri, "test/lines.txt", ctype="text/plain", body=(l for l in lines),
+            progress=lambda sent, total: progress.append((sent, total)))
+        self.assertEqual(status, 201)
+        self.assertEqual(self.storedResource(resuri), ("text/plain", "".join(lines)))
+        self.assertEqual(progress[-1], (len("".join(lines)), None))
+        self.assertEqual(self.server.chunkedRequests(), 1)
+        return
+
+    def testAggregateResources(self):
+        (status, reason, rouri, manifest) = self.createTestRO()
+        def failingBody():
+            yield "Partial content\n"
+            raise IOError("Simulated read failure")
+        items = [ ("test/bulk/%02d.txt"%i, "text/plain", "Resource %d\n"%i) for i in range(20) ]
+        items[5] = ("test/bulk/05.txt", "text/plain", failingBody())
+        completed = []
+        results = self.rosrs.aggregateResources(rouri, items, concurrency=4,
+            callback=completed.append)
+        self.assertEqual(len(results), 20)
+        self.assertEqual(len(completed), 20)
+        self.assertEqual([ r["respath"] for r in results ], [ i[0] for i in items ])
+        for (i, r) in enumerate(results):
+            if i == 5:
+                self.assertTrue(isinstance(r["error"], IOError))
+                self.assertEqual(r["status"], None)
+            else:
+                self.assertEqual(r["error"], None)
+                self.assertEqual(r["status"], 201)
+                self.assertEqual(str(r["resuri"]), str(rouri)+r["respath"])
+                self.assertEqual(self.storedResource(r["resuri"]),
+                    ("text/plain", "Resource %d\n"%i))
+        (status, reason, proxyuri, manifest) = self.rosrs.getROResourceProxy(
+            "test/bulk/19.txt", rouri)
+        self.assertEqual(proxyuri, results[19]["proxyuri"])
+        # Proxy for failed item is removed
+        (status, reason, proxyuri, manifest) = self.rosrs.getROResourceProxy(
+            "test/bulk/05.txt", rouri)
+        self.assertEqual(proxyuri, None)
+        return
+
+    def testAggregateResourcePutFails(self):
+        (status, reason, rouri, manifest) = self.createTestRO()
+        # PUT of content is refused
+        self.setRedirects(rouri, [("test/refused.txt", 403, "test/other.txt")])
+        results = self.rosrs.aggregateResources(rouri,
+            [ ("test/refused.txt", "text/plain", "Refused\n")
+            , ("test/accepted.txt", "text/plain", "Accepted\n")
+            ])
+        self.assertTrue(isinstance(results[0]["error"], ROSRS_Error))
+        self.assertIn("403", str(results[0]["error"]))
+        self.assertEqual(results[1]["error"], None)
+        (status, reason, headers, manifesturi, manifest) = self.rosrs.getROManifestModel(rouri)
+        aggregated = [ str(r) for r in manifest.getAggregatedResources() ]
+        self.assertNotIn(str(rouri)+"test/refused.txt", aggregated)
+        self.assertIn(str(rouri)+"test/accepted.txt", aggregated)
+        self.assertEqual(manifest.getProxy(str(rouri)+"test/refused.txt"), None)
+        return
+
+    def testManifestCache(self):
+        (status, reason, rouri, manifest) = self.createTestRO()
+        for i in range(5):
+            self.rosrs.aggregateResourceInt(rouri, "test/%d.txt"%i,
+                ctype="text/plain", body="Resource %d\n"%i)
+        proxyuris = []
+        for i in range(5):
+            (status, reason, proxyuri, manifest) = self.rosrs.getROResourceProxy(
+                "test/%d.txt"%i, rouri)
+            self.assertEqual(status, 200)
+            self.assertNotEqual(proxyuri, None)
+            proxyuris.append(proxyuri)
+        self.assertEqual(self.server.requestCounts(),
+            { "manifest": 1, "manifest-304": 4 })
+        # Modification by this session invalidates cached manifest
+        (status, reason) = self.rosrs.removeResource(rouri, "test/0.txt")
+        self.assertEqual(status, 204)
+        (status, reason, proxyuri, manifest) = self.rosrs.getROResourceProxy("test/0.txt", rouri)
+        self.assertEqual(proxyuri, None)
+        self.assertEqual(self.server.requestCounts(),
+            { "manifest": 2, "manifest-304": 5 })
+        # Modification by another session is detected by revalidation
+        rosrs2 = ROSRS_Session(self.srsuri, accesskey="dummy")
+        rosrs2.aggregateResourceInt(rouri, "test/new.txt", ctype="text/plain", body="New\n")
+        rosrs2.close()
+        (status, reason, proxyuri, manifest) = self.rosrs.getROResourceProxy("test/new.txt", rouri)
+        self.assertNotEqual(proxyuri, None)
+        self.assertEqual(self.server.requestCounts(),
+            { "manifest": 3, "manifest-304": 5 })
+        return
+
+    def testManifestCacheLastModified(self):
+        (status, reason, rouri, manifest) = self.createTestRO()
+        (status, reason, headers, uri, manifest) = self.rosrs.getROManifest(rouri)
+        self.assertIn("last-modified", headers)
+        # Revalidate using If-Modified-Since only
+        del headers["etag"]
+        (status, reason, headers, uri, manifest) = self.rosrs.getROManifest(rouri)
+        self.assertEqual(status, 200)
+        self.assertIn((rouri, RDF.type, RO.ResearchObject), manifest)
+        self.assertEqual(self.server.requestCounts(),
+            { "manifest": 1, "manifest-304": 1 })
+        return
+
+    def testManifestCacheEviction(self):
+        rosrs = ROSRS_Session(self.srsuri, accesskey="dummy", manifestcachesize=2)
+        rouris = []
+        for i in range(3):
+            (status, reason, rouri, manifest) = rosrs.createRO("TestRO%d"%i,
+                "Test RO", "TestROSRS_StandIn.py", "2012-09-06")
+            rouris.append(rouri)
+            rosrs.getROManifest(rouri)
+        for rouri in reversed(rouris):
+            rosrs.getROManifest(rouri)
+        # First RO manifest has been evicted, so is fetched again
+        self.assertEqual(self.server.requestCounts(),
+            { "manifest": 4, "manifest-304": 2 })
+        rosrs.close()
+        return
+
+    def createTestAnnotations(self, rouri, count):
+        """
+        Create `count` annotations on test/data.txt, each with its own body,
+        and return a list of (annuri, bodyuri) pairs in creation order.
+        """
+        self.rosrs.aggregateResourceInt(rouri, "test/data.txt",
+            ctype="text/plain", body="Annotated data\n")
+        annotations = []
+        for i in range(count):
+            bodyuri = rdflib.URIRef(str(rouri)+"test/body%d.rdf"%i)
+            (status, reason, annuri) = self.rosrs.createROAnnotationExt(
+                rouri, rdflib.URIRef(str(rouri)+"test/data.txt"), bodyuri)
+            self.assertEqual(status, 201)
+            annotations.append( (annuri, bodyuri) )
+        return annotations
+
+    def testAnnotationBodyUrisFromManifest(self):
+        (status, reason, rouri, manifest) = self.createTestRO()
+        annotations = self.createTestAnnotations(rouri, 5)
+        bodyuris = list(self.rosrs.getROAnnotationBodyUris(rouri, str(rouri)+"test/data.txt"))
+        self.assertEqual(sorted(bodyuris), sorted([ b for (a, b) in annotations ]))
+        counts = self.server.requestCounts()
+        self.assertNotIn("annotation-GET", counts)
+        self.assertNotIn("annotation-HEAD", counts)
+        return
+
+    def testAnnotationBodyUrisFallback(self):
+        (status, reason, rouri, manifest) = self.createTestRO()
+        annotations = self.createTestAnnotations(rouri, 8)
+        self.server.rosrs().ros[str(rouri)].listbodies = False
+        self.rosrs.invalidateManifest(rouri)
+        annuris  = list(self.rosrs.getROAnnotationUris(rouri))
+        bodyuris = list(self.rosrs.getROAnnotationBodyUris(rouri))
+        self.assertEqual(bodyuris, [ dict(annotations)[a] for a in annuris ])
+        self.assertEqual(self.server.requestCounts().get("annotation-HEAD"), 8)
+        # Body URIs are remembered by the session
+        bodyuris = list(self.rosrs.getROAnnotationBodyUris(rouri))
+        self.assertEqual(self.server.requestCounts().get("annotation-HEAD"), 8)
+        self.assertNotIn("annotation-GET", self.server.requestCounts())
+        # ... until the annotation is updated
+        (annuri, bodyuri) = annotations[0]
+        newbodyuri = rdflib.URIRef(str(rouri)+"test/newbody.rdf")
+        self.rosrs.updateROAnnotation(rouri, annuri, str(rouri)+"test/data.txt", newbodyuri)
+        self.assertEqual(self.rosrs.getROAnnotationBodyUri(annuri), newbodyuri)
+        self.assertEqual(self.server.requestCounts().get("annotation-HEAD"), 9)
+        return
+
+    def createTestAnnotationGraph(self):
+        """
+        Create an RO with annotations on test/data.txt:  four with internal
+        RDF bodies, one with an unparseable body and one with a missing body.
+        """
+        (status, reason, rouri, manifest) = self.createTestRO()
+        resuri = rdflib.URIRef(str(rouri)+"test/data.txt")
+        self.rosrs.aggregateResourceInt(rouri, "test/data.txt",
+            ctype="text/plain", body="Annotated data\n")
+        for i in range(4):
+            anngr = rdflib.graph.Graph()
+            anngr.add( (resuri, DCTERMS.title, rdflib.Literal("Title %d"%i)) )
+            self.rosrs.createROAnnotationInt(rouri, resuri, anngr)
+        (status, reason, proxyuri, baduri) = self.rosrs.aggregateResourceInt(rouri,
+            "test/bad.rdf", ctype="application/rdf+xml", body="<rdf:RDF>Not RDF")
+        self.rosrs.createROAnnotationExt(rouri, resuri, baduri)
+        missinguri = rdflib.URIRef(str(rouri)+"test/missing.rdf")
+        self.rosrs.createROAnnotationExt(rouri, resuri, missinguri)
+        return (rouri, resuri, baduri, missinguri)
+
+    def checkAnnotationGraph(self, parseprocesses=0, parsepool=None):
+        (rouri, resuri, baduri, missinguri) = self.createTestAnnotationGraph()
+        failures = []
+        agraph = self.rosrs.getROAnnotationGraph(rouri, resuri,
+            parseprocesses=parseprocesses, maxinflight=2, failures=failures, parsepool=parsepool)
+        self.assertEqual(sorted([ str(t) for t in agraph.objects(resuri, DCTERMS.title) ]),
+            [ "Title %d"%i for i in range(4) ])
+        self.assertEqual(len(agraph), 4)
+        failures = dict([ (f["bodyuri"], f) for f in failures ])
+        self.assertEqual(sorted(failures), sorted([baduri, missinguri]))
+        self.assertEqual(failures[baduri]["status"], 902)
+        self.assertEqual(failures[missinguri]["status"], 404)
+        return (rouri, resuri)
+
+    def testAnnotationGraph(self):
+        self.checkAnnotationGraph(parseprocesses=2)
+        return
+
+    def testAnnotationGraphInThread(self):
+        self.checkAnnotationGraph(parseprocesses=0)
+        return
+
+    def testAnnotationGraphCallerPool(self):
+        # Any pool with the multiprocessing.Pool interface may be supplied
+        parsepool = multiprocessing.pool.ThreadPool(2)
+        self.addCleanup(parsepool.terminate)
+        (rouri, resuri) = self.checkAnnotationGraph(parsepool=parsepool)
+        agraph = self.rosrs.getROAnnotationGraph(rouri, resuri, parsepool=parsepool)
+        self.assertEqual(len(agraph), 4)
+        return
+
+    def testAnnotationGraphMergeError(self):
+        class FailingList(list):
+            def append(self, failure):
+                if failure["status"] == 902:
+                    raise RuntimeError("Cannot record failure")
+                return list.append(self, failure)
+        (rouri, resuri, baduri, missinguri) = self.createTestAnnotationGraph()
+        parsepool = multiprocessing.pool.ThreadPool(2)
+        self.addCleanup(parsepool.terminate)
+        self.assertRaises(RuntimeError, self.rosrs.getROAnnotationGraph, rouri, resuri,
+            maxinflight=2, failures=FailingList(), parsepool=parsepool)
+        # Pool is still usable
+        self.assertEqual(parsepool.apply_async(len, ("abc",)).get(5), 3)
+        return
+
+    def testAnnotationGraphFailureError(self):
+        class FailingList(list):
+            def append(self, failure):
+                raise RuntimeError("Cannot record failure")
+        (rouri, resuri, baduri, missinguri) = self.createTestAnnotationGraph()
+        for i in range(12):
+            self.rosrs.createROAnnotationExt(rouri, resuri,
+                rdflib.URIRef(str(rouri)+"test/missing%d.rdf"%i))
+        # Failure must be raised, not leave fetch workers waiting for a permit
+        outcome = []
+        def getGraph():
+            try:
+                self.rosrs.getROAnnotationGraph(rouri, resuri, concurrency=4,
+                    maxinflight=1, failures=FailingList())
+                outcome.append(None)
+            except Exception, e:
+                outcome.append(e)
+        worker = threading.Thread(target=getGraph)
+        worker.daemon = True
+        worker.start()
+        worker.join(30)
+        self.assertFalse(worker.is_alive(), "getROAnnotationGraph did not return")
+        self.assertEqual(len(outcome), 1)
+        self.assertTrue(isinstance(outcome[0], RuntimeError), outcome[0])
+        return
+
+    def testRequestTrace(self):
+        trace = CollectTrace()
+        rosrs = ROSRS_Session(self.srsuri, accesskey="dummy", trace=trace)
+        (status, reason, rouri, manifest) = rosrs.createRO(Config.TEST_RO_NAME,
+            "Test RO for ROSRS_Session", "TestROSRS_StandIn.py", "2012-09-06")
+        rosrs.aggregateResourceInt(rouri, "test/data.txt", ctype="text/plain", body="Data\n")
+        (status, reason, headers, uri, data) = rosrs.getROResource("test/data.txt", rouri)
+        self.assertEqual(len(trace.requests), len(trace.responses))
+        record = trace.responses[-1]
+        self.assertEqual(trace.requests[-1], ("GET", "/ROs/"+Config.TEST_RO_PATH+"test/data.txt"))
+        self.assertEqual(record["method"], "GET")
+        self.assertEqual(record["status"], 200)
+        self.assertEqual(record["bytes"], 5)
+        self.assertEqual(record["data"], "Data\n")
+        self.assertTrue(record["elapsed"] >= 0)
+        self.assertEqual(trace.responses[-2]["method"], "PUT")
+        self.assertEqual(trace.responses[-2]["body"], "Data\n")
+        rosrs.close()
+        return
+
+    def testLogTrace(self):
+        logger  = logging.getLogger("TestROSRS_StandIn.trace")
+        handler = CollectHandler()
+        logger.addHandler(handler)
+        logger.propagate = False
+        self.addCleanup(logger.removeHandler, handler)
+        rosrs = ROSRS_Session(self.srsuri, accesskey="dummy",
+            trace=LogTrace(logger, level=logging.INFO, maxbody=10))
+        (status, reason, rouri, manifest) = rosrs.createRO(Config.TEST_RO_NAME,
+            "Test RO for ROSRS_Session", "TestROSRS_StandIn.py", "2012-09-06")
+        # Logger not enabled: nothing is traced
+        logger.setLevel(logging.WARNING)
+        rosrs.aggregateResourceInt(rouri, "test/data.txt", ctype="text/plain",
+            body=self.largeContent(100000))
+        self.assertEqual(handler.messages, [])
+        # Logger enabled: bodies are truncated
+        logger.setLevel(logging.INFO)
+        rosrs.getROResource("test/data.txt", rouri)
+        self.assertEqual(len(handler.messages), 3)
+        self.assertIn("GET /ROs/"+Config.TEST_RO_PATH+"test/data.txt: 200 OK, 100000 bytes",
+            handler.messages[1])
+        self.assertIn("data '0123456789'... (100000 bytes)", handler.messages[2])
+        rosrs.close()
+        return
+
+    def testLogTraceCredentials(self):
+        logger  = logging.getLogger("TestROSRS_StandIn.trace")
+        handler = CollectHandler()
+        logger.addHandler(handler)
+        logger.propagate = False
+        logger.setLevel(logging.INFO)
+        self.addCleanup(logger.removeHandler, handler)
+        rosrs = ROSRS_Session(self.srsuri, accesskey="secret-token-1234",
+            trace=LogTrace(logger, level=logging.INFO))
+        rosrs.listROs()
+        rosrs.doRequest(self.srsuri, reqheaders={ "Cookie": "session=secret-cookie" })
+        rosrs.close()
+        self.assertTrue(handler.messages)
+        for message in handler.messages:
+            self.assertNotIn("secret-token-1234", message)
+            self.assertNotIn("secret-cookie", message)
+        self.assertIn("'authorization': '<redacted>'", handler.messages[0])
+        return
+
+    def tracedSession(self, **kwargs):
+        trace = CollectTrace()
+        rosrs = ROSRS_Session(self.srsuri, accesskey="dummy", trace=trace, **kwargs)
+        self.addCleanup(rosrs.close)
+        return (rosrs, trace)
+
+    def setRedirects(self, rouri, redirects):
+        # redirects is list of (path, status, targetpath), relative to RO URI
+        with self.server.rosrs().lock:
+            for (path, status, target) in redirects:
+                self.server.rosrs().redirects[str(rouri)+path] = (status, str(rouri)+target)
+        return
+
+    def testRedirectCache(self):
+        (rosrs, trace) = self.tracedSession()
+        (status, reason, rouri, manifest) = rosrs.createRO(Config.TEST_RO_NAME,
+            "Test RO for ROSRS_Session", "TestROSRS_StandIn.py", "2012-09-06")
+        ropath = "/ROs/"+Config.TEST_RO_PATH
+        for i in range(3):
+            del trace.requests[:]
+            (status, reason, headers, uri, data) = rosrs.getROLandingPage(rouri)
+            self.assertEqual(status, 200)
+            self.assertEqual(str(uri), str(rouri)+"?format=html")
+            expected = [ ("GET", ropath+"?format=html") ]
+            if i == 0: expected.insert(0, ("GET", ropath))
+            self.assertEqual(trace.requests, expected)
+        # Remembered redirect depends on accept header
+        (status, reason, headers, uri, data) = rosrs.getROResource(rouri, accept="application/zip")
+        self.assertEqual(headers["content-type"], "application/zip")
+        return
+
+    def testRedirectChain(self):
+        (rosrs, trace) = self.tracedSession()
+        (status, reason, rouri, manifest) = rosrs.createRO(Config.TEST_RO_NAME,
+            "Test RO for ROSRS_Session", "TestROSRS_StandIn.py", "2012-09-06")
+        rosrs.aggregateResourceInt(rouri, "data.txt", ctype="text/plain", body="Data\n")
+        self.setRedirects(rouri,
+            [ ("a", 301, "b"), ("b", 302, "c"), ("c", 307, "d"), ("d", 308, "data.txt") ])
+        for i in range(2):
+            del trace.requests[:]
+            del trace.reqheaders[:]
+            (status, reason, headers, uri, data) = rosrs.getROResource("a", rouri,
+                accept="text/plain", reqheaders={ "x-test": "preserved" })
+            self.assertEqual(data, "Data\n")
+            self.assertEqual(str(uri), str(rouri)+"data.txt")
+            for h in trace.reqheaders:
+                self.assertEqual(h["accept"], "text/plain")
+                self.assertEqual(h["x-test"], "preserved")
+            # Only temporary redirects are repeated
+            paths = [ p.split("/")[-1] for (m, p) in trace.requests ]
+            self.assertEqual(paths, ["a", "b", "c", "d", "data.txt"] if i == 0 else ["b", "c", "d", "data.txt"])
+        # Redirect for PUT preserves method and body
+        self.setRedirects(rouri, [ ("put", 307, "data.txt") ])
+        content = StringIO.StringIO("New data\n")
+        (status, reason, headers, uri, data) = rosrs.doRequestFollowRedirect(
+            str(rouri)+"put", method="PUT", ctype="text/plain", body=content)
+        self.assertEqual(str(uri), str(rouri)+"data.txt")
+        self.assertEqual(self.storedResource(uri), ("text/plain", "New data\n"))
+        return
+
+    def testRedirectLimits(self):
+        (rosrs, trace) = self.tracedSession(maxredirects=3)
+        (status, reason, rouri, manifest) = rosrs.createRO(Config.TEST_RO_NAME,
+            "Test RO for ROSRS_Session", "TestROSRS_StandIn.py", "2012-09-06")
+        self.setRedirects(rouri, [ ("a", 302, "b"), ("b", 302, "c"), ("c", 302, "a") ])
+        self.assertRaises(ROSRS_Error, rosrs.getROResource, "a", rouri)
+        self.setRedirects(rouri, [ ("c", 302, "d"), ("d", 302, "e"), ("e", 302, "f") ])
+        self.assertRaises(ROSRS_Error, rosrs.getROResource, "a", rouri)
+        self.setRedirects(rouri, [ ("d", 404, "unused") ])
+        (status, reason, headers, uri, data) = rosrs.getROResource("a", rouri)
+        self.assertEqual(status, 404)
+        self.assertEqual(str(uri), str(rouri)+"d")
+        return
+
+    def testRedirectCacheStale(self):
+        (rosrs, trace) = self.tracedSession()
+        (status, reason, rouri, manifest) = self.createTestRO()
+        rosrs.aggregateResourceInt(rouri, "old.txt", ctype="text/plain", body="Old\n")
+        rosrs.aggregateResourceInt(rouri, "new.txt", ctype="text/plain", body="New\n")
+        self.setRedirects(rouri, [ ("moved", 301, "old.txt") ])
+        (status, reason, headers, uri, data) = rosrs.getROResource("moved", rouri)
+        self.assertEqual(data, "Old\n")
+        # Target of remembered redirect is removed, and redirect changed
+        rosrs.removeResource(rouri, "old.txt")
+        self.setRedirects(rouri, [ ("moved", 301, "new.txt") ])
+        (status, reason, headers, uri, data) = rosrs.getROResource("moved", rouri)
+        self.assertEqual(data, "New\n")
+        self.assertEqual(str(uri), str(rouri)+"new.txt")
+        return
+
+# Assemble test suite
+
+def getTestSuite(select="unit"):
+    """
+    Get test suite
+
+    select  is one of the following:
+            "unit"      return suite of unit tests only
+            "component" return suite of unit and component tests
+            "all"       return suite of unit, component and integration tests
+            "pending"   return suite of pending tests
+            name        a single named test to be run
+    """
+    testdict = {
+        "unit":
+            [ "testHelpers"
+            , "testGetROResourceStream"
+            , "testGetROResourceStreamClose"
+            , "testGetROResourceStreamNotFound"
+            , "testGetROZipDownload"
+            , "testAggregateResourceFile"
+            , "testAggregateResourceMmap"
+            , "testAggregateResourceGenerator"
+            , "testAggregateResources"
+            , "testAggregateResourcePutFails"
+            , "testManifestCache"
+            , "testManifestCacheLastModified"
+            , "testManifestCacheEviction"
+            , "testAnnotationBodyUrisFromManifest"
+            , "testAnnotationBodyUrisFallback"
+            , "testAnnotationGraph"
+            , "testAnnotationGraphInThread"
+            , "testAnnotationGraphCallerPool"
+            , "testAnnotationGraphMergeError"
+            , "testAnnotationGraphFailureError"
+            , "testRequestTrace"
+            , "testLogTrace"
+            , "testLogTraceCredentials"
+            , "testRedirectCache"
+            , "testRedirectChain"
+            , "testRedirectLimits"
+            , "testRedirectCacheStale"
+            ],
+        "component":
+            [
+            ],
+        "integration":
+            [
+            ],
+        "pending":
+            [
+            ]
+        }
+    return TestUtils.getTestSuite(TestROSRS_StandIn, testdict, select=select)
+
+if __name__ == "__main__":
+    TestUtils.runTests("TestROSRS_StandIn.log", getTestSuite, sys.argv)
+
+# End.
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+
+"""
+Module to test thread pool RO SRS client against a local stand-in RO SRS
+"""
+
+import os, os.path
+import sys
+import unittest
+import logging
+import zipfile
+import tempfile
+import shutil
+import rdflib
+
+from MiscLib import TestUtils
+
+from ROSRS_Session import ROSRS_Error
+from ROSRS_ThreadPoolSession import ROSRS_ThreadPoolSession
+from StandInServer import StandInServer
+
+# Logging object
+log = logging.getLogger(__name__)
+
+# Test cases
+
+class TestROSRS_ThreadPoolSession(unittest.TestCase):
+    """
+    This test suite tests ROSRS_ThreadPoolSession using a local stand-in RO SRS
+    """
+
+    def setUp(self):
+        super(TestROSRS_ThreadPoolSession, self).setUp()
+        self.server = StandInServer(latency=0.01)
+        self.srsuri = self.server.start()
+        self.tmpdir = tempfile.mkdtemp()
+        return
+
+    def tearDown(self):
+        super(TestROSRS_ThreadPoolSession, self).tearDown()
+        self.server.stop()
+        shutil.rmtree(self.tmpdir)
+        return
+
+    # Actual tests follow
+
+    def testConcurrentOperations(self):
+        with ROSRS_ThreadPoolSession(self.srsuri, accesskey="dummy", maxconnections=4) as rosrs:
+            created = [ rosrs.createRO("TestPooledRO%02d"%i,
+                            "Test RO %d"%i, "TestROSRS_ThreadPoolSession.py", "2012-09-06")
+                        for i in range(20) ]
+            rouris  = [ r.get(timeout=10)[2] for r in created ]
+            results = [ rosrs.aggregateResourceInt(rouri, "data/%d.txt"%i,
+                            ctype="text/plain", body="Resource %d\n"%i)
+                        for (i, rouri) in enumerate(rouris) ]
+            for r in results:
+                self.assertEqual(r.get(timeout=10)[0], 201)
+            rolist = rosrs.listROs().get(timeout=10)
+            self.assertEqual(len(rolist), 20)
+            (status, reason, headers, uri, data) = rosrs.getROResource(
+                "data/3.txt", rouris[3]).get(timeout=10)
+            self.assertEqual(data, "Resource 3\n")
+        self.assertTrue(self.server.connections() <= 4)
+        return
+
+    def testCallbackAndErrors(self):
+        completed = []
+        with ROSRS_ThreadPoolSession(self.srsuri, accesskey="dummy") as rosrs:
+            result = rosrs.createRO("TestPooledRO", "Test RO", "TestROSRS_ThreadPoolSession.py",
+                "2012-09-06", callback=completed.append)
+            (status, reason, rouri, manifest) = result.get(timeout=10)
+            self.assertEqual(status, 201)
+            result = rosrs.getROResource("http://example.org/not-in-rosrs")
+            self.assertRaises(ROSRS_Error, result.get, 10)
+            self.assertFalse(result.successful())
+        self.assertEqual(len(completed), 1)
+        self.assertEqual(completed[0][2], rouri)
+        return
+
+    def testAnnotationsAndZip(self):
+        with ROSRS_ThreadPoolSession(self.srsuri, accesskey="dummy") as rosrs:
+            (status, reason, rouri, manifest) = rosrs.createRO("TestPooledRO",
+                "Test RO", "TestROSRS_ThreadPoolSession.py", "2012-09-06").get(timeout=10)
+            resuri = rdflib.URIRef(str(rouri)+"data.txt")
+            rosrs.aggregateResourceInt(rouri, "data.txt",
+                ctype="text/plain", body="Data\n").get(timeout=10)
+            bodyuri = rdflib.URIRef(str(rouri)+"body.rdf")
+            (status, reason, annuri) = rosrs.createROAnnotationExt(
+                rouri, resuri, bodyuri).get(timeout=10)
+            self.assertEqual(rosrs.getROAnnotationUris(rouri, resuri).get(timeout=10), [annuri])
+            self.assertEqual(rosrs.getROAnnotationBodyUris(rouri).get(timeout=10), [bodyuri])
+            zippath = os.path.join(self.tmpdir, "ro.zip")
+            count   = rosrs.getROZipTo(rouri, zippath).get(timeout=10)
+            self.assertEqual(count, os.path.getsize(zippath))
+            self.assertEqual(zipfile.ZipFile(zippath).read("data.txt"), "Data\n")
+        return
+
+# Assemble test suite
+
+def getTestSuite(select="unit"):
+    """
+    Get test suite
+
+    select  is one of the following:
+            "unit"      return suite of unit tests only
+            "component" return suite of unit and component tests
+            "all"       return suite of unit, component and integration tests
+            "pending"   return suite of pending tests
+            name        a single named test to be run
+    """
+    testdict = {
+        "unit":
+            [ "testConcurrentOperations"
+            , "testCallbackAndErrors"
+            , "testAnnotationsAndZip"
+            ],
+        "component":
+            [
+            ],
+        "integration":
+            [
+            ],
+        "pending":
+            [
+            ]
+        }
+    return TestUtils.getTestSuite(TestROSRS_ThreadPoolSession, testdict, select=select)
+
+if __name__ == "__main__":
+    TestUtils.runTests("TestROSRS_ThreadPoolSession.log", getTestSuite, sys.argv)
+
+# End.
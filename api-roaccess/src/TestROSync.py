@@ -0,0 +1,292 @@
+#!/usr/bin/env python
+
+"""
+Module to test RO synchronization with local directories, using a local
+stand-in RO SRS
+"""
+
+import sys
+import os
+import json
+import shutil
+import tempfile
+import unittest
+import logging
+
+from MiscLib import TestUtils
+
+from ROSRS_Session import ROSRS_Session
+from ROSync import mirrorRO, pushRO, localPath, MIRROR_STATE, PUSH_STATE
+from StandInServer import StandInServer
+
+# Logging object
+log = logging.getLogger(__name__)
+
+# Test cases
+
+class TestROSync(unittest.TestCase):
+    """
+    This test suite tests mirroring ROs to, and pushing ROs from, local directories
+    """
+
+    def setUp(self):
+        super(TestROSync, self).setUp()
+        self.server  = StandInServer()
+        self.srsuri  = self.server.start()
+        self.rosrs   = ROSRS_Session(self.srsuri, accesskey="dummy")
+        self.tempdir = tempfile.mkdtemp(prefix="TestROSync")
+        return
+
+    def tearDown(self):
+        super(TestROSync, self).tearDown()
+        self.rosrs.close()
+        self.server.stop()
+        shutil.rmtree(self.tempdir)
+        return
+
+    def createRO(self):
+        (status, reason, rouri, manifest) = self.rosrs.createRO("TestSyncRO",
+            "Test RO", "TestROSync.py", "2012-09-06")
+        self.assertEqual(status, 201)
+        self.rosrs.aggregateResources(rouri,
+            [ ("data/a.txt",   "text/plain", "Content A\n")
+            , ("data/b.txt",   "text/plain", "Content B\n")
+            , ("readme.txt",   "text/plain", "Read me\n")
+            ])
+        self.rosrs.aggregateResourceExt(rouri, "http://example.org/external")
+        return rouri
+
+    def readFile(self, *parts):
+        with open(os.path.join(self.tempdir, *parts)) as f:
+            return f.read()
+
+    def writeFile(self, content, *parts):
+        path = os.path.join(self.tempdir, *parts)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, "w") as f:
+            f.write(content)
+        return
+
+    def createEmptyRO(self):
+        (status, reason, rouri, manifest) = self.rosrs.createRO("TestPushRO",
+            "Test RO", "TestROSync.py", "2012-09-06")
+        self.assertEqual(status, 201)
+        return rouri
+
+    def resourceContent(self, rouri, respath):
+        (status, reason, headers, uri, data) = self.rosrs.getROResource(respath, rouri)
+        return data if status == 200 else None
+
+    def actions(self, results):
+        return dict([ (r["path"], r["action"]) for r in results ])
+
+    # Actual tests follow
+
+    def testLocalPath(self):
+        self.assertEqual(localPath("d", "a/b.txt"), os.path.join("d", "a", "b.txt"))
+        self.assertEqual(localPath("d", "../a.txt"), None)
+        self.assertEqual(localPath("d", "/a.txt"), None)
+        self.assertEqual(localPath("d", "a//b.txt"), None)
+        self.assertEqual(localPath("d", "a/"), None)
+        self.assertEqual(localPath("d", ""), None)
+        return
+
+    def testMirror(self):
+        rouri   = self.createRO()
+        results = mirrorRO(self.rosrs, rouri, self.tempdir)
+        self.assertEqual(self.actions(results),
+            { "data/a.txt": "fetched", "data/b.txt": "fetched", "readme.txt": "fetched" })
+        self.assertEqual(self.readFile("data", "a.txt"), "Content A\n")
+        self.assertEqual(self.readFile("readme.txt"), "Read me\n")
+        self.assertIn("TestSyncRO", self.readFile(".ro", "manifest.rdf"))
+        state = json.loads(self.readFile(MIRROR_STATE))
+        self.assertEqual(state["rouri"], str(rouri))
+        self.assertEqual(sorted(state["resources"]), ["data/a.txt", "data/b.txt", "readme.txt"])
+        self.assertEqual(state["resources"]["data/a.txt"]["size"], 10)
+        self.assertTrue(state["resources"]["data/a.txt"]["etag"])
+        return
+
+    def testMirrorUnchanged(self):
+        rouri = self.createRO()
+        mirrorRO(self.rosrs, rouri, self.tempdir)
+        results = mirrorRO(self.rosrs, rouri, self.tempdir, concurrency=2)
+        self.assertEqual(set(self.actions(results).values()), set(["unchanged"]))
+        counts = self.server.requestCounts()
+        self.assertEqual((counts["resource"], counts["resource-304"]), (3, 3))
+        return
+
+    def testMirrorChanges(self):
+        rouri = self.createRO()
+        mirrorRO(self.rosrs, rouri, self.tempdir)
+        self.rosrs.doRequest(str(rouri)+"data/a.txt", method="PUT",
+            ctype="text/plain", body="Changed A\n")
+        self.rosrs.removeResource(rouri, str(rouri)+"data/b.txt")
+        self.rosrs.aggregateResourceInt(rouri, "new/c.txt", ctype="text/plain", body="New C\n")
+        with open(os.path.join(self.tempdir, "readme.txt"), "w") as f:
+            f.write("Locally modified\n")
+        results = mirrorRO(self.rosrs, rouri, self.tempdir)
+        self.assertEqual(self.actions(results),
+            { "data/a.txt": "fetched", "data/b.txt": "deleted"
+            , "readme.txt": "fetched", "new/c.txt": "fetched"
+            })
+        self.assertEqual(self.readFile("data", "a.txt"), "Changed A\n")
+        self.assertEqual(self.readFile("new", "c.txt"), "New C\n")
+        self.assertEqual(self.readFile("readme.txt"), "Read me\n")
+        self.assertFalse(os.path.exists(os.path.join(self.tempdir, "data", "b.txt")))
+        state = json.loads(self.readFile(MIRROR_STATE))
+        self.assertEqual(sorted(state["resources"]), ["data/a.txt", "new/c.txt", "readme.txt"])
+        return
+
+    def testMirrorRemovedDirectory(self):
+        rouri = self.createRO()
+        mirrorRO(self.rosrs, rouri, self.tempdir)
+        self.rosrs.removeResource(rouri, str(rouri)+"data/a.txt")
+        self.rosrs.removeResource(rouri, str(rouri)+"data/b.txt")
+        results = mirrorRO(self.rosrs, rouri, self.tempdir)
+        self.assertEqual(sorted([ r["path"] for r in results if r["action"] == "deleted" ]),
+            ["data/a.txt", "data/b.txt"])
+        self.assertFalse(os.path.exists(os.path.join(self.tempdir, "data")))
+        return
+
+    def testMirrorTruncated(self):
+        rouri = self.createRO()
+        self.server.rosrs().truncations = [3]
+        results = mirrorRO(self.rosrs, rouri, self.tempdir, concurrency=1)
+        failed  = [ r["path"] for r in results if r["action"] == "failed" ]
+        self.assertEqual(len(failed), 1)
+        self.assertFalse(os.path.exists(os.path.join(self.tempdir, *failed[0].split("/"))))
+        leftover = [ name for (dirpath, dirnames, filenames) in os.walk(self.tempdir)
+                          for name in filenames if name.endswith(".part") ]
+        self.assertEqual(leftover, [])
+        results = mirrorRO(self.rosrs, rouri, self.tempdir)
+        self.assertEqual(self.actions(results)[failed[0]], "fetched")
+        return
+
+    def testPush(self):
+        rouri = self.createEmptyRO()
+        self.writeFile("Content A\n", "data", "a.txt")
+        self.writeFile("Content B\n", "data", "b.txt")
+        self.writeFile("Has spaces\n", "with space.txt")
+        self.writeFile("Not pushed\n", ".ro", "manifest.rdf")
+        self.writeFile("Not pushed\n", "data", "c.txt.part")
+        results = pushRO(self.rosrs, self.tempdir, rouri, concurrency=3)
+        self.assertEqual(self.actions(results),
+            { "data/a.txt": "created", "data/b.txt": "created", "with space.txt": "created" })
+        self.assertEqual(self.resourceContent(rouri, "data/a.txt"), "Content A\n")
+        self.assertEqual(self.resourceContent(rouri, "with%20space.txt"), "Has spaces\n")
+        (status, reason, headers, uri, manifest) = self.rosrs.getROManifestModel(rouri)
+        self.assertEqual(len(manifest.getAggregatedResources()), 3)
+        state = json.loads(self.readFile(PUSH_STATE))
+        self.assertEqual(state["rouri"], str(rouri))
+        self.assertEqual(state["files"]["data/a.txt"]["size"], 10)
+        return
+
+    def testPushChanges(self):
+        rouri = self.createEmptyRO()
+        self.writeFile("Content A\n", "data", "a.txt")
+        self.writeFile("Content B\n", "data", "b.txt")
+        self.writeFile("Content C\n", "c.txt")
+        pushRO(self.rosrs, self.tempdir, rouri)
+        results = pushRO(self.rosrs, self.tempdir, rouri)
+        self.assertEqual(set(self.actions(results).values()), set(["unchanged"]))
+        self.writeFile("Changed A\n", "data", "a.txt")
+        self.writeFile("Content D\n", "d.txt")
+        os.remove(os.path.join(self.tempdir, "data", "b.txt"))
+        os.utime(os.path.join(self.tempdir, "c.txt"), (0, 0))     # Touched, not changed
+        results = pushRO(self.rosrs, self.tempdir, rouri)
+        self.assertEqual(self.actions(results),
+            { "data/a.txt": "updated", "data/b.txt": "deleted"
+            , "c.txt": "unchanged", "d.txt": "created"
+            })
+        self.assertEqual(self.resourceContent(rouri, "data/a.txt"), "Changed A\n")
+        self.assertEqual(self.resourceContent(rouri, "data/b.txt"), None)
+        (status, reason, headers, uri, manifest) = self.rosrs.getROManifestModel(rouri)
+        self.assertEqual(sorted([ str(r)[len(rouri):] for r in manifest.getAggregatedResources() ]),
+            ["c.txt", "d.txt", "data/a.txt"])
+        return
+
+    def testPushNoDelete(self):
+        rouri = self.createEmptyRO()
+        self.writeFile("Content A\n", "a.txt")
+        pushRO(self.rosrs, self.tempdir, rouri)
+        os.remove(os.path.join(self.tempdir, "a.txt"))
+        self.assertEqual(pushRO(self.rosrs, self.tempdir, rouri, delete=False), [])
+        self.assertEqual(self.resourceContent(rouri, "a.txt"), "Content A\n")
+        results = pushRO(self.rosrs, self.tempdir, rouri)
+        self.assertEqual(self.actions(results), { "a.txt": "deleted" })
+        return
+
+    def testPushDeleteMany(self):
+        rouri = self.createEmptyRO()
+        for i in range(10):
+            self.writeFile("Content %d\n"%i, "data", "f%d.txt"%i)
+        pushRO(self.rosrs, self.tempdir, rouri)
+        shutil.rmtree(os.path.join(self.tempdir, "data"))
+        before  = self.server.requestCounts()
+        results = pushRO(self.rosrs, self.tempdir, rouri, concurrency=4)
+        after   = self.server.requestCounts()
+        self.assertEqual(set(self.actions(results).values()), set(["deleted"]))
+        self.assertEqual(set([ r["status"] for r in results ]), set([204]))
+        # Proxies are found in the manifest retrieved once at the start
+        self.assertEqual(after.get("manifest", 0)+after.get("manifest-304", 0) -
+            before.get("manifest", 0)-before.get("manifest-304", 0), 1)
+        (status, reason, headers, uri, manifest) = self.rosrs.getROManifestModel(rouri)
+        self.assertEqual(manifest.getAggregatedResources(), [])
+        return
+
+    def testPushThenMirror(self):
+        rouri = self.createEmptyRO()
+        self.writeFile("Content A\n", "data", "a.txt")
+        self.writeFile("Has spaces\n", "with space.txt")
+        pushRO(self.rosrs, self.tempdir, rouri)
+        mirrordir = os.path.join(self.tempdir, "mirror")
+        results = mirrorRO(self.rosrs, rouri, mirrordir)
+        self.assertEqual(self.actions(results),
+            { "data/a.txt": "fetched", "with space.txt": "fetched" })
+        self.assertEqual(self.readFile("mirror", "with space.txt"), "Has spaces\n")
+        return
+
+# Assemble test suite
+
+def getTestSuite(select="unit"):
+    """
+    Get test suite
+
+    select  is one of the following:
+            "unit"      return suite of unit tests only
+            "component" return suite of unit and component tests
+            "all"       return suite of unit, component and integration tests
+            "pending"   return suite of pending tests
+            name        a single named test to be run
+    """
+    testdict = {
+        "unit":
+            [ "testLocalPath"
+            , "testMirror"
+            , "testMirrorUnchanged"
+            , "testMirrorChanges"
+            , "testMirrorRemovedDirectory"
+            , "testMirrorTruncated"
+            , "testPush"
+            , "testPushChanges"
+            , "testPushNoDelete"
+            , "testPushDeleteMany"
+            , "testPushThenMirror"
+            ],
+        "component":
+            [
+            ],
+        "integration":
+            [
+            ],
+        "pending":
+            [
+            ]
+        }
+    return TestUtils.getTestSuite(TestROSync, testdict, select=select)
+
+if __name__ == "__main__":
+    TestUtils.runTests("TestROSync.log", getTestSuite, sys.argv)
+
+# End.
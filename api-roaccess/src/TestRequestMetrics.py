@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+
+"""
+Module to test request metrics, using a local stand-in RO SRS
+"""
+
+import sys
+import unittest
+import logging
+
+from MiscLib import TestUtils
+
+from ROSRS_Session import ROSRS_Session
+from RequestMetrics import Histogram, MemoryMetrics, PrometheusMetrics
+from StandInServer import StandInServer
+
+# Logging object
+log = logging.getLogger(__name__)
+
+# Test cases
+
+class TestRequestMetrics(unittest.TestCase):
+    """
+    This test suite tests metrics sinks and ROSRS_Session instrumentation
+    """
+
+    def setUp(self):
+        super(TestRequestMetrics, self).setUp()
+        self.server = StandInServer()
+        self.srsuri = self.server.start()
+        return
+
+    def tearDown(self):
+        super(TestRequestMetrics, self).tearDown()
+        self.server.stop()
+        return
+
+    # Actual tests follow
+
+    def testHistogram(self):
+        h = Histogram(buckets=(0.1, 1.0))
+        for v in [0.05, 0.1, 0.5, 2.0, 3.0]:
+            h.observe(v)
+        self.assertEqual(h.count, 5)
+        self.assertAlmostEqual(h.sum, 5.65)
+        self.assertEqual(h.cumulative(), [(0.1, 2), (1.0, 3), (float("inf"), 5)])
+        return
+
+    def testMemoryMetrics(self):
+        metrics = MemoryMetrics(buckets=(1.0,))
+        metrics.increment("requests_total", { "method": "GET", "status": "200" })
+        metrics.increment("requests_total", { "method": "GET", "status": "404" })
+        metrics.increment("requests_total", { "method": "PUT", "status": "200" }, 3)
+        metrics.observe("request_seconds", { "method": "GET" }, 0.5)
+        self.assertEqual(metrics.counter("requests_total"), 5)
+        self.assertEqual(metrics.counter("requests_total", method="GET"), 2)
+        self.assertEqual(metrics.counter("requests_total", status="200"), 4)
+        self.assertEqual(metrics.counter("other_total"), 0)
+        self.assertEqual(metrics.histogram("request_seconds", method="GET").count, 1)
+        self.assertEqual(metrics.histogram("request_seconds", method="PUT"), None)
+        metrics.clear()
+        self.assertEqual(metrics.counters(), [])
+        return
+
+    def testPrometheusExposition(self):
+        metrics = PrometheusMetrics(prefix="test_", buckets=(0.1, 1.0))
+        metrics.observe("request_seconds", { "method": "GET", "operation": "createRO" }, 0.5)
+        metrics.observe("request_seconds", { "method": "GET", "operation": "createRO" }, 0.05)
+        metrics.increment("requests_total", { "method": "GET", "operation": 'a"b\\c' })
+        self.assertEqual(metrics.exposition().splitlines(),
+            [ "# HELP test_request_seconds Time for HTTP request, from sending request to reading response body"
+            , "# TYPE test_request_seconds histogram"
+            , 'test_request_seconds_bucket{method="GET",operation="createRO",le="0.1"} 1'
+            , 'test_request_seconds_bucket{method="GET",operation="createRO",le="1.0"} 2'
+            , 'test_request_seconds_bucket{method="GET",operation="createRO",le="+Inf"} 2'
+            , 'test_request_seconds_sum{method="GET",operation="createRO"} 0.55'
+            , 'test_request_seconds_count{method="GET",operation="createRO"} 2'
+            , "# HELP test_requests_total HTTP requests issued"
+            , "# TYPE test_requests_total counter"
+            , 'test_requests_total{method="GET",operation="a\\"b\\\\c"} 1'
+            ])
+        return
+
+    def testSessionMetrics(self):
+        metrics = MemoryMetrics()
+        rosrs   = ROSRS_Session(self.srsuri, accesskey="dummy", metrics=metrics)
+        (status, reason, rouri, manifest) = rosrs.createRO("TestMetricsRO",
+            "Test RO", "TestRequestMetrics.py", "2012-09-06")
+        content = "Resource content\n"*100
+        rosrs.aggregateResourceInt(rouri, "data.txt", ctype="text/plain", body=content)
+        rosrs.getROManifest(rouri)
+        rosrs.listROs()
+        rosrs.close()
+        # Operations
+        for op in ["createRO", "aggregateResourceInt", "getROManifest", "listROs"]:
+            h = metrics.histogram("operation_seconds", operation=op, outcome="ok")
+            self.assertEqual(h.count, 1, op)
+        # Requests per operation (createRO includes manifest retrieval)
+        self.assertEqual(metrics.counter("requests_total", operation="aggregateResourceInt"), 2)
+        self.assertEqual(metrics.counter("requests_total", operation="aggregateResourceInt",
+            method="PUT"), 1)
+        self.assertEqual(metrics.counter("requests_total", operation="other"), 0)
+        # Bytes and connections
+        self.assertEqual(metrics.counter("bytes_sent_total", operation="aggregateResourceInt",
+            method="PUT"), len(content))
+        self.assertTrue(metrics.counter("bytes_received_total", operation="listROs") > 0)
+        total = metrics.counter("requests_total")
+        self.assertEqual(metrics.counter("connections_total"), total)
+        self.assertEqual(metrics.counter("connections_total", reused="false"), 1)
+        connect = metrics.histograms()
+        self.assertEqual(sum([ h.count for (n, l, h) in connect if n == "connect_seconds" ]), 1)
+        # Timings
+        h = metrics.histogram("request_seconds", method="PUT", operation="aggregateResourceInt")
+        self.assertEqual(h.count, 1)
+        h = metrics.histogram("first_byte_seconds", method="GET", operation="getROManifest")
+        self.assertTrue(h.count >= 1)
+        h = metrics.histogram("rdf_parse_seconds", operation="getROManifest")
+        self.assertEqual(h.count, 1)
+        return
+
+    def testSessionMetricsError(self):
+        metrics = MemoryMetrics()
+        rosrs   = ROSRS_Session(self.srsuri, accesskey="dummy", metrics=metrics)
+        self.assertRaises(Exception, rosrs.getROResource, "http://example.org/other")
+        rosrs.close()
+        h = metrics.histogram("operation_seconds", operation="getROResource", outcome="error")
+        self.assertEqual(h.count, 1)
+        return
+
+    def testWorkerOperation(self):
+        metrics = MemoryMetrics()
+        rosrs   = ROSRS_Session(self.srsuri, accesskey="dummy", metrics=metrics)
+        (status, reason, rouri, manifest) = rosrs.createRO("TestMetricsRO",
+            "Test RO", "TestRequestMetrics.py", "2012-09-06")
+        rosrs.aggregateResources(rouri,
+            [ ("a.txt", "text/plain", "Content A\n")
+            , ("b.txt", "text/plain", "Content B\n")
+            , ("c.txt", "text/plain", "Content C\n")
+            ], concurrency=3)
+        rosrs.close()
+        # Requests made by worker threads belong to the calling operation
+        self.assertEqual(metrics.counter("requests_total", operation="aggregateResources"), 6)
+        self.assertEqual(metrics.counter("requests_total", operation="other"), 0)
+        h = metrics.histogram("operation_seconds", operation="aggregateResources", outcome="ok")
+        self.assertEqual(h.count, 1)
+        self.assertEqual(metrics.histogram("operation_seconds",
+            operation="aggregateResourceInt", outcome="ok"), None)
+        return
+
+    def testRequestErrorMetrics(self):
+        metrics = MemoryMetrics()
+        rosrs   = ROSRS_Session(self.srsuri, accesskey="dummy", metrics=metrics)
+        self.server.injectFailures(["reset"])
+        self.assertRaises(Exception, rosrs.listROs)
+        rosrs.listROs()
+        rosrs.close()
+        self.assertEqual(metrics.counter("requests_total", operation="listROs"), 2)
+        self.assertEqual(metrics.counter("requests_total", operation="listROs", status="error"), 1)
+        h = metrics.histogram("request_seconds", method="GET", operation="listROs")
+        self.assertEqual(h.count, 2)
+        return
+
+# Assemble test suite
+
+def getTestSuite(select="unit"):
+    """
+    Get test suite
+
+    select  is one of the following:
+            "unit"      return suite of unit tests only
+            "component" return suite of unit and component tests
+            "all"       return suite of unit, component and integration tests
+            "pending"   return suite of pending tests
+            name        a single named test to be run
+    """
+    testdict = {
+        "unit":
+            [ "testHistogram"
+            , "testMemoryMetrics"
+            , "testPrometheusExposition"
+            , "testSessionMetrics"
+            , "testSessionMetricsError"
+            , "testWorkerOperation"
+            , "testRequestErrorMetrics"
+            ],
+        "component":
+            [
+            ],
+        "integration":
+            [
+            ],
+        "pending":
+            [
+            ]
+        }
+    return TestUtils.getTestSuite(TestRequestMetrics, testdict, select=select)
+
+if __name__ == "__main__":
+    TestUtils.runTests("TestRequestMetrics.log", getTestSuite, sys.argv)
+
+# End.
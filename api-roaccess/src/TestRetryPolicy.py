@@ -0,0 +1,287 @@
+#!/usr/bin/env python
+
+"""
+Module to test retry policy and circuit breakers, using a local stand-in server
+"""
+
+import sys
+import time
+import socket
+import ssl
+import email.utils
+import StringIO
+import unittest
+import logging
+
+from MiscLib import TestUtils
+
+from ROSRS_Session import ROSRS_Session
+from RequestMetrics import MemoryMetrics
+from RetryPolicy import (RetryPolicy, CircuitBreaker, CircuitOpenError, parseRetryAfter,
+    CIRCUIT_CLOSED, CIRCUIT_OPEN, CIRCUIT_HALF_OPEN)
+from StandInServer import StandInServer
+
+# Logging object
+log = logging.getLogger(__name__)
+
+# Clock for testing time-dependent behaviour
+
+class TestClock(object):
+
+    def __init__(self):
+        self.now = 1000000000.0
+        return
+
+    def __call__(self):
+        return self.now
+
+# Test cases
+
+class TestRetryPolicy(unittest.TestCase):
+    """
+    This test suite tests RetryPolicy and CircuitBreaker, alone and with ROSRS_Session
+    """
+
+    def setUp(self):
+        super(TestRetryPolicy, self).setUp()
+        self.server = StandInServer()
+        self.srsuri = self.server.start()
+        self.waits  = []
+        return
+
+    def tearDown(self):
+        super(TestRetryPolicy, self).tearDown()
+        self.server.stop()
+        return
+
+    def retryPolicy(self, **kwargs):
+        # Retry policy that records delays rather than sleeping
+        return RetryPolicy(sleep=self.waits.append, **kwargs)
+
+    def session(self, policy):
+        rosrs = ROSRS_Session(self.srsuri, accesskey="dummy", retrypolicy=policy)
+        self.addCleanup(rosrs.close)
+        return rosrs
+
+    # Actual tests follow
+
+    def testParseRetryAfter(self):
+        now = time.time()
+        self.assertEqual(parseRetryAfter("120"), 120.0)
+        self.assertEqual(parseRetryAfter(" 5 "), 5.0)
+        self.assertEqual(parseRetryAfter(None), None)
+        self.assertEqual(parseRetryAfter("soon"), None)
+        httpdate = email.utils.formatdate(now+30, usegmt=True)
+        self.assertAlmostEqual(parseRetryAfter(httpdate, now=now), 30.0, delta=1.0)
+        httpdate = email.utils.formatdate(now-30, usegmt=True)
+        self.assertEqual(parseRetryAfter(httpdate, now=now), 0.0)
+        return
+
+    def testBackoffDelay(self):
+        policy = RetryPolicy(backoff=0.5, maxbackoff=3.0, maxretryafter=60)
+        for retry in range(6):
+            for i in range(20):
+                wait = policy.delay(retry)
+                self.assertTrue(0 <= wait <= min(3.0, 0.5*2**retry))
+        self.assertEqual(policy.delay(0, "10"), 10.0)
+        self.assertEqual(policy.delay(0, "600"), 60.0)
+        return
+
+    def testCircuitBreaker(self):
+        clock   = TestClock()
+        breaker = CircuitBreaker(threshold=3, resettimeout=10.0, clock=clock)
+        for i in range(2):
+            breaker.recordFailure()
+        self.assertEqual(breaker.state(), CIRCUIT_CLOSED)
+        breaker.recordSuccess()
+        for i in range(3):
+            self.assertTrue(breaker.allowRequest())
+            breaker.recordFailure()
+        self.assertEqual(breaker.state(), CIRCUIT_OPEN)
+        self.assertFalse(breaker.allowRequest())
+        # After reset timeout, a single trial request is allowed
+        clock.now += 10.0
+        self.assertEqual(breaker.state(), CIRCUIT_HALF_OPEN)
+        self.assertTrue(breaker.allowRequest())
+        self.assertFalse(breaker.allowRequest())
+        breaker.recordFailure()
+        self.assertEqual(breaker.state(), CIRCUIT_OPEN)
+        clock.now += 10.0
+        self.assertTrue(breaker.allowRequest())
+        breaker.recordSuccess()
+        self.assertEqual(breaker.state(), CIRCUIT_CLOSED)
+        self.assertTrue(breaker.allowRequest())
+        return
+
+    def testRetryStatus(self):
+        policy = self.retryPolicy(backoff=0.1)
+        rosrs  = self.session(policy)
+        self.server.injectFailures([503, (503, 2)])
+        rolist = rosrs.listROs()
+        self.assertEqual(rolist, [])
+        self.assertEqual(len(self.waits), 2)
+        self.assertTrue(0 <= self.waits[0] <= 0.1)
+        self.assertEqual(self.waits[1], 2.0)
+        stats = policy.stats()
+        self.assertEqual(stats["requests"], 3)
+        self.assertEqual(stats["retries"], 2)
+        self.assertEqual(stats["failures"], 2)
+        self.assertAlmostEqual(stats["retrywait"], sum(self.waits))
+        self.assertEqual(stats["circuits"], { self.srsuri.split("/")[2]: CIRCUIT_CLOSED })
+        return
+
+    def testRetryReset(self):
+        policy = self.retryPolicy()
+        rosrs  = self.session(policy)
+        self.server.injectFailures(["reset"])
+        (status, reason, headers, data) = rosrs.doRequest("", method="GET")
+        self.assertEqual(status, 200)
+        self.assertEqual(policy.stats()["retries"], 1)
+        return
+
+    def testRetrySeekableBody(self):
+        policy = self.retryPolicy()
+        rosrs  = self.session(policy)
+        (status, reason, rouri, manifest) = rosrs.createRO("TestRetryRO",
+            "Test RO", "TestRetryPolicy.py", "2012-09-06")
+        rosrs.aggregateResourceInt(rouri, "data.txt", ctype="text/plain", body="Original\n")
+        self.server.injectFailures([503])
+        content = StringIO.StringIO("Retried content\n")
+        (status, reason, headers, data) = rosrs.doRequest(str(rouri)+"data.txt",
+            method="PUT", ctype="text/plain", body=content)
+        self.assertIn(status, [200, 201])
+        self.assertEqual(len(self.waits), 1)
+        (status, reason, headers, uri, data) = rosrs.getROResource("data.txt", rouri)
+        self.assertEqual(data, "Retried content\n")
+        return
+
+    def testNoRetryPost(self):
+        policy = self.retryPolicy()
+        rosrs  = self.session(policy)
+        self.server.injectFailures([503])
+        (status, reason, headers, data) = rosrs.doRequest("", method="POST",
+            ctype="text/plain", body="Not retried")
+        self.assertEqual(status, 503)
+        self.assertEqual(self.waits, [])
+        self.assertEqual(policy.stats()["failures"], 1)
+        return
+
+    def testRetriesExhausted(self):
+        policy = self.retryPolicy(maxretries=2, breakerthreshold=10)
+        rosrs  = self.session(policy)
+        self.server.injectFailures([502, 502, 502])
+        (status, reason, headers, data) = rosrs.doRequest("", method="GET")
+        self.assertEqual(status, 502)
+        self.assertEqual(len(self.waits), 2)
+        (status, reason, headers, data) = rosrs.doRequest("", method="GET")
+        self.assertEqual(status, 200)
+        return
+
+    def testCircuitOpen(self):
+        clock  = TestClock()
+        policy = self.retryPolicy(maxretries=1, breakerthreshold=4, breakerreset=5.0, clock=clock)
+        rosrs  = self.session(policy)
+        self.server.injectFailures([503]*4)
+        for i in range(2):
+            (status, reason, headers, data) = rosrs.doRequest("", method="GET")
+            self.assertEqual(status, 503)
+        self.assertRaises(CircuitOpenError, rosrs.doRequest, "", method="GET")
+        self.assertEqual(policy.stats()["rejected"], 1)
+        # Server has recovered: trial request after reset timeout closes circuit
+        clock.now += 5.0
+        (status, reason, headers, data) = rosrs.doRequest("", method="GET")
+        self.assertEqual(status, 200)
+        self.assertEqual(policy.stats()["circuits"].values(), [CIRCUIT_CLOSED])
+        return
+
+    def testCircuitTrialError(self):
+        clock  = TestClock()
+        policy = self.retryPolicy(maxretries=0, breakerthreshold=1, breakerreset=5.0, clock=clock)
+        def fail(exc):
+            def func():
+                raise exc
+            return func
+        self.assertRaises(socket.error, policy.execute, "host", "GET", None,
+            fail(socket.error("refused")))
+        self.assertEqual(policy.stats()["circuits"]["host"], CIRCUIT_OPEN)
+        # Trial request raises an error that is not retried: circuit reopens
+        for exc in [ssl.SSLError("certificate verify failed"), ValueError("bad body")]:
+            clock.now += 5.0
+            self.assertRaises(type(exc), policy.execute, "host", "GET", None, fail(exc))
+            self.assertEqual(policy.stats()["circuits"]["host"], CIRCUIT_OPEN)
+        self.assertEqual(policy.stats()["failures"], 3)
+        clock.now += 5.0
+        result = policy.execute("host", "GET", None, lambda: (200, "OK", {}, ""))
+        self.assertEqual(result[0], 200)
+        self.assertEqual(policy.stats()["circuits"]["host"], CIRCUIT_CLOSED)
+        return
+
+    def testMetrics(self):
+        clock   = TestClock()
+        metrics = MemoryMetrics()
+        policy  = self.retryPolicy(maxretries=1, breakerthreshold=4, breakerreset=5.0,
+            metrics=metrics, clock=clock)
+        rosrs   = self.session(policy)
+        host    = self.srsuri.split("/")[2]
+        self.server.injectFailures([503]*4)
+        for i in range(2):
+            (status, reason, headers, data) = rosrs.doRequest("", method="GET")
+            self.assertEqual(status, 503)
+        self.assertEqual(metrics.counter("request_retries_total", host=host, method="GET"), 2)
+        self.assertEqual(metrics.counter("circuit_state_changes_total", host=host, state=CIRCUIT_OPEN), 1)
+        self.assertRaises(CircuitOpenError, rosrs.doRequest, "", method="GET")
+        self.assertEqual(metrics.counter("circuit_rejections_total", host=host), 1)
+        clock.now += 5.0
+        (status, reason, headers, data) = rosrs.doRequest("", method="GET")
+        self.assertEqual(status, 200)
+        self.assertEqual(metrics.counter("circuit_state_changes_total", host=host, state=CIRCUIT_HALF_OPEN), 1)
+        self.assertEqual(metrics.counter("circuit_state_changes_total", host=host, state=CIRCUIT_CLOSED), 1)
+        # Successful requests with the circuit closed are not reported as changes
+        rosrs.doRequest("", method="GET")
+        self.assertEqual(metrics.counter("circuit_state_changes_total", host=host, state=CIRCUIT_CLOSED), 1)
+        self.assertEqual(metrics.counter("request_retries_total", host=host, method="GET"), 2)
+        return
+
+# Assemble test suite
+
+def getTestSuite(select="unit"):
+    """
+    Get test suite
+
+    select  is one of the following:
+            "unit"      return suite of unit tests only
+            "component" return suite of unit and component tests
+            "all"       return suite of unit, component and integration tests
+            "pending"   return suite of pending tests
+            name        a single named test to be run
+    """
+    testdict = {
+        "unit":
+            [ "testParseRetryAfter"
+            , "testBackoffDelay"
+            , "testCircuitBreaker"
+            , "testRetryStatus"
+            , "testRetryReset"
+            , "testRetrySeekableBody"
+            , "testNoRetryPost"
+            , "testCircuitTrialError"
+            , "testRetriesExhausted"
+            , "testCircuitOpen"
+            , "testMetrics"
+            ],
+        "component":
+            [
+            ],
+        "integration":
+            [
+            ],
+        "pending":
+            [
+            ]
+        }
+    return TestUtils.getTestSuite(TestRetryPolicy, testdict, select=select)
+
+if __name__ == "__main__":
+    TestUtils.runTests("TestRetryPolicy.log", getTestSuite, sys.argv)
+
+# End.
@@ -0,0 +1,265 @@
+#!/usr/bin/env python
+
+"""
+Module to test SPARQL query result cache, alone and with SparqlHttpClient
+"""
+
+import sys
+import os
+import time
+import hashlib
+import shutil
+import tempfile
+import unittest
+import logging
+
+from MiscLib import TestUtils
+
+from SparqlHttpClient import SparqlHttpClient
+from SparqlCache import (SparqlResultCache, MemoryResultStore, DiskResultStore,
+    normalizeQuery, cacheKey)
+from RequestMetrics import MemoryMetrics
+from StandInServer import StandInServer, StandInSparqlHandler
+
+# Logging object
+log = logging.getLogger(__name__)
+
+# Clock for testing time-dependent behaviour
+
+class TestClock(object):
+
+    def __init__(self):
+        self.now = 1000000000.0
+        return
+
+    def __call__(self):
+        return self.now
+
+ENDPOINT  = "http://example.org/sparql"
+ENDPOINT2 = "http://example.net/sparql"
+ACCEPT    = "application/sparql-results+json"
+
+# Test cases
+
+class TestSparqlCache(unittest.TestCase):
+    """
+    This test suite tests SparqlResultCache, alone and with SparqlHttpClient
+    """
+
+    def setUp(self):
+        super(TestSparqlCache, self).setUp()
+        self.clock    = TestClock()
+        self.cachedir = tempfile.mkdtemp(prefix="TestSparqlCache")
+        return
+
+    def tearDown(self):
+        super(TestSparqlCache, self).tearDown()
+        shutil.rmtree(self.cachedir)
+        return
+
+    def cache(self, store=None, **kwargs):
+        return SparqlResultCache(store=store, clock=self.clock, **kwargs)
+
+    def client(self, cache):
+        server = StandInServer(handler=StandInSparqlHandler)
+        self.queries = []
+        def results(query):
+            self.queries.append(query)
+            return { "head": { "vars": ["n"] }, "results": { "bindings":
+                [ { "n": { "type": "literal", "value": str(len(self.queries)) } } ] } }
+        server.sparqlresults = results
+        endpoint = server.start()
+        self.addCleanup(server.stop)
+        sparql   = SparqlHttpClient(endpointuri=endpoint, cache=cache)
+        self.addCleanup(sparql.close)
+        return sparql
+
+    # Actual tests follow
+
+    def testNormalizeQuery(self):
+        self.assertEqual(
+            normalizeQuery("  PREFIX ex: <http://example.org/#>  # comment\n"
+                           "SELECT  ?s\tWHERE {\n  ?s ex:p \"a  # b\" ; ex:q '''x\n y''' }\n"),
+            "PREFIX ex: <http://example.org/#> SELECT ?s WHERE { ?s ex:p \"a  # b\" ; ex:q '''x\n y''' }")
+        self.assertEqual(cacheKey(ENDPOINT, ACCEPT, "SELECT * { ?s ?p ?o }"),
+            cacheKey(ENDPOINT, ACCEPT, "SELECT *\n{\n  ?s ?p ?o  # all\n}\n"))
+        self.assertNotEqual(cacheKey(ENDPOINT, ACCEPT, "SELECT * { ?s ?p ?o }"),
+            cacheKey(ENDPOINT, "text/csv", "SELECT * { ?s ?p ?o }"))
+        self.assertNotEqual(cacheKey(ENDPOINT, ACCEPT, "SELECT * { ?s ?p ?o }"),
+            cacheKey(ENDPOINT2, ACCEPT, "SELECT * { ?s ?p ?o }"))
+        self.assertNotEqual(cacheKey(ENDPOINT, ACCEPT, 'SELECT * { ?s ?p "a b" }'),
+            cacheKey(ENDPOINT, ACCEPT, 'SELECT * { ?s ?p "a  b" }'))
+        return
+
+    def testLookupStore(self):
+        cache = self.cache()
+        self.assertEqual(cache.lookup(ENDPOINT, ACCEPT, "SELECT 1"), None)
+        cache.store(ENDPOINT, ACCEPT, "SELECT 1", "result 1")
+        self.assertEqual(cache.lookup(ENDPOINT, ACCEPT, " SELECT  1 "), "result 1")
+        self.assertEqual(cache.lookup(ENDPOINT, "text/csv", "SELECT 1"), None)
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["stored"]), (1, 2, 1))
+        self.assertEqual((stats["entries"], stats["size"]), (1, 8))
+        return
+
+    def testExpiry(self):
+        cache = self.cache(ttl=60)
+        cache.store(ENDPOINT, ACCEPT, "SELECT 1", "result 1")
+        cache.store(ENDPOINT, ACCEPT, "SELECT 2", "result 2", ttl=600)
+        self.clock.now += 59
+        self.assertEqual(cache.lookup(ENDPOINT, ACCEPT, "SELECT 1"), "result 1")
+        self.clock.now += 1
+        self.assertEqual(cache.lookup(ENDPOINT, ACCEPT, "SELECT 1"), None)
+        self.assertEqual(cache.lookup(ENDPOINT, ACCEPT, "SELECT 2"), "result 2")
+        stats = cache.stats()
+        self.assertEqual((stats["expired"], stats["entries"]), (1, 1))
+        cache = self.cache(ttl=None)
+        cache.store(ENDPOINT, ACCEPT, "SELECT 1", "result 1")
+        self.clock.now += 1e9
+        self.assertEqual(cache.lookup(ENDPOINT, ACCEPT, "SELECT 1"), "result 1")
+        return
+
+    def testMemoryEviction(self):
+        cache = self.cache(MemoryResultStore(maxsize=20))
+        cache.store(ENDPOINT, ACCEPT, "SELECT 1", "x"*8)
+        cache.store(ENDPOINT, ACCEPT, "SELECT 2", "y"*8)
+        cache.lookup(ENDPOINT, ACCEPT, "SELECT 1")
+        cache.store(ENDPOINT, ACCEPT, "SELECT 3", "z"*8)
+        self.assertEqual(cache.lookup(ENDPOINT, ACCEPT, "SELECT 2"), None)
+        self.assertEqual(cache.lookup(ENDPOINT, ACCEPT, "SELECT 1"), "x"*8)
+        cache.store(ENDPOINT, ACCEPT, "SELECT 4", "w"*30)
+        self.assertEqual(cache.lookup(ENDPOINT, ACCEPT, "SELECT 4"), None)
+        stats = cache.stats()
+        self.assertEqual((stats["entries"], stats["size"], stats["evictions"]), (2, 16, 1))
+        return
+
+    def testDiskStore(self):
+        store = DiskResultStore(self.cachedir, maxsize=20)
+        cache = self.cache(store)
+        cache.store(ENDPOINT, ACCEPT, "SELECT 1", "x"*8)
+        cache.store(ENDPOINT, ACCEPT, "SELECT 2", "y"*8)
+        usetime = time.time()+10
+        os.utime(store._store.entryPath(cacheKey(ENDPOINT, ACCEPT, "SELECT 1")),
+            (usetime, usetime))
+        # Results persist, with least recently used evicted
+        cache = self.cache(DiskResultStore(self.cachedir, maxsize=20))
+        self.assertEqual(cache.stats()["entries"], 2)
+        cache.store(ENDPOINT, ACCEPT, "SELECT 3", "z"*8)
+        self.assertEqual(cache.lookup(ENDPOINT, ACCEPT, "SELECT 2"), None)
+        self.assertEqual(cache.lookup(ENDPOINT, ACCEPT, "SELECT 1"), "x"*8)
+        self.assertEqual(cache.lookup(ENDPOINT, ACCEPT, "SELECT 3"), "z"*8)
+        self.assertEqual(len(os.listdir(os.path.join(self.cachedir, "entries"))), 2)
+        self.assertEqual(len(os.listdir(os.path.join(self.cachedir, "objects"))), 2)
+        # Identical results share storage
+        cache.store(ENDPOINT2, ACCEPT, "SELECT 1", "x"*8)
+        self.assertEqual(cache.stats()["size"], 16)
+        self.assertEqual(len(os.listdir(os.path.join(self.cachedir, "objects"))), 2)
+        # Incomplete results are discarded on reload
+        with open(store._store.objectPath(hashlib.sha1("z"*8).hexdigest()), "w") as f:
+            f.write("z")
+        cache = self.cache(DiskResultStore(self.cachedir))
+        self.assertEqual(cache.lookup(ENDPOINT, ACCEPT, "SELECT 3"), None)
+        self.assertEqual(cache.lookup(ENDPOINT, ACCEPT, "SELECT 1"), "x"*8)
+        self.assertEqual(len(os.listdir(os.path.join(self.cachedir, "objects"))), 1)
+        return
+
+    def testInvalidate(self):
+        for store in [MemoryResultStore(), DiskResultStore(self.cachedir)]:
+            cache = self.cache(store)
+            cache.store(ENDPOINT,  ACCEPT,     "SELECT 1", "a")
+            cache.store(ENDPOINT,  "text/csv", "SELECT 1", "b")
+            cache.store(ENDPOINT,  ACCEPT,     "SELECT 2", "c")
+            cache.store(ENDPOINT2, ACCEPT,     "SELECT 1", "d")
+            self.assertEqual(cache.invalidate(ENDPOINT, query=" SELECT 1"), 2)
+            self.assertEqual(cache.lookup(ENDPOINT, ACCEPT, "SELECT 2"), "c")
+            self.assertEqual(cache.invalidate(ENDPOINT), 1)
+            self.assertEqual(cache.lookup(ENDPOINT2, ACCEPT, "SELECT 1"), "d")
+            cache.clear()
+            self.assertEqual(cache.lookup(ENDPOINT2, ACCEPT, "SELECT 1"), None)
+            self.assertEqual(cache.stats()["invalidated"], 4)
+        return
+
+    def testMetrics(self):
+        metrics = MemoryMetrics()
+        cache   = self.cache(metrics=metrics)
+        cache.lookup(ENDPOINT, ACCEPT, "SELECT 1")
+        cache.store(ENDPOINT, ACCEPT, "SELECT 1", "a")
+        cache.lookup(ENDPOINT, ACCEPT, "SELECT 1")
+        cache.lookup(ENDPOINT, ACCEPT, "SELECT 1")
+        self.assertEqual(metrics.counter("sparql_cache_lookups_total", result="hit"), 2)
+        self.assertEqual(metrics.counter("sparql_cache_lookups_total", result="miss"), 1)
+        return
+
+    def testClientCache(self):
+        sparql = self.client(self.cache(ttl=60))
+        ((status, reason), result) = sparql.doQueryGET("SELECT ?n {}")
+        self.assertEqual(result["results"]["bindings"][0]["n"]["value"], "1")
+        ((status, reason), result) = sparql.doQueryPOST("SELECT  ?n\n{}")
+        self.assertEqual(status, 200)
+        self.assertEqual(result["results"]["bindings"][0]["n"]["value"], "1")
+        ((status, reason), columnar) = sparql.doQueryGET("SELECT ?n {}", columnar=True)
+        self.assertEqual(columnar.column("n"), ["1"])
+        self.assertEqual(len(self.queries), 1)
+        # Streamed queries are not cached
+        ((status, reason), reader) = sparql.doQueryGET("SELECT ?n {}", stream=True)
+        self.assertEqual(list(reader)[0]["n"]["value"], "2")
+        self.assertEqual(sparql.invalidateCache(), 1)
+        ((status, reason), columnar) = sparql.doQueryGET("SELECT ?n {}", columnar=True)
+        self.assertEqual(columnar.column("n"), ["3"])
+        ((status, reason), result) = sparql.doQueryGET("SELECT ?n {}")
+        self.assertEqual(result["results"]["bindings"][0]["n"]["value"], "3")
+        self.clock.now += 60
+        ((status, reason), result) = sparql.doQueryGET("SELECT ?n {}")
+        self.assertEqual(result["results"]["bindings"][0]["n"]["value"], "4")
+        return
+
+    def testClientErrorNotCached(self):
+        cache  = self.cache()
+        sparql = self.client(cache)
+        sparql.setQueryEndpoint(endpointpath="/nosuchpath")
+        ((status, reason), result) = sparql.doQueryGET("SELECT ?n {}")
+        self.assertEqual(status, 404)
+        self.assertEqual(cache.stats()["entries"], 0)
+        return
+
+# Assemble test suite
+
+def getTestSuite(select="unit"):
+    """
+    Get test suite
+
+    select  is one of the following:
+            "unit"      return suite of unit tests only
+            "component" return suite of unit and component tests
+            "all"       return suite of unit, component and integration tests
+            "pending"   return suite of pending tests
+            name        a single named test to be run
+    """
+    testdict = {
+        "unit":
+            [ "testNormalizeQuery"
+            , "testLookupStore"
+            , "testExpiry"
+            , "testMemoryEviction"
+            , "testDiskStore"
+            , "testInvalidate"
+            , "testMetrics"
+            , "testClientCache"
+            , "testClientErrorNotCached"
+            ],
+        "component":
+            [
+            ],
+        "integration":
+            [
+            ],
+        "pending":
+            [
+            ]
+        }
+    return TestUtils.getTestSuite(TestSparqlCache, testdict, select=select)
+
+if __name__ == "__main__":
+    TestUtils.runTests("TestSparqlCache.log", getTestSuite, sys.argv)
+
+# End.
@@ -0,0 +1,539 @@
+#!/usr/bin/env python
+
+"""
+Module to test SPARQL HTTP client and results handling, using a local
+stand-in SPARQL endpoint
+"""
+
+import sys
+import re
+import json
+import time
+import threading
+import unittest
+import logging
+
+from MiscLib import TestUtils
+
+from SparqlHttpClient import SparqlHttpClient, SparqlHttpError
+from SparqlPagination import splitQuery, splitDataset, keyCondition
+from SparqlJsonResults import SparqlJsonReader
+from SparqlColumnarResults import ColumnarResults, ResultRow, numpy, pandas
+from StandInServer import StandInServer, StandInSparqlHandler
+
+# Logging object
+log = logging.getLogger(__name__)
+
+# Test data
+
+def makeResults(rowcount):
+    return (
+        { "head":    { "vars": ["s", "o"] }
+        , "results": { "bindings":
+            [ { "s": { "type": "uri",     "value": "http://example.org/s%d"%i }
+              , "o": { "type": "literal", "value": "Value %d"%i, "xml:lang": "en" }
+              } for i in range(rowcount) ]
+            }
+        })
+
+def makeMixedResults():
+    return (
+        { "head":    { "vars": ["s", "v", "u"] }
+        , "results": { "bindings":
+            [ { "s": { "type": "uri",     "value": "http://example.org/s" }
+              , "v": { "type": "literal", "value": "plain" }
+              }
+            , { "s": { "type": "bnode",   "value": "b0" }
+              , "v": { "type": "literal", "value": "42"
+                     , "datatype": "http://www.w3.org/2001/XMLSchema#integer" }
+              , "u": { "type": "uri",     "value": "http://example.org/s" }
+              }
+            , { "v": { "type": "typed-literal", "value": "1.5"
+                     , "datatype": "http://www.w3.org/2001/XMLSchema#decimal" }
+              , "u": { "type": "literal", "value": "chat", "xml:lang": "fr" }
+              }
+            ] }
+        })
+
+def deepSizeof(obj, seen=None):
+    """
+    Return approximate memory used by an object and the objects it refers to
+    """
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum([ deepSizeof(k, seen)+deepSizeof(v, seen) for (k, v) in obj.iteritems() ])
+    elif isinstance(obj, (list, tuple, set)):
+        size += sum([ deepSizeof(v, seen) for v in obj ])
+    elif hasattr(obj, "__dict__"):
+        size += deepSizeof(obj.__dict__, seen)
+    if hasattr(obj, "__slots__"):
+        size += sum([ deepSizeof(getattr(obj, a), seen) for a in obj.__slots__ if hasattr(obj, a) ])
+    return size
+
+class PagedResults(object):
+    """
+    Results function for the stand-in SPARQL endpoint that applies the
+    LIMIT, OFFSET and key FILTER of a paginated query to an ordered table
+    of rows, and records the queries received
+    """
+
+    def __init__(self, rowcount):
+        self.rows    = makeResults(rowcount)["results"]["bindings"]
+        for (i, row) in enumerate(self.rows):
+            row["s"]["value"] = "http://example.org/s%05d"%i
+        self.queries = []
+        self.lock    = threading.Lock()
+        self.event   = threading.Event()    # Set when a second query is received
+        return
+
+    def __call__(self, query):
+        with self.lock:
+            self.queries.append(query)
+            if len(self.queries) > 1:
+                self.event.set()
+        rows   = self.rows
+        after  = re.search(r'STR\(\?s\) > "([^"]*)"', query)
+        if after:
+            rows = [ r for r in rows if r["s"]["value"] > after.group(1) ]
+        offset = re.findall(r"OFFSET (\d+)", query)
+        if offset:
+            rows = rows[int(offset[-1]):]
+        limit  = re.findall(r"LIMIT (\d+)", query)
+        if limit:
+            rows = rows[:int(limit[-1])]
+        return { "head": { "vars": ["s", "o"] }, "results": { "bindings": rows } }
+
+class ConcurrentResults(object):
+    """
+    Results function for the stand-in SPARQL endpoint that answers a query
+    "SELECT <n> <delay>" with n rows after the given delay, and records the
+    number of queries being handled at once
+    """
+
+    def __init__(self):
+        self.lock    = threading.Lock()
+        self.active  = 0
+        self.maximum = 0
+        return
+
+    def __call__(self, query):
+        match = re.match(r"SELECT (\d+) ([\d.]+)$", query)
+        if not match:
+            raise ValueError("Bad query: %s"%query)
+        with self.lock:
+            self.active += 1
+            self.maximum = max(self.maximum, self.active)
+        time.sleep(float(match.group(2)))
+        with self.lock:
+            self.active -= 1
+        return makeResults(int(match.group(1)))
+
+class ChunkedInput(object):
+    """
+    File-like object that returns small blocks of a string, and records
+    how much has been read
+    """
+
+    def __init__(self, data, blocksize=7):
+        self.data      = data
+        self.blocksize = blocksize
+        self.pos       = 0
+        return
+
+    def read(self, amt):
+        data = self.data[self.pos:self.pos+min(amt, self.blocksize)]
+        self.pos += len(data)
+        return data
+
+# Test cases
+
+class TestSparqlHttpClient(unittest.TestCase):
+    """
+    This test suite tests SparqlHttpClient and SPARQL results handling
+    """
+
+    def setUp(self):
+        super(TestSparqlHttpClient, self).setUp()
+        self.server = StandInServer(handler=StandInSparqlHandler)
+        return
+
+    def startServer(self, sparqlresults=None):
+        # Results function must be set before the stand-in server is started
+        if sparqlresults:
+            self.server.sparqlresults = sparqlresults
+        endpoint = self.server.start()
+        self.addCleanup(self.server.stop)
+        sparql   = SparqlHttpClient(endpointuri=endpoint)
+        self.addCleanup(sparql.close)
+        return sparql
+
+    # Actual tests follow
+
+    def testJsonReader(self):
+        results = makeResults(50)
+        text    = json.dumps(results, indent=2)
+        reader  = SparqlJsonReader(ChunkedInput(text), chunksize=16)
+        self.assertEqual(reader.vars(), ["s", "o"])
+        self.assertEqual(list(reader), results["results"]["bindings"])
+        return
+
+    def testJsonReaderIncremental(self):
+        text   = json.dumps(makeResults(1000))
+        source = ChunkedInput(text, blocksize=100)
+        reader = SparqlJsonReader(source, chunksize=100)
+        rows   = reader.bindings()
+        self.assertEqual(rows.next()["s"]["value"], "http://example.org/s0")
+        self.assertTrue(source.pos < 1000)
+        maxbuffer = 0
+        for row in rows:
+            maxbuffer = max(maxbuffer, len(reader._buf))
+        self.assertEqual(source.pos, len(text))
+        self.assertTrue(maxbuffer < 400, maxbuffer)
+        return
+
+    def testJsonReaderMemberOrder(self):
+        text = ( '{ "results": { "distinct": false, "bindings": [ { "x": '
+                 '{ "type": "literal", "value": "a \\"quoted\\" [value], {\\u00e9}" } } ] },'
+                 ' "head": { "vars": [ "x" ], "link": [] }, "extra": 12345 }' )
+        for blocksize in [1, 3, 1000]:
+            reader = SparqlJsonReader(ChunkedInput(text, blocksize), chunksize=blocksize)
+            self.assertEqual(reader.vars(), ["x"])
+            self.assertEqual(list(reader),
+                [ { "x": { "type": "literal", "value": u'a "quoted" [value], {\xe9}' } } ])
+        reader = SparqlJsonReader(ChunkedInput(text))
+        self.assertEqual(reader.readAll(),
+            { "head":    { "vars": ["x"], "link": [] }
+            , "results": { "bindings":
+                [ { "x": { "type": "literal", "value": u'a "quoted" [value], {\xe9}' } } ] }
+            })
+        return
+
+    def testJsonReaderAsk(self):
+        reader = SparqlJsonReader(ChunkedInput('{ "head": {}, "boolean": true }', 2))
+        self.assertEqual(list(reader), [])
+        self.assertEqual(reader.boolean, True)
+        self.assertEqual(reader.vars(), [])
+        return
+
+    def testJsonReaderMalformed(self):
+        for text in [ '{ "head": { "vars": [] }, "results": { "bindings": [ {} '
+                    , '{ "head": { "vars": [] } } trailing'
+                    , '[ 1, 2 ]'
+                    , '{ "results": { "bindings": [ {} {} ] } }'
+                    ]:
+            reader = SparqlJsonReader(ChunkedInput(text))
+            self.assertRaises(ValueError, list, reader)
+        return
+
+    def testQueryStream(self):
+        sparql = self.startServer(lambda query: makeResults(5000))
+        query  = "SELECT * WHERE { ?s ?p ?o }"
+        ((status, reason), reader) = sparql.doQueryGET(query, stream=True)
+        self.assertEqual(status, 200)
+        with reader:
+            self.assertEqual(reader.vars(), ["s", "o"])
+            count = 0
+            for row in reader:
+                self.assertEqual(row["o"]["value"], "Value %d"%count)
+                count += 1
+        self.assertEqual(count, 5000)
+        ((status, reason), reader) = sparql.doQueryPOST(query, stream=True)
+        self.assertEqual(len(reader.readAll()["results"]["bindings"]), 5000)
+        # Connection was released and reused
+        ((status, reason), result) = sparql.doQueryGET(query)
+        self.assertEqual(len(result["results"]["bindings"]), 5000)
+        self.assertEqual(self.server.connections(), 1)
+        return
+
+    def testQueryStreamClosed(self):
+        sparql = self.startServer(lambda query: makeResults(5000))
+        query  = "SELECT * WHERE { ?s ?p ?o }"
+        ((status, reason), reader) = sparql.doQueryGET(query, stream=True)
+        with reader:
+            reader.bindings().next()
+        ((status, reason), result) = sparql.doQueryGET(query)
+        self.assertEqual(status, 200)
+        self.assertEqual(sparql.connectionPool().stats()["created"], 2)
+        return
+
+    def testColumnarRoundTrip(self):
+        for results in [makeMixedResults(), makeResults(20), makeResults(0)]:
+            columnar = ColumnarResults.fromJson(results)
+            self.assertEqual(len(columnar), len(results["results"]["bindings"]))
+            self.assertEqual(columnar.toJson(), results)
+            self.assertEqual(list(columnar), results["results"]["bindings"])
+        reader   = SparqlJsonReader(ChunkedInput(json.dumps(makeMixedResults())))
+        columnar = ColumnarResults.fromReader(reader)
+        self.assertEqual(columnar.toJson(), makeMixedResults())
+        return
+
+    def testColumnarRows(self):
+        columnar = ColumnarResults.fromJson(makeMixedResults())
+        row = columnar[1]
+        self.assertTrue(isinstance(row, ResultRow))
+        self.assertFalse(hasattr(row, "__dict__"))
+        self.assertEqual(row["s"], { "type": "bnode", "value": "b0" })
+        self.assertEqual(row.value("v"), "42")
+        self.assertEqual(sorted(row.keys()), ["s", "u", "v"])
+        row = columnar[-1]
+        self.assertEqual(row.keys(), ["v", "u"])
+        self.assertFalse("s" in row)
+        self.assertRaises(KeyError, lambda: row["s"])
+        self.assertEqual(row.get("s"), None)
+        self.assertEqual(row.value("s", "default"), "default")
+        self.assertEqual(row["u"], { "type": "literal", "value": "chat", "xml:lang": "fr" })
+        self.assertRaises(IndexError, lambda: columnar[3])
+        return
+
+    def testColumnarColumns(self):
+        columnar = ColumnarResults.fromJson(makeMixedResults())
+        self.assertEqual(columnar.column("s"), ["http://example.org/s", "b0", None])
+        self.assertEqual(columnar.column("u"), [None, "http://example.org/s", "chat"])
+        # Repeated strings are stored once
+        self.assertEqual(columnar.codes("s")[0], columnar.codes("u")[1])
+        self.assertEqual(list(columnar.codes("s"))[2], -1)
+        self.assertEqual(len(columnar.strings), 9)
+        return
+
+    def testColumnarMemory(self):
+        results  = makeResults(2000)
+        for b in results["results"]["bindings"]:
+            b["o"]["datatype"] = "http://www.w3.org/2001/XMLSchema#string"
+            del b["o"]["xml:lang"]
+        columnar = ColumnarResults.fromJson(results)
+        jsonsize = deepSizeof(results)
+        colsize  = deepSizeof(columnar)
+        self.assertTrue(colsize*2 < jsonsize, (colsize, jsonsize))
+        return
+
+    @unittest.skipIf(numpy is None, "NumPy not installed")
+    def testColumnarNumpy(self):
+        arrays = ColumnarResults.fromJson(makeMixedResults()).toNumpy()
+        self.assertEqual(list(arrays["s"]), ["http://example.org/s", "b0", None])
+        self.assertEqual(list(arrays["v"]), ["plain", "42", "1.5"])
+        return
+
+    @unittest.skipIf(pandas is None, "pandas not installed")
+    def testColumnarDataFrame(self):
+        frame = ColumnarResults.fromJson(makeMixedResults()).toDataFrame()
+        self.assertEqual(list(frame.columns), ["s", "v", "u"])
+        self.assertEqual(list(frame["v"]), ["plain", "42", "1.5"])
+        self.assertTrue(pandas.isnull(frame["s"][2]))
+        return
+
+    def testQueryColumnar(self):
+        sparql = self.startServer(lambda query: makeResults(3000))
+        query  = "SELECT * WHERE { ?s ?p ?o }"
+        ((status, reason), columnar) = sparql.doQueryGET(query, columnar=True)
+        self.assertEqual(status, 200)
+        self.assertTrue(isinstance(columnar, ColumnarResults))
+        self.assertEqual(columnar.vars, ["s", "o"])
+        self.assertEqual(len(columnar), 3000)
+        self.assertEqual(columnar[2999]["o"],
+            { "type": "literal", "value": "Value 2999", "xml:lang": "en" })
+        ((status, reason), columnar) = sparql.doQueryPOST(query, columnar=True)
+        self.assertEqual(columnar.toJson(), makeResults(3000))
+        self.assertEqual(sparql.connectionPool().stats()["created"], 1)
+        return
+
+    def testSplitQuery(self):
+        self.assertEqual(
+            splitQuery("PREFIX ex: <http://example.org/>\nSELECT ?s WHERE { ?s a ex:C }"),
+            ("PREFIX ex: <http://example.org/>\n", "SELECT ?s WHERE { ?s a ex:C }", None, None))
+        self.assertEqual(
+            splitQuery("SELECT * { ?s ?p ?o } ORDER BY ?s limit 10 OFFSET 20\n"),
+            ("", "SELECT * { ?s ?p ?o } ORDER BY ?s", 10, 20))
+        self.assertEqual(
+            splitQuery("# List <things>\nPREFIX ex: <http://example.org/#>\n# Comment\n"
+                       "SELECT ?s { ?s a ex:C } LIMIT 5"),
+            ("# List <things>\nPREFIX ex: <http://example.org/#>\n# Comment\n",
+             "SELECT ?s { ?s a ex:C }", 5, None))
+        self.assertRaises(ValueError, splitQuery, "ASK { ?s ?p ?o }")
+        self.assertRaises(ValueError, splitQuery, "# SELECT ?s\nASK { ?s ?p ?o }")
+        self.assertEqual(
+            splitDataset("SELECT ?s FROM <http://a/g1> from named ex:g2 WHERE { ?s ?p <x:FROM> }"),
+            ("SELECT ?s WHERE { ?s ?p <x:FROM> }", "FROM <http://a/g1> from named ex:g2"))
+        self.assertEqual(splitDataset("SELECT * { ?s ?p ?o }"), ("SELECT * { ?s ?p ?o }", ""))
+        self.assertEqual(keyCondition("s", { "type": "uri", "value": 'http://a/"b"' }),
+            'STR(?s) > "http://a/\\"b\\""')
+        self.assertEqual(keyCondition("n", { "type": "literal", "value": "5",
+            "datatype": "http://www.w3.org/2001/XMLSchema#integer" }),
+            '?n > "5"^^<http://www.w3.org/2001/XMLSchema#integer>')
+        self.assertRaises(ValueError, keyCondition, "s", { "type": "bnode", "value": "b0" })
+        return
+
+    def testQueryPaged(self):
+        results = PagedResults(2500)
+        sparql  = self.startServer(results)
+        paged   = sparql.doQueryPaged("SELECT ?s ?o WHERE { ?s ?p ?o }", pagesize=1000)
+        self.assertEqual(results.queries, [])
+        self.assertEqual(list(paged), results.rows)
+        self.assertEqual(paged.vars(), ["s", "o"])
+        self.assertEqual(paged.pages, 3)
+        self.assertEqual(results.queries,
+            [ "SELECT ?s ?o WHERE { ?s ?p ?o } ORDER BY ?s ?o LIMIT 1000 OFFSET %d"%o
+              for o in [0, 1000, 2000] ])
+        return
+
+    def testQueryPagedLimit(self):
+        results = PagedResults(2500)
+        sparql  = self.startServer(results)
+        paged   = sparql.doQueryPaged("SELECT * WHERE { ?s ?p ?o } ORDER BY ?s LIMIT 1500 OFFSET 10",
+            pagesize=1000, post=True)
+        self.assertEqual(list(paged), results.rows[10:1510])
+        self.assertEqual(results.queries[-1],
+            "SELECT * WHERE { ?s ?p ?o } ORDER BY ?s LIMIT 500 OFFSET 1010")
+        # Exact multiple of page size needs a final empty page
+        results.rows = results.rows[:2000]
+        self.assertEqual(len(list(sparql.doQueryPaged("SELECT ?s ?o {}", pagesize=1000))), 2000)
+        return
+
+    def testQueryPagedKeyset(self):
+        results = PagedResults(2500)
+        sparql  = self.startServer(results)
+        paged   = sparql.doQueryPaged("SELECT * WHERE { ?s ?p ?o } OFFSET 5", pagesize=1000,
+            keyvar="?s", prefetch=False)
+        self.assertEqual(list(paged), results.rows[5:])
+        self.assertEqual(len(results.queries), 3)
+        self.assertEqual(results.queries[0],
+            "SELECT * WHERE { { SELECT * WHERE { ?s ?p ?o } } } ORDER BY ?s LIMIT 1000")
+        self.assertEqual(results.queries[2],
+            "SELECT * WHERE { { SELECT * WHERE { ?s ?p ?o } }"
+            " FILTER ( STR(?s) > \"http://example.org/s01999\" ) } ORDER BY ?s LIMIT 1000")
+        return
+
+    def testQueryPagedKeysetDataset(self):
+        results = PagedResults(1500)
+        sparql  = self.startServer(results)
+        paged   = sparql.doQueryPaged(
+            "# Comment\nPREFIX ex: <http://example.org/>\n"
+            "SELECT ?s ?o FROM ex:g1 FROM NAMED <http://example.org/g2> WHERE { ?s ?p ?o }",
+            pagesize=1000, keyvar="s", prefetch=False)
+        self.assertEqual(list(paged), results.rows)
+        # Dataset clauses are not allowed in a subquery
+        self.assertEqual(results.queries[1],
+            "# Comment\nPREFIX ex: <http://example.org/>\n"
+            "SELECT * FROM ex:g1 FROM NAMED <http://example.org/g2>"
+            " WHERE { { SELECT ?s ?o WHERE { ?s ?p ?o } }"
+            " FILTER ( STR(?s) > \"http://example.org/s00999\" ) } ORDER BY ?s LIMIT 1000")
+        return
+
+    def testQueryPagedPrefetch(self):
+        results = PagedResults(2500)
+        sparql  = self.startServer(results)
+        paged   = sparql.doQueryPaged("SELECT ?s ?o {}", pagesize=1000)
+        self.assertEqual(paged.next(), results.rows[0])
+        # Second page is requested while the first is being read
+        self.assertTrue(results.event.wait(5))
+        paged.close()
+        self.assertRaises(StopIteration, paged.next)
+        return
+
+    def testQueryPagedError(self):
+        sparql = self.startServer(PagedResults(10))
+        sparql.setQueryEndpoint(endpointpath="/nosuchpath")
+        paged  = sparql.doQueryPaged("SELECT ?s ?o {}")
+        self.assertRaises(SparqlHttpError, list, paged)
+        return
+
+    def testQueries(self):
+        results = ConcurrentResults()
+        sparql  = self.startServer(results)
+        queries = [ "SELECT %d 0.02"%(i%7) for i in range(40) ]
+        count   = 0
+        for (i, result) in enumerate(sparql.doQueries(iter(queries), concurrency=3)):
+            self.assertEqual(result["index"], i)
+            self.assertEqual(result["query"], queries[i])
+            self.assertEqual((result["status"], result["error"]), (200, None))
+            self.assertEqual(result["result"], makeResults(i%7))
+            count += 1
+        self.assertEqual(count, 40)
+        self.assertEqual(results.maximum, 3)
+        self.assertTrue(sparql.connectionPool().stats()["created"] <= 3)
+        return
+
+    def testQueriesUnordered(self):
+        results = ConcurrentResults()
+        sparql  = self.startServer(results)
+        queries = ["SELECT 1 0.5"] + [ "SELECT 2 0.01" ]*8 + ["Bad query"]
+        output  = list(sparql.doQueries(queries, ordered=False, post=True, columnar=True))
+        self.assertEqual(sorted([ r["index"] for r in output ]), range(10))
+        self.assertEqual(output[-1]["index"], 0)
+        self.assertEqual(output[-1]["result"].toJson(), makeResults(1))
+        failed = [ r for r in output if r["error"] ]
+        self.assertEqual([ r["index"] for r in failed ], [9])
+        self.assertEqual(failed[0]["status"], 400)
+        self.assertTrue(isinstance(failed[0]["error"], SparqlHttpError))
+        self.assertTrue(results.maximum > 1)
+        return
+
+    def testQueriesStopped(self):
+        results = ConcurrentResults()
+        sparql  = self.startServer(results)
+        queries = ( "SELECT 1 0.01" for i in range(1000) )
+        for result in sparql.doQueries(queries, concurrency=2):
+            break
+        self.assertTrue(len(list(queries)) > 990)
+        return
+
+# Assemble test suite
+
+def getTestSuite(select="unit"):
+    """
+    Get test suite
+
+    select  is one of the following:
+            "unit"      return suite of unit tests only
+            "component" return suite of unit and component tests
+            "all"       return suite of unit, component and integration tests
+            "pending"   return suite of pending tests
+            name        a single named test to be run
+    """
+    testdict = {
+        "unit":
+            [ "testJsonReader"
+            , "testJsonReaderIncremental"
+            , "testJsonReaderMemberOrder"
+            , "testJsonReaderAsk"
+            , "testJsonReaderMalformed"
+            , "testQueryStream"
+            , "testQueryStreamClosed"
+            , "testColumnarRoundTrip"
+            , "testColumnarRows"
+            , "testColumnarColumns"
+            , "testColumnarMemory"
+            , "testColumnarNumpy"
+            , "testColumnarDataFrame"
+            , "testQueryColumnar"
+            , "testSplitQuery"
+            , "testQueryPaged"
+            , "testQueryPagedLimit"
+            , "testQueryPagedKeyset"
+            , "testQueryPagedKeysetDataset"
+            , "testQueryPagedPrefetch"
+            , "testQueryPagedError"
+            , "testQueries"
+            , "testQueriesUnordered"
+            , "testQueriesStopped"
+            ],
+        "component":
+            [
+            ],
+        "integration":
+            [
+            ],
+        "pending":
+            [
+            ]
+        }
+    return TestUtils.getTestSuite(TestSparqlHttpClient, testdict, select=select)
+
+if __name__ == "__main__":
+    TestUtils.runTests("TestSparqlHttpClient.log", getTestSuite, sys.argv)
+
+# End.